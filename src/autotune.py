@@ -0,0 +1,199 @@
+"""
+Usage:
+
+# Search lane detection parameters on recorded drives, steering of the current parameters is the reference:
+python autotune.py ../data/tmp/car_video*.avi --samples 200 -j 4 --output ../data/lane_params.json
+
+# Score against golden steering traces written by replay.py instead, and keep settings within 2 degrees of them:
+python autotune.py ../data/tmp/car_video*.avi --golden ../data/golden --max-error 2 --output ../data/lane_params.json
+
+# Drive or replay with the tuned parameters:
+from image_preprocessing import load_lane_parameters
+load_lane_parameters("../data/lane_params.json")
+"""
+
+import os
+import json
+import argparse
+from multiprocessing import Pool
+import numpy as np
+from image_preprocessing import DEFAULT_LANE_PARAMS, reset_lane_parameters, set_lane_parameters
+from lane_navigation import LaneKeepAssistSystem
+from replay import load_frames, replay_frames, golden_trace_path
+
+# Values tried per parameter, random search samples combinations of them
+SEARCH_SPACE = {
+    "canny_low": [50, 100, 150, 200],
+    "canny_high": [150, 200, 300, 400],
+    "hough_rho": [1, 2],
+    "hough_theta_deg": [1.0, 2.0],
+    "hough_threshold": [6, 10, 15, 20],
+    "min_line_length": [4, 8, 12, 16],
+    "max_line_gap": [2, 4, 8],
+    "lane_boundary": [1 / 4, 1 / 3, 2 / 5],
+    "roi_top": [1 / 2, 0.55, 0.6],
+}
+
+# Set in every worker process by _init_worker()
+_videos = None
+
+
+def _init_worker(paths, max_frames):
+    global _videos
+    _videos = [load_frames(path, max_frames) for path in paths]
+
+
+def sample_parameters(samples, seed=0):
+    """
+    Draws distinct parameter sets from SEARCH_SPACE, always starting with the defaults
+    :param samples: Number of parameter sets
+    :param seed: Seed of the random search
+    :return: List of parameter dictionaries
+    """
+    rng = np.random.RandomState(seed)
+    candidates = [dict(DEFAULT_LANE_PARAMS)]
+    seen = {tuple(sorted(DEFAULT_LANE_PARAMS.items()))}
+
+    attempts = 0
+    while len(candidates) < samples and attempts < samples * 20:
+        attempts += 1
+        params = {name: values[rng.randint(len(values))] for name, values in SEARCH_SPACE.items()}
+        if params["canny_high"] <= params["canny_low"]:
+            continue
+
+        key = tuple(sorted(params.items()))
+        if key not in seen:
+            seen.add(key)
+            candidates.append(params)
+
+    return candidates
+
+
+def evaluate(params, references):
+    """
+    Replays every loaded video with a parameter set
+    :param params: Lane detection parameters
+    :param references: Reference steering trace of every video
+    :return: Dictionary with the parameters, mean and p95 per-frame latency (ms), mean absolute steering error and
+    the fraction of frames that steer differently from the reference
+    """
+    reset_lane_parameters()
+    set_lane_parameters(**params)
+
+    latencies = []
+    errors = []
+    for frames, reference in zip(_videos, references):
+        result = replay_frames(frames, LaneKeepAssistSystem(headless=True))
+        latencies.append(result.latencies)
+        frames_compared = min(len(reference), len(result.steering_angles))
+        errors.append(np.abs(result.steering_angles[:frames_compared].astype(np.int32) -
+                             reference[:frames_compared].astype(np.int32)))
+
+    latencies = np.concatenate(latencies) * 1000.0
+    errors = np.concatenate(errors)
+
+    return {
+        "params": params,
+        "latency_ms": float(latencies.mean()) if len(latencies) else 0.0,
+        "latency_p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else 0.0,
+        "steering_error": float(errors.mean()) if len(errors) else 0.0,
+        "mismatch_rate": float(np.count_nonzero(errors)) / len(errors) if len(errors) else 0.0,
+    }
+
+
+def _evaluate(args):
+    return evaluate(*args)
+
+
+def pareto_front(results):
+    """
+    :return: Results that no other result beats on both mean latency and steering error, fastest first
+    """
+    front = []
+    for result in sorted(results, key=lambda r: (r["latency_ms"], r["steering_error"])):
+        if not front or result["steering_error"] < front[-1]["steering_error"]:
+            front.append(result)
+
+    return front
+
+
+def choose(front, max_error):
+    """
+    :return: Fastest result of the front whose steering error is at most max_error, the most accurate one otherwise
+    """
+    acceptable = [result for result in front if result["steering_error"] <= max_error]
+    if acceptable:
+        return acceptable[0]
+
+    return min(front, key=lambda r: r["steering_error"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search lane detection parameters on recorded drives")
+    parser.add_argument("videos", nargs="+", help="Recordings written by Herbie")
+    parser.add_argument("--max-frames", type=int, default=300,
+                        help="Frames replayed per video. They are decoded into memory in every worker, about 230 KB "
+                             "per frame.")
+    parser.add_argument("--samples", type=int, default=100, help="Number of parameter sets to evaluate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--golden", type=str, default="",
+                        help="Directory of golden steering traces, the default parameters' steering otherwise")
+    parser.add_argument("--max-error", type=float, default=1.0,
+                        help="Largest mean steering error (degrees) of the chosen parameters")
+    parser.add_argument("--output", type=str, default="lane_params.json", help="Config file to write")
+    parser.add_argument("--pareto-csv", type=str, default="", help="Write the Pareto front as CSV")
+    args = parser.parse_args()
+
+    # References and the serial re-timing of the front run in this process
+    _init_worker(args.videos, args.max_frames)
+    if args.golden:
+        references = [np.load(golden_trace_path(args.golden, path))[:len(frames)]
+                      for path, frames in zip(args.videos, _videos)]
+    else:
+        reset_lane_parameters()
+        references = [replay_frames(frames, LaneKeepAssistSystem(headless=True)).steering_angles
+                      for frames in _videos]
+
+    candidates = sample_parameters(args.samples, args.seed)
+    print("Evaluating %d parameter sets on %d frames with %d workers" % (
+        len(candidates), sum(len(frames) for frames in _videos), args.workers))
+
+    tasks = [(params, references) for params in candidates]
+    with Pool(args.workers, initializer=_init_worker, initargs=(args.videos, args.max_frames)) as pool:
+        results = pool.map(_evaluate, tasks, chunksize=1)
+
+    # Workers compete for the CPU, so latencies of the front are measured again one at a time
+    front = pareto_front([evaluate(result["params"], references) for result in pareto_front(results)])
+    baseline = evaluate(dict(DEFAULT_LANE_PARAMS), references)
+    chosen = choose(front, args.max_error)
+
+    print("%10s %10s %10s %10s  %s" % ("mean ms", "p95 ms", "error", "mismatch", "params"))
+    for result in front:
+        print("%10.2f %10.2f %10.2f %9.1f%%  %s%s" % (
+            result["latency_ms"], result["latency_p95_ms"], result["steering_error"], result["mismatch_rate"] * 100,
+            json.dumps(result["params"], sort_keys=True), "  <- chosen" if result is chosen else ""))
+    print("Default parameters: %.2f ms mean, %.2f degrees error. Chosen: %.2f ms mean (%.0f%% of default), "
+          "%.2f degrees error" % (baseline["latency_ms"], baseline["steering_error"], chosen["latency_ms"],
+                                  chosen["latency_ms"] / baseline["latency_ms"] * 100 if baseline["latency_ms"] else 0,
+                                  chosen["steering_error"]))
+
+    with open(args.output, "w") as f:
+        json.dump({"params": chosen["params"],
+                   "score": {key: value for key, value in chosen.items() if key != "params"},
+                   "baseline": {key: value for key, value in baseline.items() if key != "params"},
+                   "videos": args.videos}, f, indent=2, sort_keys=True)
+    print("Wrote %s, load it with image_preprocessing.load_lane_parameters()" % args.output)
+
+    if args.pareto_csv:
+        names = sorted(DEFAULT_LANE_PARAMS)
+        with open(args.pareto_csv, "w") as f:
+            f.write(",".join(["latency_ms", "latency_p95_ms", "steering_error", "mismatch_rate"] + names) + "\n")
+            for result in front:
+                f.write(",".join("%g" % value for value in
+                                 [result["latency_ms"], result["latency_p95_ms"], result["steering_error"],
+                                  result["mismatch_rate"]] + [result["params"][name] for name in names]) + "\n")
+
+
+if __name__ == "__main__":
+    main()
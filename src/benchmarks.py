@@ -0,0 +1,510 @@
+"""
+Usage:
+
+# Compare the vectorized generate_lanes() against the original per-segment loop:
+python benchmarks.py generate_lanes --counts 10 100 500 1000 --video ../data/tmp/car_video.avi
+
+# Compare the allocation-free DL LKAS preprocessing against DeepLearningLKAS.preprocess_image():
+python benchmarks.py preprocess
+
+# Validate the colour lookup table lane mask against cvtColor(HSV) + inRange and time both on 320x240 frames:
+python benchmarks.py color_lut --bits 8 6 5 --video ../data/tmp/car_video.avi
+
+# Check that cropping to the region of interest before edge detection finds the same lane edges as the full frame:
+python benchmarks.py roi_crop --video ../data/tmp/car_video.avi
+
+# Compare the parallel LKAS training pipeline against the notebook's generate_images() in images/sec:
+python benchmarks.py data_pipeline ../data/training_images --workers 1 2 4
+
+# Cold start of every lane keeping backend, each in a fresh process: time to the first steering decision and peak RSS:
+python benchmarks.py startup --model ../ml_models/DL_LKAS_FINAL.h5
+
+# Cost of one flight recorder record against one line of text logging:
+python benchmarks.py flight_recorder
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import random
+import time
+import timeit
+import tracemalloc
+import logging
+import tempfile
+import warnings
+import cv2
+import numpy as np
+from image_preprocessing import generate_endpoints, generate_lanes, LANE_COLOR_LOWER, LANE_COLOR_UPPER, \
+    crop_region_of_interest, locate_edges, isolate_lane_edges, locate_lane_segments
+from color_lut import ColorLUT, hsv_mask
+from frame_preprocessor import FramePreprocessor
+from lkas_data_pipeline import BatchPipeline, list_training_images
+from lkas_backends import BACKENDS
+from flight_recorder import FlightRecorder, read_flight_record
+
+
+def reference_generate_lanes(image, segments):
+    """
+    Original per-segment implementation of image_preprocessing.generate_lanes(), kept as the baseline that the
+    vectorized version is validated and timed against.
+    """
+    lanes = []
+
+    if segments is None:
+        return lanes
+
+    h, w, _ = image.shape
+
+    right_lane_segments = []
+    left_lane_segments = []
+
+    boundary = 1/3
+
+    left_lane_boundary = w * (1 - boundary)
+    right_lane_boundary = w * boundary
+
+    for i in segments:
+
+        for x0, y0, x1, y1 in i:
+
+            if x0 == x1:
+                continue
+
+            poly_fit = np.polyfit((x0, x1), (y0, y1), 1)
+            mx = poly_fit[0]
+            b = poly_fit[1]
+
+            if mx < 0:
+                if x0 < left_lane_boundary and x1 < left_lane_boundary:
+                    left_lane_segments.append((mx, b))
+            else:
+                if x0 > right_lane_boundary and x1 > right_lane_boundary:
+                    right_lane_segments.append((mx, b))
+
+    left_lane_avg = np.average(left_lane_segments, axis=0)
+    if len(left_lane_segments) > 0:
+        lanes.append(generate_endpoints(image, left_lane_avg))
+    right_lane_avg = np.average(right_lane_segments, axis=0)
+    if len(right_lane_segments) > 0:
+        lanes.append(generate_endpoints(image, right_lane_avg))
+
+    return lanes
+
+
+def random_segments(count, width=320, height=240, seed=0):
+    """
+    Generates HoughLinesP-like segments in the bottom half of a frame
+    :param count: Number of segments
+    :return: (count, 1, 4) int32 array
+    """
+    rng = np.random.RandomState(seed)
+    x = rng.randint(0, width, size=(count, 2))
+    y = rng.randint(height // 2, height, size=(count, 2))
+
+    return np.stack([x[:, 0], y[:, 0], x[:, 1], y[:, 1]], axis=1).reshape(count, 1, 4).astype(np.int32)
+
+
+def horizontal_segments(segments, every=4):
+    """
+    :return: Copy of segments with every `every`-th segment made horizontal (y1 = y0)
+    """
+    segments = segments.copy()
+    segments[::every, 0, 3] = segments[::every, 0, 1]
+
+    return segments
+
+
+def recorded_segments(video, max_frames=1000):
+    """
+    :return: Line segments detected on every frame of a recording, None for frames without segments
+    """
+    segments = []
+    video_stream = cv2.VideoCapture(video)
+    while len(segments) < max_frames:
+        grabbed, frame = video_stream.read()
+        if not grabbed:
+            break
+        segments.append((frame, locate_lane_segments(frame)))
+    video_stream.release()
+
+    return segments
+
+
+def count_mismatches(cases):
+    """
+    :param cases: (image, segments) pairs
+    :return: Number of cases where generate_lanes() and the reference return different lanes
+    """
+    mismatches = 0
+    for image, segments in cases:
+        with warnings.catch_warnings():
+            # The reference averages an empty lane before checking that it has segments
+            warnings.simplefilter("ignore", RuntimeWarning)
+            expected = reference_generate_lanes(image, segments)
+        mismatches += generate_lanes(image, segments) != expected
+
+    return mismatches
+
+
+def benchmark_generate_lanes(counts, repeat=200, video=None):
+    """
+    Times the vectorized and the reference generate_lanes() for several segment counts and checks that they return
+    the same lanes, on random segments, random segments with every fourth one horizontal and, when given, the segments
+    detected on a recording
+    :param counts: Segment counts to benchmark
+    :param repeat: Number of calls timed per implementation
+    :param video: Recording to check on
+    """
+    image = np.zeros((240, 320, 3), np.uint8)
+
+    print("%8s %14s %14s %9s %7s" % ("segments", "loop (us)", "vector (us)", "speedup", "match"))
+    for count in counts:
+        segments = random_segments(count)
+        cases = [(image, random_segments(count, seed=seed)) for seed in range(20)]
+        cases += [(image, horizontal_segments(segments)) for image, segments in cases]
+        match = count_mismatches(cases) == 0
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            loop = timeit.timeit(lambda: reference_generate_lanes(image, segments), number=repeat) / repeat
+        vector = timeit.timeit(lambda: generate_lanes(image, segments), number=repeat) / repeat
+
+        print("%8d %14.1f %14.1f %8.1fx %7s" % (count, loop * 1e6, vector * 1e6, loop / vector, match))
+
+    if video:
+        cases = recorded_segments(video)
+        print("%s: lanes differ on %d of %d frames" % (video, count_mismatches(cases), len(cases)))
+
+
+def reference_preprocess_image(frame):
+    """
+    DeepLearningLKAS.preprocess_image(), the baseline FramePreprocessor is validated and timed against
+    """
+    h, _, _ = frame.shape
+    frame = frame[int(h/2):, :, :]
+    frame = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV)
+    frame = cv2.GaussianBlur(frame, (3, 3), 0)
+    frame = cv2.resize(frame, (200, 66))
+    frame = frame / 255
+
+    return frame
+
+
+def allocated_bytes(function):
+    """
+    :return: Peak number of bytes allocated through Python/NumPy during one call
+    """
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return peak
+
+
+def benchmark_preprocess(repeat=1000, width=320, height=240):
+    """
+    Times DeepLearningLKAS.preprocess_image() (plus the batch wrapping done by predict_steering_angle) against
+    FramePreprocessor writing into a reused float32 input batch, and checks that both produce the same values
+    """
+    frame = np.random.RandomState(0).randint(0, 256, (height, width, 3)).astype(np.uint8)
+    preprocessor = FramePreprocessor()
+    input_batch = np.zeros((1, 66, 200, 3), np.float32)
+
+    def reference():
+        return np.asarray([reference_preprocess_image(frame)])
+
+    def engine():
+        return preprocessor.process(frame, out=input_batch[0])
+
+    engine()
+    max_error = np.abs(reference()[0] - input_batch[0]).max()
+
+    reference_time = timeit.timeit(reference, number=repeat) / repeat
+    engine_time = timeit.timeit(engine, number=repeat) / repeat
+
+    print("%-20s %12s %16s" % ("", "time (us)", "allocated (KB)"))
+    print("%-20s %12.1f %16.1f" % ("preprocess_image", reference_time * 1e6, allocated_bytes(reference) / 1024))
+    print("%-20s %12.1f %16.1f" % ("FramePreprocessor", engine_time * 1e6, allocated_bytes(engine) / 1024))
+    print("Speedup: %.2fx, max abs difference: %.3g" % (reference_time / engine_time, max_error))
+
+
+def benchmark_color_lut(bits_options, repeat=500, video=None, max_frames=200, width=320, height=240):
+    """
+    Checks the ColorLUT lane mask against the HSV mask pixel by pixel and times both per frame. Frames come from a
+    recording when given, otherwise from uniformly random colours, which covers the whole colour space.
+    """
+    frames = read_frames(video, max_frames, width, height)
+    if not frames:
+        rng = np.random.RandomState(0)
+        frames = [rng.randint(0, 256, (height, width, 3)).astype(np.uint8) for _ in range(20)]
+
+    references = [hsv_mask(frame, LANE_COLOR_LOWER, LANE_COLOR_UPPER) for frame in frames]
+    hsv_time = timeit.timeit(lambda: hsv_mask(frames[0], LANE_COLOR_LOWER, LANE_COLOR_UPPER), number=repeat) / repeat
+
+    print("%d frames of %dx%d, HSV range %s-%s" % (len(frames), width, height, LANE_COLOR_LOWER, LANE_COLOR_UPPER))
+    print("%-16s %10s %12s %10s %9s %14s" % ("", "table KB", "build (ms)", "time (us)", "speedup", "mismatch (%)"))
+    print("%-16s %10s %12s %10.1f %9s %14s" % ("cvtColor+inRange", "-", "-", hsv_time * 1e6, "-", "-"))
+    for bits in bits_options:
+        start = time.perf_counter()
+        lut = ColorLUT(LANE_COLOR_LOWER, LANE_COLOR_UPPER, bits)
+        build_time = time.perf_counter() - start
+
+        mismatches = sum(np.count_nonzero(lut.apply(frame) != reference) for frame, reference in zip(frames, references))
+        mismatch = mismatches / float(len(frames) * width * height)
+        lut_time = timeit.timeit(lambda: lut.apply(frames[0]), number=repeat) / repeat
+
+        print("%-16s %10.0f %12.1f %10.1f %8.2fx %14.4f" % ("ColorLUT %d bits" % bits, lut.table.nbytes / 1024,
+                                                              build_time * 1000, lut_time * 1e6, hsv_time / lut_time,
+                                                              mismatch * 100))
+
+
+def read_frames(video, max_frames, width, height):
+    """
+    :return: Up to max_frames frames of a recording resized to width x height, an empty list without a recording
+    """
+    frames = []
+    if video:
+        video_stream = cv2.VideoCapture(video)
+        while len(frames) < max_frames:
+            grabbed, frame = video_stream.read()
+            if not grabbed:
+                break
+            frames.append(cv2.resize(frame, (width, height)))
+        video_stream.release()
+
+    return frames
+
+
+def benchmark_roi_crop(video=None, max_frames=500, repeat=200, width=320, height=240):
+    """
+    Compares the lane edges found on the region of interest crop (as locate_lane_segments() does) with the edges found
+    on the full frame and masked afterwards, pixel by pixel, and times both. Equal edges give the Hough transform the
+    same input, so the crop does not change the detected lanes. Canny's hysteresis can follow weak edges across the
+    crop's top edge, so the crop is only exact when no edge chain crosses the rows above the margin. Frames come from
+    a recording when given, otherwise from random colour blocks.
+    """
+    frames = read_frames(video, max_frames, width, height)
+    if not frames:
+        rng = np.random.RandomState(0)
+        frames = [cv2.resize(rng.randint(0, 256, (height // 8, width // 8, 3)).astype(np.uint8), (width, height),
+                             interpolation=cv2.INTER_NEAREST) for _ in range(50)]
+
+    def full(frame):
+        return isolate_lane_edges(locate_edges(frame))
+
+    def cropped(frame):
+        roi, y_offset = crop_region_of_interest(frame)
+        return isolate_lane_edges(locate_edges(roi), y_offset), y_offset
+
+    mismatched_frames = mismatched_pixels = edge_pixels = 0
+    for frame in frames:
+        expected = full(frame)
+        actual, y_offset = cropped(frame)
+        mismatches = np.count_nonzero(expected != actual)
+        mismatched_frames += mismatches > 0
+        mismatched_pixels += mismatches
+        edge_pixels += np.count_nonzero(expected)
+
+    full_time = timeit.timeit(lambda: full(frames[0]), number=repeat) / repeat
+    cropped_time = timeit.timeit(lambda: cropped(frames[0]), number=repeat) / repeat
+
+    print("%d frames of %dx%d, region of interest from row %d" % (len(frames), width, height, y_offset))
+    print("Full frame: %.1f us, cropped: %.1f us, speedup %.2fx" % (full_time * 1e6, cropped_time * 1e6,
+                                                                    full_time / cropped_time))
+    print("Edges differ on %d of %d frames, %d of %d edge pixels" % (mismatched_frames, len(frames),
+                                                                     mismatched_pixels, edge_pixels))
+
+    return mismatched_frames == 0
+
+
+def reference_generate_images(X, y, batch_size, perform_aug):
+    """
+    generate_images() and ImageTransformer.randomly_augment_img() of DeepLearningLKAS.ipynb, the baseline the
+    training pipeline is timed against
+    """
+    from imgaug import augmenters
+
+    while True:
+        batch_imgs = []
+        batch_labels = []
+
+        for i in range(batch_size):
+            index = random.randint(0, len(X) - 1)
+            img = cv2.cvtColor(cv2.imread(X[index]), cv2.COLOR_BGR2RGB)
+            steering_angle = y[index]
+
+            if perform_aug:
+                if np.random.rand() < 0.5:
+                    img = augmenters.Affine(translate_percent={"x": (-0.1, 0.1), "y": (-0.1, 0.1)}).augment_image(img)
+                if np.random.rand() < 0.5:
+                    img = augmenters.Affine(scale=(1, 1.3)).augment_image(img)
+                if np.random.rand() < 0.5:
+                    kernel = random.randint(1, 5)
+                    img = cv2.blur(img, (kernel, kernel))
+                if np.random.rand() < 0.5:
+                    img = augmenters.Multiply((0.7, 1.3)).augment_image(img)
+                if random.randint(0, 1) == 1:
+                    img = cv2.flip(img, 1)
+                    steering_angle = 180 - steering_angle
+
+            h, _, _ = img.shape
+            img = img[int(h/2):, :, :]
+            img = cv2.cvtColor(img, cv2.COLOR_RGB2YUV)
+            img = cv2.GaussianBlur(img, (3, 3), 0)
+            img = cv2.resize(img, (200, 66))
+            img = img / 255
+
+            batch_imgs.append(img)
+            batch_labels.append(steering_angle)
+
+        yield np.asarray(batch_imgs), np.asarray(batch_labels)
+
+
+def images_per_second(batches, count, batch_size):
+    """
+    :return: Images per second drawn from an iterator of batches, after one warm-up batch
+    """
+    next(batches)
+    start = time.perf_counter()
+    for _ in range(count):
+        next(batches)
+
+    return count * batch_size / (time.perf_counter() - start)
+
+
+def benchmark_data_pipeline(directory, workers, batches=20, batch_size=100, augment=True):
+    """
+    Measures training input throughput of the notebook's generator against BatchPipeline with several worker counts
+    """
+    paths, angles = list_training_images(directory)
+    print("%d training images, %d batches of %d, augment=%s" % (len(paths), batches, batch_size, augment))
+    print("%-24s %12s" % ("", "images/sec"))
+
+    try:
+        reference = images_per_second(reference_generate_images(paths, angles, batch_size, augment), batches,
+                                      batch_size)
+        print("%-24s %12.1f" % ("generate_images", reference))
+    except ImportError:
+        print("%-24s %12s" % ("generate_images", "needs imgaug"))
+
+    for count in workers:
+        with BatchPipeline(paths, angles, batch_size, augment, workers=count) as pipeline:
+            print("%-24s %12.1f" % ("BatchPipeline (%d workers)" % count,
+                                    images_per_second(pipeline, batches, batch_size)))
+
+
+def benchmark_startup(backends, model=None):
+    """
+    Measures the cold start of every backend in its own Python process, so imports and models are never cached
+    """
+    print("%-16s %10s %12s %12s %10s" % ("backend", "load s", "1st steer s", "total s", "peak MB"))
+    for name in backends:
+        command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "lkas_backends.py"),
+                   "--measure", name]
+        if model:
+            command += ["--model", model]
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0:
+            print("%-16s failed: %s" % (name, process.stderr.strip().splitlines()[-1] if process.stderr.strip() else ""))
+            continue
+
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        print("%-16s %10.2f %12.3f %12.2f %10.0f" % (name, result["load_seconds"], result["first_steer_seconds"],
+                                                     result["time_to_first_steer_seconds"], result["peak_rss_mb"]))
+
+
+def benchmark_flight_recorder(repeat=20000):
+    """
+    Times FlightRecorder.append() against formatting and writing the same telemetry as one log line
+    """
+    lanes = [np.array([[40, 240, 120, 120]]), np.array([[280, 240, 200, 120]])]
+    directory = tempfile.mkdtemp()
+    recorder = FlightRecorder(os.path.join(directory, "flight.bin"), capacity=repeat // 2)
+
+    logger = logging.getLogger("benchmark_flight_recorder")
+    logger.propagate = False
+    logger.addHandler(logging.FileHandler(os.path.join(directory, "flight.log")))
+    logger.setLevel(logging.INFO)
+
+    def record():
+        recorder.append(time.perf_counter(), 92, 97, lanes, 0.012, 1.0)
+
+    def log():
+        logger.info("frame %.6f steer %d raw %d lanes %d %s detection %.2f ms scale %.2f" % (
+            time.perf_counter(), 92, 97, len(lanes), [lane[0].tolist() for lane in lanes], 12.0, 1.0))
+
+    record_time = timeit.timeit(record, number=repeat) / repeat
+    log_time = timeit.timeit(log, number=repeat) / repeat
+    recorder.close()
+    records = read_flight_record(recorder.path)
+
+    print("%-20s %12s" % ("", "time (us)"))
+    print("%-20s %12.2f" % ("FlightRecorder", record_time * 1e6))
+    print("%-20s %12.2f" % ("logging", log_time * 1e6))
+    print("Read back %d of %d records (ring of %d), last seq %d" % (
+        len(records), repeat, recorder.capacity, records["seq"][-1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Herbie micro-benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark")
+
+    lanes_parser = subparsers.add_parser("generate_lanes", help="Vectorized vs. loop segment classification")
+    lanes_parser.add_argument("--counts", type=int, nargs="+", default=[10, 50, 100, 250, 500, 1000])
+    lanes_parser.add_argument("--repeat", type=int, default=200)
+    lanes_parser.add_argument("--video", type=str, default=None, help="Also check the segments of a recording")
+
+    preprocess_parser = subparsers.add_parser("preprocess", help="Allocation-free DL LKAS preprocessing")
+    preprocess_parser.add_argument("--repeat", type=int, default=1000)
+
+    lut_parser = subparsers.add_parser("color_lut", help="Lookup table vs. HSV lane colour mask")
+    lut_parser.add_argument("--bits", type=int, nargs="+", default=[8, 7, 6, 5])
+    lut_parser.add_argument("--repeat", type=int, default=500)
+    lut_parser.add_argument("--video", type=str, default=None, help="Recording to validate on instead of random colours")
+
+    roi_parser = subparsers.add_parser("roi_crop", help="Region of interest crop vs. full frame edge detection")
+    roi_parser.add_argument("--video", type=str, default=None, help="Recording to check instead of random colours")
+    roi_parser.add_argument("--max-frames", type=int, default=500)
+    roi_parser.add_argument("--repeat", type=int, default=200)
+
+    pipeline_parser = subparsers.add_parser("data_pipeline", help="DL LKAS training input throughput")
+    pipeline_parser.add_argument("directory", help="Directory holding the training .png frames")
+    pipeline_parser.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, 4])
+    pipeline_parser.add_argument("--batches", type=int, default=20)
+    pipeline_parser.add_argument("--batch-size", type=int, default=100)
+    pipeline_parser.add_argument("--no-augment", action="store_true")
+
+    startup_parser = subparsers.add_parser("startup", help="Lane keeping backend cold start")
+    startup_parser.add_argument("--backends", type=str, nargs="+", default=sorted(BACKENDS), choices=sorted(BACKENDS))
+    startup_parser.add_argument("--model", type=str, default=None, help="Keras .h5 model of the Deep Learning backends")
+
+    recorder_parser = subparsers.add_parser("flight_recorder", help="Telemetry record vs. text log line")
+    recorder_parser.add_argument("--repeat", type=int, default=20000)
+
+    args = parser.parse_args()
+
+    if args.benchmark == "generate_lanes":
+        benchmark_generate_lanes(args.counts, args.repeat, args.video)
+    elif args.benchmark == "preprocess":
+        benchmark_preprocess(args.repeat)
+    elif args.benchmark == "color_lut":
+        benchmark_color_lut(args.bits, args.repeat, args.video)
+    elif args.benchmark == "roi_crop":
+        if not benchmark_roi_crop(args.video, args.max_frames, args.repeat):
+            sys.exit(1)
+    elif args.benchmark == "data_pipeline":
+        benchmark_data_pipeline(args.directory, args.workers, args.batches, args.batch_size, not args.no_augment)
+    elif args.benchmark == "startup":
+        benchmark_startup(args.backends, args.model)
+    elif args.benchmark == "flight_recorder":
+        benchmark_flight_recorder(args.repeat)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
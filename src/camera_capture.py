@@ -0,0 +1,174 @@
+# !/usr/bin/env python
+# title           :camera_capture.py
+# description     :Threaded PiCamera capture that keeps the newest frames in a preallocated ring buffer
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+
+
+class CameraCapture(object):
+    """
+    Reads frames from the PiCamera on a background thread so the control loop never waits on camera I/O.
+    Frames are decoded straight into a small preallocated ring buffer and the control loop is always handed the
+    newest frame. Frames that are overwritten before the control loop reads them are counted as dropped.
+    """
+
+    def __init__(self, device=-1, width=320, height=240, buffer_size=3):
+        """
+        Constructor
+        :param device: Camera device index passed to cv2.VideoCapture
+        :param width: Capture width
+        :param height: Capture height
+        :param buffer_size: Number of ring buffer slots (at least 3: one being written, one published, one read)
+        """
+        logging.debug('Configuring Camera Capture')
+        self.camera = cv2.VideoCapture(device)
+        self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+        self.frames = [np.zeros((height, width, 3), np.uint8) for _ in range(max(3, buffer_size))]
+        self.timestamps = [0.0] * len(self.frames)
+
+        self.frames_captured = 0
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.frame_timestamp = 0.0
+
+        self._lock = threading.Condition()
+        self._latest_slot = None
+        self._reading_slot = None
+        self._latest_seq = 0
+        self._read_seq = 0
+        self._running = False
+        self._thread = None
+        self._start_time = None
+
+    def start(self):
+        """
+        Starts the capture thread
+        :return: Self, so the capture can be started inline
+        """
+        if self._running:
+            return self
+
+        self._running = True
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._update, name='CameraCapture', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def is_opened(self):
+        """
+        :return: True while the camera is open and the capture thread is running
+        """
+        return self._running and self.camera.isOpened()
+
+    def read(self, timeout=1.0):
+        """
+        Hands out the newest captured frame. The returned array is a ring buffer slot that stays untouched by the
+        capture thread until the next call to read(), so copy it if it has to outlive the current iteration.
+        :param timeout: Seconds to wait for a frame newer than the previously read one
+        :return: (success, frame) like cv2.VideoCapture.read()
+        """
+        with self._lock:
+            if not self._lock.wait_for(lambda: self._latest_seq > self._read_seq or not self._running, timeout):
+                return False, None
+
+            if self._latest_seq <= self._read_seq:
+                return False, None
+
+            self._reading_slot = self._latest_slot
+            self._read_seq = self._latest_seq
+            self.frame_timestamp = self.timestamps[self._reading_slot]
+            self.frames_read += 1
+
+            return True, self.frames[self._reading_slot]
+
+    def _next_write_slot(self):
+        """
+        Picks a slot that is neither published nor handed out to the control loop
+        """
+        for slot in range(len(self.frames)):
+            if slot != self._latest_slot and slot != self._reading_slot:
+                return slot
+
+    def _update(self):
+        """
+        Capture thread: decode frames into the ring buffer and publish the newest one
+        """
+        while self._running:
+            with self._lock:
+                slot = self._next_write_slot()
+
+            grabbed, frame = self.camera.read(self.frames[slot])
+
+            if not grabbed:
+                logging.error('Camera Capture failed to read a frame, stopping capture')
+                break
+
+            # OpenCV reallocates when the camera ignores the requested resolution
+            if frame is not self.frames[slot]:
+                self.frames[slot] = frame
+
+            with self._lock:
+                # The previously published frame was never handed to the control loop
+                if self._latest_seq > self._read_seq:
+                    self.frames_dropped += 1
+
+                self.timestamps[slot] = time.perf_counter()
+                self._latest_slot = slot
+                self._latest_seq += 1
+                self.frames_captured += 1
+                self._lock.notify_all()
+
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+
+    def stats(self):
+        """
+        Capture statistics
+        :return: Dictionary with frame counters along with capture and processing FPS since start()
+        """
+        elapsed = time.perf_counter() - self._start_time if self._start_time is not None else 0.0
+
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_read': self.frames_read,
+            'frames_dropped': self.frames_dropped,
+            'capture_fps': self.frames_captured / elapsed if elapsed > 0 else 0.0,
+            'processing_fps': self.frames_read / elapsed if elapsed > 0 else 0.0,
+        }
+
+    def log_stats(self):
+        """
+        Logs capture FPS against processing FPS
+        """
+        stats = self.stats()
+        logging.info('Capture FPS: %.1f, Processing FPS: %.1f, Frames Dropped: %d/%d' % (
+            stats['capture_fps'], stats['processing_fps'], stats['frames_dropped'], stats['frames_captured']))
+
+    def release(self):
+        """
+        Stops the capture thread and releases the camera
+        """
+        with self._lock:
+            self._running = False
+            self._lock.notify_all()
+
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+        self.camera.release()
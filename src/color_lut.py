@@ -0,0 +1,103 @@
+# !/usr/bin/env python
+# title           :color_lut.py
+# description     :Lookup-table colour segmentation, an experimental alternative to cvtColor(HSV) + inRange
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Not used by the lane pipeline, it is slower than cvtColor + inRange (python benchmarks.py color_lut)
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import cv2
+import numpy as np
+
+
+def hsv_mask(image, lower, upper):
+    """
+    Reference colour mask: convert to HSV and threshold, as image_preprocessing.locate_edges() does
+    """
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    return cv2.inRange(hsv, np.array(lower), np.array(upper))
+
+
+class ColorLUT(object):
+    """
+    Precomputed BGR -> mask table for an HSV threshold. Every BGR colour is classified once when the table is built,
+    after which a frame's mask is one per-channel cv2.LUT pass that builds each pixel's table index plus one gather.
+
+    With bits=8 the table covers all 2^24 colours (16 MB) and the mask equals the HSV mask exactly. Fewer bits
+    quantize each channel to its top `bits` bits, e.g. bits=6 gives a 256 KB table that stays in the Raspberry Pi's
+    L2 cache. Each quantized cell holds the majority vote of the colours it covers, so a few pixels near the
+    threshold boundary can differ from the HSV mask.
+
+    Building the per-pixel index and gathering from the table takes several full-frame passes in NumPy. On 320x240
+    frames this is about 4x slower than cvtColor + inRange at any table size, so locate_edges() keeps the HSV mask.
+    """
+
+    def __init__(self, lower, upper, bits=8):
+        """
+        Constructor
+        :param lower: Lower HSV bound of cv2.inRange()
+        :param upper: Upper HSV bound of cv2.inRange()
+        :param bits: Bits kept per channel, 1-8
+        """
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be between 1 and 8, got %d" % bits)
+
+        self.lower = tuple(lower)
+        self.upper = tuple(upper)
+        self.bits = bits
+        shift = 8 - bits
+
+        # Index contribution of every channel value, B in the high bits and R in the low bits
+        values = np.arange(256, dtype=np.int32) >> shift
+        self.channel_table = np.stack([values << (2 * bits), values << bits, values], axis=1).reshape(1, 256, 3)
+        self.table = self._build_table(shift)
+
+        self._contributions = None
+        self._index = None
+        self._mask = None
+
+    def _build_table(self, shift):
+        """
+        Classifies every BGR colour one B plane (256 x 256 colours) at a time and votes per quantized cell
+        """
+        cells = 256 >> shift
+        votes = np.zeros((cells, cells, cells), np.uint32)
+        plane = np.empty((256, 256, 3), np.uint8)
+        plane[:, :, 1] = np.arange(256, dtype=np.uint8).reshape(256, 1)
+        plane[:, :, 2] = np.arange(256, dtype=np.uint8).reshape(1, 256)
+
+        for b in range(256):
+            plane[:, :, 0] = b
+            mask = hsv_mask(plane, self.lower, self.upper) > 0
+            votes[b >> shift] += mask.reshape(cells, 1 << shift, cells, 1 << shift).sum(axis=(1, 3), dtype=np.uint32)
+
+        covered = 1 << (3 * shift)
+        return np.where(votes * 2 >= covered, 255, 0).astype(np.uint8).reshape(-1)
+
+    def apply(self, image, out=None):
+        """
+        Computes the colour mask of a BGR image
+        :param image: BGR image, may be a view such as a region-of-interest crop
+        :param out: Optional uint8 array of the image's height and width to write the mask to
+        :return: Mask, 255 where the colour is within the threshold. Without `out` this is an internal buffer that is
+        overwritten by the next call.
+        """
+        h, w, _ = image.shape
+        if self._index is None or self._index.shape != (h, w):
+            self._contributions = np.empty((h, w, 3), np.int32)
+            self._index = np.empty((h, w), np.int32)
+            self._mask = np.empty((h, w), np.uint8)
+
+        contributions = cv2.LUT(image, self.channel_table, dst=self._contributions)
+        np.add(contributions[:, :, 0], contributions[:, :, 1], out=self._index)
+        np.add(self._index, contributions[:, :, 2], out=self._index)
+
+        if out is None:
+            out = self._mask
+        np.take(self.table, self._index, out=out)
+
+        return out
@@ -0,0 +1,177 @@
+# !/usr/bin/env python
+# title           :control_scheduler.py
+# description     :Deadline-aware scheduler for Herbie's drive loop
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import logging
+import time
+from latency_profiler import LatencyProfiler
+
+
+class ControlLoopScheduler(object):
+    """
+    Paces the drive loop at a target control rate and bounds the frame-to-steer latency. Frames that cannot be
+    steered on before their deadline are skipped, and non-critical tasks (recording, overlays, display) only run when
+    their estimated cost fits in what is left of the tick. Tasks are expected to be offered in priority order, so the
+    last ones are shed first under load.
+    """
+
+    def __init__(self, target_hz=20.0, deadline=0.1, smoothing=0.2):
+        """
+        Constructor
+        :param target_hz: Target control rate
+        :param deadline: Maximum age (seconds) of a frame when the car is steered from it
+        :param smoothing: Weight of the newest sample in the moving average of task costs
+        """
+        self.period = 1.0 / target_hz
+        self.deadline = deadline
+        self.smoothing = smoothing
+
+        self.costs = {}
+        self.runs = {}
+        self.shed = {}
+        self.ticks = 0
+        self.stale_frames = 0
+        self.deadline_misses = 0
+        self.profiler = LatencyProfiler("control_loop")
+        self.profiler.enable()
+
+        self._next_tick = None
+        self._tick_start = 0.0
+        self._last_steer = None
+
+    def wait_for_tick(self):
+        """
+        Sleeps until the next tick of the control rate and records how late the tick started (jitter)
+        """
+        now = time.perf_counter()
+        if self._next_tick is None:
+            self._next_tick = now
+
+        if self._next_tick > now:
+            time.sleep(self._next_tick - now)
+            now = time.perf_counter()
+
+        self.profiler.record("jitter", now - self._next_tick)
+        # Do not try to catch up on missed ticks with a burst of back-to-back iterations
+        self._next_tick = max(self._next_tick + self.period, now)
+        self._tick_start = now
+        self.ticks += 1
+
+    def is_stale(self, frame_timestamp):
+        """
+        Decides whether a frame should be skipped because steering on it would miss its deadline. A frame is never
+        skipped when the car has not been steered for longer than the deadline, steering late beats not steering.
+        :param frame_timestamp: time.perf_counter() timestamp of the frame capture
+        :return: True when the frame should be dropped
+        """
+        now = time.perf_counter()
+        if self._last_steer is None or now - self._last_steer > self.deadline:
+            return False
+
+        cost = self.costs.get("steer", 0.0)
+        if now - frame_timestamp + cost > self.deadline:
+            self.stale_frames += 1
+            # Decay the estimate so one slow steer does not keep every following frame stale
+            self.costs["steer"] = cost * (1 - self.smoothing)
+            return True
+
+        return False
+
+    def run(self, name, task, *args):
+        """
+        Runs a task and updates its cost estimate. The first run of a task is a warm-up (first inference, table
+        builds) and is profiled but left out of the estimate.
+        :param name: Task name
+        :param task: Callable
+        :return: Result of the task
+        """
+        start = time.perf_counter()
+        result = task(*args)
+        cost = time.perf_counter() - start
+
+        runs = self.runs.get(name, 0)
+        self.runs[name] = runs + 1
+        if runs == 1:
+            self.costs[name] = cost
+        elif runs > 1:
+            self.costs[name] = self.costs[name] * (1 - self.smoothing) + cost * self.smoothing
+        self.profiler.record(name, cost)
+
+        return result
+
+    def run_optional(self, name, task, *args):
+        """
+        Runs a non-critical task if its estimated cost fits in the rest of the tick
+        :param name: Task name
+        :param task: Callable
+        :return: Result of the task, None when it was shed
+        """
+        remaining = self._tick_start + self.period - time.perf_counter()
+        cost = self.costs.get(name, 0.0)
+
+        if cost > remaining:
+            self.shed[name] = self.shed.get(name, 0) + 1
+            # Decay the estimate so a task shed after one slow run gets retried
+            self.costs[name] = cost * (1 - self.smoothing)
+            return None
+
+        return self.run(name, task, *args)
+
+    def mark_steered(self, frame_timestamp):
+        """
+        Records the age of the frame the car was just steered from
+        :param frame_timestamp: time.perf_counter() timestamp of the frame capture
+        """
+        self._last_steer = time.perf_counter()
+        age = self._last_steer - frame_timestamp
+        self.profiler.record("frame_age", age)
+
+        if age > self.deadline:
+            self.deadline_misses += 1
+
+    def end_tick(self):
+        """
+        Records the duration of the tick
+        """
+        self.profiler.record("tick", time.perf_counter() - self._tick_start)
+
+    def skip_tick(self):
+        """
+        Ends a tick whose frame was not steered on (stale or not read). The next tick starts right away instead of a
+        period later: reading the camera already waits for a newer frame.
+        """
+        self.end_tick()
+        self._next_tick = time.perf_counter()
+
+    def stats(self):
+        """
+        :return: Dictionary with tick, stale frame, deadline miss and shed task counters along with the latency summary
+        (frame_age, jitter, tick and per-task costs)
+        """
+        return {
+            "ticks": self.ticks,
+            "stale_frames": self.stale_frames,
+            "deadline_misses": self.deadline_misses,
+            "shed": dict(self.shed),
+            "latency": self.profiler.summary(),
+        }
+
+    def log_stats(self):
+        """
+        Logs deadline misses, frame age at steering time and jitter
+        """
+        latency = self.profiler.summary()
+        frame_age = latency.get("frame_age", {})
+        jitter = latency.get("jitter", {})
+        logging.info("Ticks: %d, Stale Frames: %d, Deadline Misses: %d, Shed: %s, Frame Age p50/p99: %.1f/%.1f ms, "
+                     "Jitter p99: %.1f ms" % (self.ticks, self.stale_frames, self.deadline_misses, self.shed,
+                                              frame_age.get("p50_ms", 0.0), frame_age.get("p99_ms", 0.0),
+                                              jitter.get("p99_ms", 0.0)))
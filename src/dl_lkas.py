@@ -1,6 +1,7 @@
 import cv2
 import numpy as np
-from tensorflow.keras.models import load_model
+from inference_backends import create_backend
+from frame_preprocessor import FramePreprocessor
 from lane_navigation import LaneKeepAssistSystem
 from image_preprocessing import *
 import logging
@@ -10,18 +11,33 @@ class DeepLearningLKAS(object):
     """
     A Lane Keep Assist System powered by Deep Learning. Inspired by Nvidia End-to-End ML architecture for self-driving cars.
     """
-    def __init__(self, car=None, ml_model_path='/home/pi/Herbie/ml_models/lane_keep_assist_system/trained_models/DL_LKAS_FINAL.h5'):
+    def __init__(self, car=None, ml_model_path='/home/pi/Herbie/ml_models/lane_keep_assist_system/trained_models/DL_LKAS_FINAL.h5', headless=False,
+                 backend='tflite', tflite_model_path=None, num_threads=4, use_edgetpu=False):
+        """
+        Constructor
+        :param car: PiCar object
+        :param ml_model_path: Path to the trained Keras .h5 model
+        :param headless: Boolean value, skip overlay rendering
+        :param backend: "tflite" to run a converted model through the TF Lite interpreter, "keras" to run the .h5 model.
+        The Keras model is used whenever the TF Lite model cannot be loaded.
+        :param tflite_model_path: Path to the .tflite model, defaults to ml_model_path with a .tflite extension
+        :param num_threads: Number of CPU threads used by the TF Lite interpreter
+        :param use_edgetpu: Boolean value, run the TF Lite model on the Edge TPU
+        """
 
         self.current_steering_angle = 90
-        self.model = load_model(ml_model_path)
+        self.backend = create_backend(backend, ml_model_path, tflite_model_path, num_threads, use_edgetpu)
+        self.preprocessor = FramePreprocessor(dtype=self.backend.input_dtype, scale=self.backend.input_scale,
+                                              zero_point=self.backend.input_zero_point)
         logging.info("Configuring Deep Learning Lane Keep Assist System")
         self.car = car
+        self.headless = headless
 
     def drive_within_lanes(self, image):
         """
         Detect lanes using trained TF DL Model and move the vehicle according
         :param image: Video frame retrived from the PiCamera
-        :return:
+        :return: Heading image, or (steering angle, lanes) in headless mode. The model does not detect lanes.
         """
 
         display_image("Driving View", image)
@@ -31,25 +47,35 @@ class DeepLearningLKAS(object):
         if self.car is not None:
             self.car.front_wheels.turn(self.current_steering_angle)
 
+        if self.headless:
+            return self.current_steering_angle, []
+
         heading_image = generate_heading(image, self.current_steering_angle)
 
         return heading_image
 
+    def render_overlay(self, image):
+        """
+        Renders the heading predicted by the last drive_within_lanes() call
+        """
+        return generate_heading(image, self.current_steering_angle)
+
     def predict_steering_angle(self, image):
         """
         Predict steering angle using a DL model that ingests a frame from the PiCamera. We round the steering
         angle to the nearest integer given PiCar only turns using whole numbers.
         """
 
-        processed_img = self.preprocess_image(image)
-        array_img = np.asarray([processed_img])
-        prediction = self.model.predict(array_img)[0]
+        # Preprocess straight into the model's input buffer
+        self.preprocessor.process(image, out=self.backend.input_buffer()[0])
+        prediction = self.backend.invoke()
 
         return int(prediction + 0.5)
 
     def preprocess_image(self, frame):
         """
-        Transform raw video frame received by PiCamera such that it's compatible with Nvidia Model
+        Transform raw video frame received by PiCamera such that it's compatible with Nvidia Model. Reference
+        implementation of FramePreprocessor, which predict_steering_angle() uses.
         """
 
         h, _, _ = frame.shape
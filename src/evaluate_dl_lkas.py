@@ -0,0 +1,204 @@
+"""
+Usage:
+
+# Evaluate the DL LKAS against the steering angles of the OpenCV LKAS on recorded drives:
+python evaluate_dl_lkas.py ../data/tmp/car_video*.avi --model ../ml_models/DL_LKAS_FINAL.h5
+
+# Evaluate against labelled frames (.png directories written by gen_training_data.py, or a lkas_dataset_cache.py cache):
+python evaluate_dl_lkas.py ../data/training_images ../data/lkas_cache --model ../ml_models/DL_LKAS_FINAL.h5 --backend tflite
+
+# Write per-frame predictions:
+python evaluate_dl_lkas.py ../data/tmp/car_video*.avi --model ../ml_models/DL_LKAS_FINAL.h5 --csv predictions.csv
+"""
+
+import os
+import time
+import argparse
+import cv2
+import numpy as np
+from frame_preprocessor import FramePreprocessor
+from inference_backends import create_backend
+from lane_navigation import LaneKeepAssistSystem
+from lkas_data_pipeline import list_training_images
+from lkas_dataset_cache import LKASDatasetCache, read_manifest
+
+
+def prediction_stats(y_true, y_pred):
+    """
+    Error statistics of the notebook's prediction_stats() (MSE, R2) along with the mean and largest absolute error
+    :param y_true: Reference steering angles
+    :param y_pred: Predicted steering angles
+    :return: Dictionary with mse, r2, mae and max_error
+    """
+    y_true = np.asarray(y_true, np.float64)
+    y_pred = np.asarray(y_pred, np.float64)
+    if len(y_true) == 0:
+        return {"mse": 0.0, "r2": 0.0, "mae": 0.0, "max_error": 0.0}
+
+    errors = y_pred - y_true
+    total = np.sum((y_true - y_true.mean()) ** 2)
+
+    return {
+        "mse": float(np.mean(errors ** 2)),
+        "r2": float(1 - np.sum(errors ** 2) / total) if total > 0 else 0.0,
+        "mae": float(np.mean(np.abs(errors))),
+        "max_error": float(np.abs(errors).max()),
+    }
+
+
+def iter_video(path):
+    """
+    Labels the frames of a recording with the headless OpenCV LKAS
+    :return: Generator of (frame, OpenCV steering angle)
+    """
+    lane_follower = LaneKeepAssistSystem(headless=True)
+    video_stream = cv2.VideoCapture(path)
+    try:
+        while video_stream.isOpened():
+            grabbed, frame = video_stream.read()
+            if not grabbed:
+                break
+            lane_follower.drive_within_lanes(frame)
+            yield frame, lane_follower.current_steering_angle
+    finally:
+        video_stream.release()
+
+
+def iter_images(directory):
+    """
+    :return: Generator of (frame, steering angle from the file name) of a directory of labelled .png frames
+    """
+    for path, steering_angle in zip(*list_training_images(directory)):
+        yield cv2.imread(path), steering_angle
+
+
+class BatchEvaluator(object):
+    """
+    Runs the DL LKAS model over many frames in large batches. Frames are preprocessed into a reused batch buffer, and
+    every full batch goes through a single backend.predict() call.
+    """
+
+    def __init__(self, backend, batch_size=256):
+        """
+        Constructor
+        :param backend: Inference backend from inference_backends.create_backend()
+        :param batch_size: Frames per model call
+        """
+        self.backend = backend
+        self.batch_size = batch_size
+        # backend.predict() takes float input in [0, 1] and quantizes it for quantized models
+        self.preprocessor = FramePreprocessor()
+        self.batch = np.empty((batch_size,) + tuple(backend.input_shape), np.float32)
+        self.inference_seconds = 0.0
+        self.frames = 0
+
+    def predict(self, batch):
+        start = time.perf_counter()
+        predictions = self.backend.predict(batch)
+        self.inference_seconds += time.perf_counter() - start
+        self.frames += len(batch)
+
+        return predictions
+
+    def evaluate(self, samples):
+        """
+        Predicts the steering angle of every frame
+        :param samples: Iterable of (BGR frame, reference steering angle)
+        :return: Reference angles and predicted angles as float arrays
+        """
+        references = []
+        predictions = []
+        filled = 0
+        for frame, steering_angle in samples:
+            self.preprocessor.process(frame, out=self.batch[filled])
+            references.append(steering_angle)
+            filled += 1
+            if filled == self.batch_size:
+                predictions.append(self.predict(self.batch))
+                filled = 0
+
+        if filled:
+            predictions.append(self.predict(self.batch[:filled]))
+
+        return (np.asarray(references, np.float64),
+                np.concatenate(predictions).astype(np.float64) if predictions else np.zeros(0))
+
+    def evaluate_cache(self, cache):
+        """
+        Predicts the steering angle of every frame of a preprocessed dataset cache
+        :param cache: LKASDatasetCache
+        :return: Reference angles and predicted angles as float arrays
+        """
+        predictions = []
+        for start in range(0, len(cache), self.batch_size):
+            end = min(start + self.batch_size, len(cache))
+            batch, _ = cache.batch(slice(start, end), out=self.batch[:end - start])
+            predictions.append(self.predict(batch))
+
+        return (np.asarray(cache.labels, np.float64),
+                np.concatenate(predictions).astype(np.float64) if predictions else np.zeros(0))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline evaluation of the Deep Learning LKAS")
+    parser.add_argument("sources", nargs="+",
+                        help="Recordings, directories of labelled .png frames or lkas_dataset_cache.py caches")
+    parser.add_argument("--model", type=str, required=True, help="Keras .h5 model")
+    parser.add_argument("--backend", type=str, default="keras", choices=["keras", "tflite"])
+    parser.add_argument("--tflite-model", type=str, default=None, help="TF Lite model, defaults to MODEL.tflite")
+    parser.add_argument("--threads", type=int, default=4, help="TF Lite interpreter threads")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--csv", type=str, default="", help="Write per-frame reference and predicted angles")
+    args = parser.parse_args()
+
+    backend = create_backend(args.backend, args.model, args.tflite_model, args.threads)
+    evaluator = BatchEvaluator(backend, args.batch_size)
+
+    all_references = []
+    all_predictions = []
+    rows = []
+    start = time.perf_counter()
+
+    print("%-40s %7s %9s %8s %8s %8s" % ("source", "frames", "fps", "mse", "r2", "mae"))
+    for source in args.sources:
+        inference_seconds = evaluator.inference_seconds
+        if os.path.isdir(source) and read_manifest(source) is not None:
+            references, predictions = evaluator.evaluate_cache(LKASDatasetCache(source))
+        elif os.path.isdir(source):
+            references, predictions = evaluator.evaluate(iter_images(source))
+        else:
+            references, predictions = evaluator.evaluate(iter_video(source))
+        inference_seconds = evaluator.inference_seconds - inference_seconds
+
+        stats = prediction_stats(references, predictions)
+        fps = len(references) / inference_seconds if inference_seconds > 0 else 0.0
+        print("%-40s %7d %9.1f %8.2f %7.1f%% %8.2f" % (
+            os.path.basename(os.path.normpath(source))[-40:], len(references), fps, stats["mse"], stats["r2"] * 100,
+            stats["mae"]))
+
+        all_references.append(references)
+        all_predictions.append(predictions)
+        rows.extend((source, i, reference, prediction)
+                    for i, (reference, prediction) in enumerate(zip(references, predictions)))
+
+    references = np.concatenate(all_references)
+    predictions = np.concatenate(all_predictions)
+    stats = prediction_stats(references, predictions)
+    elapsed = time.perf_counter() - start
+    print("%-40s %7d %9.1f %8.2f %7.1f%% %8.2f" % (
+        "total", len(references), evaluator.frames / evaluator.inference_seconds if evaluator.inference_seconds else 0.0,
+        stats["mse"], stats["r2"] * 100, stats["mae"]))
+    print("MSE     = %.2g" % stats["mse"])
+    print("R2      = %.2f%%" % (stats["r2"] * 100))
+    print("Max abs error %.1f degrees, %.1f frames/sec end to end (decoding, labelling and preprocessing included)" % (
+        stats["max_error"], len(references) / elapsed if elapsed > 0 else 0.0))
+
+    if args.csv:
+        with open(args.csv, "w") as f:
+            f.write("source,frame,reference_angle,predicted_angle\n")
+            for source, i, reference, prediction in rows:
+                f.write("%s,%d,%d,%.3f\n" % (source, i, reference, prediction))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# !/usr/bin/env python
+# title           :event_recorder.py
+# description     :Event-triggered video capture from a bounded in-memory ring of recent frames (pre/post-roll)
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import os
+import math
+import logging
+import datetime
+import threading
+import cv2
+import numpy as np
+
+# Trigger reasons
+NO_LANES = 'no_lanes'
+STEERING_CLAMP = 'steering_clamp'
+MANUAL = 'manual'
+DETECTION = 'detection'
+
+
+class EventRecorder(object):
+    """
+    Keeps the last pre_seconds of raw frames in a preallocated ring and writes a video clip only when a trigger fires:
+    the pre-roll up to the trigger plus post_seconds after it. During normal driving a frame costs one copy into the
+    ring, nothing is encoded.
+
+    Frames are numbered with sequence numbers. A trigger turns into a range of sequence numbers that a writer thread
+    encodes from the ring, following the producer while the post-roll is recorded. Triggers that fire while a clip is
+    being recorded extend it. The ring has room for `slack_seconds` more than the pre-roll, so the writer can fall
+    that far behind before the oldest frames of a clip are overwritten and skipped.
+    """
+
+    def __init__(self, directory, fourcc, fps, frame_size, pre_seconds=5.0, post_seconds=5.0, slack_seconds=2.0,
+                 min_frames=None):
+        """
+        Constructor
+        :param directory: Directory the clips are written to
+        :param fourcc: FourCC codec code, e.g. cv2.VideoWriter_fourcc(*'XVID')
+        :param fps: Frame rate of the clips
+        :param frame_size: (width, height) of the recorded frames
+        :param pre_seconds: Seconds recorded before a trigger
+        :param post_seconds: Seconds recorded after the last trigger of a clip
+        :param slack_seconds: Extra ring capacity for the writer to fall behind by
+        :param min_frames: Dictionary of trigger reason -> consecutive frames a condition passed to check() must hold
+        before it triggers. Reasons that are not listed trigger on the first frame.
+        """
+        self.directory = directory
+        self.fourcc = fourcc
+        self.fps = fps
+        self.frame_size = frame_size
+        self.pre_frames = int(math.ceil(pre_seconds * fps))
+        self.post_frames = int(math.ceil(post_seconds * fps))
+        self.min_frames = dict(min_frames or {})
+
+        width, height = frame_size
+        slots = self.pre_frames + int(math.ceil(slack_seconds * fps)) + 1
+        self.frames = np.empty((slots, height, width, 3), np.uint8)
+        self.slot_seq = np.zeros(slots, np.int64)
+        self.slots = slots
+
+        self.clips = 0
+        self.frames_encoded = 0
+        self.frames_skipped = 0
+        self.triggers = {}
+
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._clip = None  # [first, last, reasons] of the clip being recorded
+        self._recorded = 0  # Last frame of the previous clip
+        self._streaks = {}
+        self._frame = np.empty((height, width, 3), np.uint8)
+        self._running = True
+        self._thread = threading.Thread(target=self._write_clips, name='EventRecorder', daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        """
+        Copies a frame into the ring
+        :param frame: Raw video frame of the recorder's frame size
+        :return: Sequence number of the frame
+        """
+        seq = self._seq + 1
+        slot = seq % self.slots
+        self.slot_seq[slot] = -1
+        np.copyto(self.frames[slot], frame)
+        self.slot_seq[slot] = seq
+
+        with self._condition:
+            self._seq = seq
+            if self._clip is not None:
+                self._condition.notify()
+
+        return seq
+
+    def trigger(self, reason):
+        """
+        Records the frames around the newest frame: starts a clip with the pre-roll, or extends the clip being recorded
+        :param reason: Trigger reason, e.g. NO_LANES
+        """
+        self.triggers[reason] = self.triggers.get(reason, 0) + 1
+
+        with self._condition:
+            last = self._seq + self.post_frames
+            if self._clip is None:
+                first = max(self._seq - self.pre_frames + 1, self._recorded + 1)
+                self._clip = [first, last, [reason]]
+                logging.info('Event %s, recording frames %d-%d' % (reason, first, last))
+            else:
+                self._clip[1] = max(self._clip[1], last)
+                if reason not in self._clip[2]:
+                    self._clip[2].append(reason)
+            self._condition.notify()
+
+    def check(self, reason, active):
+        """
+        Triggers once a condition has held for the reason's minimum number of consecutive frames. Call once per frame.
+        :param reason: Trigger reason
+        :param active: Boolean value, the condition holds on the current frame
+        :return: True when the condition triggered a recording
+        """
+        if not active:
+            self._streaks[reason] = 0
+            return False
+
+        streak = self._streaks.get(reason, 0) + 1
+        self._streaks[reason] = streak
+        if streak != self.min_frames.get(reason, 1):
+            return False
+
+        self.trigger(reason)
+        return True
+
+    @property
+    def recording(self):
+        return self._clip is not None
+
+    def _clip_path(self, datestr, reasons):
+        return os.path.join(self.directory, 'event%s_%s.avi' % (datestr, '+'.join(reasons)))
+
+    def _write_clips(self):
+        """
+        Writer thread: encodes the frames of each clip from the ring as they become available
+        """
+        while True:
+            with self._condition:
+                while self._running and self._clip is None:
+                    self._condition.wait()
+                if self._clip is None:
+                    return
+                seq = self._clip[0]
+                reasons = self._clip[2]
+
+            # Triggers can add reasons until the clip ends, so it is encoded under a temporary name and renamed after.
+            # The temporary name keeps the .avi extension OpenCV picks the container from.
+            datestr = datetime.datetime.now().strftime("%y%m%d_%H%M%S")
+            recording_path = self._clip_path(datestr, ['recording'])
+            writer = cv2.VideoWriter(recording_path, self.fourcc, self.fps, self.frame_size)
+            encoded = skipped = 0
+            while True:
+                with self._condition:
+                    while self._running and seq > self._seq and seq <= self._clip[1]:
+                        self._condition.wait()
+                    if seq > self._clip[1] or seq > self._seq:
+                        # Done, or stopped before the post-roll was captured
+                        self._clip = None
+                        self._recorded = seq - 1
+                        break
+
+                # Copy the frame out before encoding, then make sure the producer did not overwrite it meanwhile
+                slot = seq % self.slots
+                np.copyto(self._frame, self.frames[slot])
+                if self.slot_seq[slot] == seq:
+                    writer.write(self._frame)
+                    encoded += 1
+                else:
+                    skipped += 1
+                seq += 1
+
+            writer.release()
+            path = self._clip_path(datestr, reasons)
+            if os.path.exists(recording_path):
+                os.replace(recording_path, path)
+            self.clips += 1
+            self.frames_encoded += encoded
+            self.frames_skipped += skipped
+            logging.info('Event clip %s (%s): %d frames, %d overwritten before encoding' % (
+                path, ', '.join(reasons), encoded, skipped))
+
+    def stats(self):
+        """
+        :return: Dictionary with the frames seen, triggers per reason, clips written and frames encoded and skipped
+        """
+        return {
+            'frames': self._seq,
+            'triggers': dict(self.triggers),
+            'clips': self.clips,
+            'frames_encoded': self.frames_encoded,
+            'frames_skipped': self.frames_skipped,
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info('Event Recorder: %d frames, triggers %s, %d clips with %d frames encoded, %d skipped' % (
+            stats['frames'], stats['triggers'], stats['clips'], stats['frames_encoded'], stats['frames_skipped']))
+
+    def release(self):
+        """
+        Finishes the clip being recorded with the frames already captured and stops the writer thread
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
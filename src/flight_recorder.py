@@ -0,0 +1,223 @@
+# !/usr/bin/env python
+# title           :flight_recorder.py
+# description     :Per-frame telemetry in a preallocated, memory-mapped ring file of fixed-width records
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :python flight_recorder.py ../data/tmp/flight*.bin --csv flight.csv (summary and CSV export)
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import os
+import time
+import logging
+import argparse
+import numpy as np
+
+_MAGIC = 0x544C4648  # "HFLT"
+_VERSION = 1
+# magic, version, record size, capacity, records written, creation time (ns since the epoch)
+_HEADER_FIELDS = 6
+_COUNT = 4
+_HEADER_BYTES = 64
+
+# One record per control loop tick. lane_endpoints holds (x0, y0, x1, y1) of up to two lanes in detection order,
+# rows past `lanes` are zero.
+RECORD_DTYPE = np.dtype([
+    ("seq", np.uint32),
+    ("frame_timestamp", np.float64),
+    ("steer_timestamp", np.float64),
+    ("steering_angle", np.int16),
+    ("raw_steering_angle", np.int16),
+    ("lanes", np.uint8),
+    ("lane_endpoints", np.int16, (2, 4)),
+    ("detection_ms", np.float32),
+    ("scale", np.float32),
+])
+
+
+class FlightRecorder(object):
+    """
+    Appends one fixed-width telemetry record per frame to a ring file mapped into memory. The file is allocated up
+    front, so an append is a single structured array assignment with no formatting, system call or allocation, and
+    the page cache writes the records back to disk. Once the ring is full the oldest records are overwritten.
+
+    The record count in the header is updated after each record is written, so a reader never sees a record that is
+    only partly written unless the ring wraps onto it while reading.
+    """
+
+    def __init__(self, path, capacity=72000):
+        """
+        Creates the ring file, replacing any existing file
+        :param path: Path of the ring file
+        :param capacity: Number of records kept, 72000 is one hour at 20 frames per second
+        """
+        self.path = path
+        self.capacity = capacity
+        self._map = np.memmap(path, np.uint8, "w+", shape=(_HEADER_BYTES + capacity * RECORD_DTYPE.itemsize,))
+        self.header = self._map[:_HEADER_BYTES].view(np.int64)
+        self.records = self._map[_HEADER_BYTES:].view(RECORD_DTYPE)
+
+        self.header[:_HEADER_FIELDS] = (_MAGIC, _VERSION, RECORD_DTYPE.itemsize, capacity, 0,
+                                         int(time.time() * 1e9))
+        self.count = 0
+        self._endpoints = np.zeros((2, 4), np.int16)
+
+    def append(self, frame_timestamp, steering_angle, raw_steering_angle, lanes=(), detection_time=0.0, scale=1.0,
+               steer_timestamp=None):
+        """
+        Writes the record of one frame
+        :param frame_timestamp: Capture timestamp of the frame (time.perf_counter() clock)
+        :param steering_angle: Stabilized steering angle sent to the front wheels
+        :param raw_steering_angle: Steering angle before stabilization
+        :param lanes: Detected lanes, lists of one (x0, y0, x1, y1) segment
+        :param detection_time: Seconds spent detecting lanes
+        :param scale: Processing scale of lane detection
+        :param steer_timestamp: Time of the steering decision, time.perf_counter() by default
+        """
+        endpoints = self._endpoints
+        endpoints[:] = 0
+        for i, lane in enumerate(lanes[:2]):
+            endpoints[i] = lane[0]
+
+        self.records[self.count % self.capacity] = (
+            self.count, frame_timestamp, time.perf_counter() if steer_timestamp is None else steer_timestamp,
+            steering_angle, raw_steering_angle, len(lanes), endpoints, detection_time * 1000.0, scale)
+        self.count += 1
+        self.header[_COUNT] = self.count
+
+    def append_lane_follower(self, lane_follower, frame_timestamp, steer_timestamp=None):
+        """
+        Writes the record of the frame a lane follower just steered from. Backends without lane detection (the DL
+        LKAS) are recorded with no lanes and their steering angle as the raw angle.
+        :param lane_follower: LaneKeepAssistSystem or DeepLearningLKAS
+        :param frame_timestamp: Capture timestamp of the frame
+        :param steer_timestamp: Time of the steering decision, time.perf_counter() by default
+        """
+        steering_angle = lane_follower.current_steering_angle
+        self.append(frame_timestamp, steering_angle, getattr(lane_follower, "raw_steering_angle", steering_angle),
+                    getattr(lane_follower, "lanes", ()), getattr(lane_follower, "detection_time", 0.0),
+                    getattr(lane_follower, "scale", 1.0), steer_timestamp)
+
+    def stats(self):
+        """
+        :return: Dictionary with the records written and the records still held by the ring
+        """
+        return {"written": self.count, "kept": min(self.count, self.capacity)}
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info("Flight Recorder: %d records written, %d kept in %s" % (stats["written"], stats["kept"],
+                                                                              self.path))
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        """
+        Flushes the ring file and unmaps it
+        """
+        if self._map is not None:
+            self._map.flush()
+            self.header = self.records = self._map = None
+
+
+def read_header(path):
+    """
+    :return: Dictionary with the record size, capacity, records written and creation time of a ring file
+    """
+    header = np.fromfile(path, np.int64, _HEADER_FIELDS)
+    if len(header) < _HEADER_FIELDS or header[0] != _MAGIC:
+        raise ValueError("%s is not a flight recorder file" % path)
+    if header[1] != _VERSION or header[2] != RECORD_DTYPE.itemsize:
+        raise ValueError("%s has record format %d (%d bytes), expected %d (%d bytes)" % (
+            path, header[1], header[2], _VERSION, RECORD_DTYPE.itemsize))
+
+    return {"record_size": int(header[2]), "capacity": int(header[3]), "written": int(header[4]),
+            "created": header[5] / 1e9}
+
+
+def read_flight_record(path):
+    """
+    Loads the records of a run, oldest first
+    :param path: Ring file written by FlightRecorder
+    :return: Structured array of RECORD_DTYPE, e.g. records["steering_angle"] is the steering angle of every frame
+    """
+    header = read_header(path)
+    records = np.memmap(path, RECORD_DTYPE, "r", offset=_HEADER_BYTES, shape=(header["capacity"],))
+    written = header["written"]
+    if written <= header["capacity"]:
+        return np.array(records[:written])
+
+    start = written % header["capacity"]
+    return np.concatenate((records[start:], records[:start]))
+
+
+def summarize(records):
+    """
+    :return: Dictionary with the frame count, duration, frame rate, lane detection rates, the fraction of frames whose
+    steering was clamped by stabilization and detection time statistics of a run
+    """
+    if len(records) == 0:
+        return {"frames": 0}
+
+    duration = float(records["steer_timestamp"][-1] - records["steer_timestamp"][0])
+    lanes = records["lanes"]
+    steered = lanes > 0
+    detection_ms = records["detection_ms"]
+
+    return {
+        "frames": len(records),
+        "seconds": duration,
+        "fps": (len(records) - 1) / duration if duration > 0 else 0.0,
+        "no_lanes": float(np.mean(lanes == 0)),
+        "one_lane": float(np.mean(lanes == 1)),
+        "two_lanes": float(np.mean(lanes == 2)),
+        "clamped": float(np.mean(records["steering_angle"][steered] != records["raw_steering_angle"][steered]))
+        if steered.any() else 0.0,
+        "detection_ms_mean": float(detection_ms.mean()),
+        "detection_ms_p95": float(np.percentile(detection_ms, 95)),
+        "latency_ms_mean": float(np.mean(records["steer_timestamp"] - records["frame_timestamp"]) * 1000.0),
+    }
+
+
+def write_csv(records, path):
+    """
+    Writes the records one row per frame, lane endpoints as l0_x0 ... l1_y1
+    """
+    endpoints = ["l%d_%s" % (lane, name) for lane in range(2) for name in ("x0", "y0", "x1", "y1")]
+    columns = [name for name in RECORD_DTYPE.names if name != "lane_endpoints"]
+    with open(path, "w") as f:
+        f.write(",".join(columns + endpoints) + "\n")
+        for record in records:
+            f.write(",".join(["%g" % record[name] for name in columns] +
+                             ["%d" % value for value in record["lane_endpoints"].reshape(-1)]) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize flight recorder files")
+    parser.add_argument("paths", nargs="+", help="Ring files written by FlightRecorder")
+    parser.add_argument("--csv", type=str, default="", help="Write the records of the first file as CSV")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        summary = summarize(read_flight_record(path))
+        if summary["frames"] == 0:
+            print("%s: no records" % os.path.basename(path))
+            continue
+
+        print("%s: %d frames over %.1f s, %.1f fps" % (
+            os.path.basename(path), summary["frames"], summary["seconds"], summary["fps"]))
+        print("  lanes 0/1/2: %.1f%% / %.1f%% / %.1f%%, steering clamped on %.1f%% of steered frames" % (
+            summary["no_lanes"] * 100, summary["one_lane"] * 100, summary["two_lanes"] * 100, summary["clamped"] * 100))
+        print("  detection %.2f ms mean, %.2f ms p95, capture to steer %.2f ms mean" % (
+            summary["detection_ms_mean"], summary["detection_ms_p95"], summary["latency_ms_mean"]))
+
+    if args.csv:
+        write_csv(read_flight_record(args.paths[0]), args.csv)
+
+
+if __name__ == "__main__":
+    main()
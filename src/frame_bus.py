@@ -0,0 +1,373 @@
+# !/usr/bin/env python
+# title           :frame_bus.py
+# description     :Shared-memory frame bus so perception, detection and recording can run in separate processes
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :python frame_bus.py --consumers 3 --work-ms 20 (scaling benchmark)
+# notes           :Requires multiprocessing.shared_memory (Python 3.8+)
+# python_version  :3.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import time
+import argparse
+import logging
+import multiprocessing
+from functools import partial
+from multiprocessing import shared_memory
+import numpy as np
+
+_MAGIC = 0x48455242  # "HERB"
+# magic, height, width, channels, slots, consumers, head sequence
+_HEADER_FIELDS = 7
+_HEAD = 6
+
+
+class FrameBus(object):
+    """
+    Fixed-size ring of frame slots in shared memory. One producer publishes frames, each stamped with a sequence
+    number, and any number of consumer processes read them as zero-copy NumPy views, so frames are never pickled.
+
+    A slot's sequence number is set to -1 while it is being written. A consumer that keeps working on a view should
+    call is_valid() afterwards to find out whether the producer reused the slot in the meantime. The producer counts,
+    per consumer, the frames that were overwritten before the consumer read them.
+    """
+
+    def __init__(self, shm, create):
+        """
+        Use FrameBus.create() or FrameBus.attach()
+        """
+        self.shm = shm
+        self._owner = create
+
+        header = np.ndarray((_HEADER_FIELDS,), np.int64, shm.buf)
+        _, height, width, channels, slots, consumers, _ = header.tolist()
+        self.frame_shape = (height, width, channels)
+        self.slots = slots
+        self.consumers = consumers
+
+        offset = 0
+        views = {}
+        for field, dtype, length in (("header", np.int64, _HEADER_FIELDS),
+                                     ("slot_seq", np.int64, slots),
+                                     ("slot_timestamp", np.float64, slots),
+                                     ("consumer_seq", np.int64, consumers),
+                                     ("consumer_reads", np.int64, consumers),
+                                     ("consumer_overwrites", np.int64, consumers),
+                                     ("consumer_registered", np.int64, consumers)):
+            views[field] = np.ndarray((length,), dtype, shm.buf, offset)
+            offset += length * 8
+
+        self.header = views["header"]
+        self.slot_seq = views["slot_seq"]
+        self.slot_timestamp = views["slot_timestamp"]
+        self.consumer_seq = views["consumer_seq"]
+        self.consumer_reads = views["consumer_reads"]
+        self.consumer_overwrites = views["consumer_overwrites"]
+        self.consumer_registered = views["consumer_registered"]
+
+        # Frame slots start on a cache line boundary
+        offset = (offset + 63) // 64 * 64
+        self.frames = np.ndarray((slots,) + self.frame_shape, np.uint8, shm.buf, offset)
+
+    @staticmethod
+    def _size(frame_shape, slots, consumers):
+        header = (_HEADER_FIELDS + 2 * slots + 4 * consumers) * 8
+        return (header + 63) // 64 * 64 + slots * int(np.prod(frame_shape))
+
+    @classmethod
+    def create(cls, frame_shape=(240, 320, 3), slots=8, consumers=4, name=None):
+        """
+        Creates a frame bus
+        :param frame_shape: Shape of the uint8 frames carried by the bus
+        :param slots: Number of frame slots
+        :param consumers: Maximum number of consumers
+        :param name: Shared memory name, generated when omitted
+        :return: FrameBus owned by the caller (the producer)
+        """
+        shm = shared_memory.SharedMemory(name=name, create=True, size=cls._size(frame_shape, slots, consumers))
+        header = np.ndarray((_HEADER_FIELDS,), np.int64, shm.buf)
+        header[:] = (_MAGIC,) + tuple(frame_shape) + (slots, consumers, 0)
+        bus = cls(shm, True)
+        bus.slot_seq[:] = 0
+        bus.consumer_seq[:] = 0
+        bus.consumer_reads[:] = 0
+        bus.consumer_overwrites[:] = 0
+        bus.consumer_registered[:] = 0
+
+        return bus
+
+    @classmethod
+    def attach(cls, name):
+        """
+        Attaches to an existing frame bus, e.g. from a consumer process
+        :param name: Shared memory name of the bus (FrameBus.name)
+        """
+        shm = shared_memory.SharedMemory(name=name)
+        if np.ndarray((1,), np.int64, shm.buf)[0] != _MAGIC:
+            shm.close()
+            raise ValueError("%s is not a frame bus" % name)
+
+        return cls(shm, False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, frame, timestamp=None):
+        """
+        Copies a frame into the next slot
+        :param frame: uint8 frame of the bus's frame shape
+        :param timestamp: Capture timestamp, time.perf_counter() by default
+        :return: Sequence number of the frame
+        """
+        seq = int(self.header[_HEAD]) + 1
+        slot = seq % self.slots
+
+        previous = self.slot_seq[slot]
+        if previous > 0:
+            # Registered consumers that have not read up to the overwritten frame lose it
+            missed = (self.consumer_registered == 1) & (self.consumer_seq < previous)
+            self.consumer_overwrites[missed] += 1
+
+        self.slot_seq[slot] = -1
+        np.copyto(self.frames[slot], frame)
+        self.slot_timestamp[slot] = time.perf_counter() if timestamp is None else timestamp
+        self.slot_seq[slot] = seq
+        self.header[_HEAD] = seq
+
+        return seq
+
+    def register(self, consumer):
+        """
+        Registers a consumer index so the producer tracks its lag and overwritten frames
+        :param consumer: Consumer index, 0 <= consumer < consumers
+        """
+        self.consumer_seq[consumer] = self.header[_HEAD]
+        self.consumer_registered[consumer] = 1
+
+    def unregister(self, consumer):
+        self.consumer_registered[consumer] = 0
+
+    def read_latest(self, consumer):
+        """
+        Reads the newest frame, skipping any frames published since the consumer's previous read
+        :param consumer: Consumer index
+        :return: (sequence number, timestamp, frame view), None when there is no new frame or its slot is being
+        rewritten. Poll again after a short sleep, the next read moves on to a newer frame.
+        """
+        seq = int(self.header[_HEAD])
+        if seq <= self.consumer_seq[consumer]:
+            return None
+
+        timestamp = self._read_timestamp(seq)
+        if timestamp is None:
+            return None
+
+        self.consumer_seq[consumer] = seq
+        self.consumer_reads[consumer] += 1
+        return seq, timestamp, self.frames[seq % self.slots]
+
+    def read_next(self, consumer):
+        """
+        Reads the frame after the consumer's previous read, for consumers that want every frame (e.g. recording).
+        Frames that were already overwritten are skipped.
+        :param consumer: Consumer index
+        :return: (sequence number, timestamp, frame view), None when there is no new frame or its slot is being
+        rewritten. Poll again after a short sleep, by then the producer has either finished or moved past the frame.
+        """
+        head = int(self.header[_HEAD])
+        seq = max(int(self.consumer_seq[consumer]) + 1, head - self.slots + 2)
+        if seq > head:
+            return None
+
+        timestamp = self._read_timestamp(seq)
+        if timestamp is None:
+            return None
+
+        self.consumer_seq[consumer] = seq
+        self.consumer_reads[consumer] += 1
+        return seq, timestamp, self.frames[seq % self.slots]
+
+    def _read_timestamp(self, seq):
+        """
+        Reads the timestamp of frame `seq`: checks the slot's sequence number, reads the timestamp, then checks the
+        sequence number again so a slot the producer started rewriting in between is not reported
+        :return: Timestamp, None when the slot does not hold frame `seq`
+        """
+        slot = seq % self.slots
+        if self.slot_seq[slot] != seq:
+            return None
+
+        timestamp = float(self.slot_timestamp[slot])
+        if self.slot_seq[slot] != seq:
+            return None
+
+        return timestamp
+
+    def is_valid(self, seq):
+        """
+        :return: True when the slot holding frame `seq` has not been reused by the producer
+        """
+        return self.slot_seq[seq % self.slots] == seq
+
+    def stats(self):
+        """
+        :return: Dictionary with the head sequence number and, per registered consumer, frames read, lag and
+        overwritten frames
+        """
+        head = int(self.header[_HEAD])
+        consumers = {}
+        for consumer in range(self.consumers):
+            if self.consumer_registered[consumer]:
+                consumers[consumer] = {
+                    "reads": int(self.consumer_reads[consumer]),
+                    "lag": head - int(self.consumer_seq[consumer]),
+                    "overwrites": int(self.consumer_overwrites[consumer]),
+                }
+
+        return {"published": head, "consumers": consumers}
+
+    def log_stats(self):
+        stats = self.stats()
+        for consumer, consumer_stats in stats["consumers"].items():
+            logging.info("Frame Bus consumer %d: %d/%d frames read, lag %d, %d overwritten" % (
+                consumer, consumer_stats["reads"], stats["published"], consumer_stats["lag"],
+                consumer_stats["overwrites"]))
+
+    def close(self):
+        """
+        Detaches from the bus. The producer also frees the shared memory.
+        """
+        self.frames = None
+        self.header = self.slot_seq = self.slot_timestamp = None
+        self.consumer_seq = self.consumer_reads = self.consumer_overwrites = self.consumer_registered = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+class FrameBusConsumer(multiprocessing.Process):
+    """
+    Process that attaches to a frame bus and passes frames to a handler. The handler is created inside the process by
+    calling handler_factory(), and is called as handler(frame, timestamp) with a zero-copy view of the frame. It may
+    define close(), which is called when the process stops.
+    """
+
+    def __init__(self, bus_name, consumer, handler_factory, every_frame=False, poll_interval=0.001, copy=False):
+        """
+        Constructor
+        :param bus_name: Shared memory name of the bus
+        :param consumer: Consumer index
+        :param handler_factory: Picklable callable returning the frame handler
+        :param every_frame: Boolean value, read every frame (read_next) instead of the newest one (read_latest)
+        :param poll_interval: Seconds to sleep when no new frame is available
+        :param copy: Boolean value, copy every frame out of the bus and drop it when the producer rewrote its slot
+        during the copy, so the handler never sees a torn frame (e.g. recording). Otherwise the handler gets the
+        zero-copy view.
+        """
+        super(FrameBusConsumer, self).__init__(daemon=True)
+        self.bus_name = bus_name
+        self.consumer = consumer
+        self.handler_factory = handler_factory
+        self.every_frame = every_frame
+        self.poll_interval = poll_interval
+        self.copy = copy
+        self._stop_event = multiprocessing.Event()
+
+    def run(self):
+        bus = FrameBus.attach(self.bus_name)
+        bus.register(self.consumer)
+        handler = self.handler_factory()
+        read = bus.read_next if self.every_frame else bus.read_latest
+        buffer = np.empty(bus.frame_shape, np.uint8) if self.copy else None
+        torn = 0
+
+        try:
+            while not self._stop_event.is_set():
+                frame = read(self.consumer)
+                if frame is None:
+                    time.sleep(self.poll_interval)
+                    continue
+
+                seq, timestamp, view = frame
+                if buffer is not None:
+                    np.copyto(buffer, view)
+                    if not bus.is_valid(seq):
+                        torn += 1
+                        continue
+                    view = buffer
+                handler(view, timestamp)
+        finally:
+            if hasattr(handler, "close"):
+                handler.close()
+            if torn:
+                logging.info("Frame Bus consumer %d: dropped %d frames rewritten while being copied" % (
+                    self.consumer, torn))
+            bus.unregister(self.consumer)
+            bus.close()
+
+    def stop(self, timeout=5.0):
+        """
+        Asks the process to finish its current frame and exit
+        """
+        self._stop_event.set()
+        self.join(timeout)
+
+
+class _BusyWork(object):
+    """
+    Benchmark handler that spends a fixed amount of CPU time per frame
+    """
+
+    def __init__(self, work_seconds):
+        self.work_seconds = work_seconds
+
+    def __call__(self, frame, timestamp):
+        end = time.perf_counter() + self.work_seconds
+        while time.perf_counter() < end:
+            frame.sum()
+
+
+def benchmark(consumers=3, work_ms=20.0, fps=30.0, seconds=10.0):
+    """
+    Publishes synthetic 320x240 frames at a fixed rate to several consumer processes doing CPU work per frame, and
+    reports how many frames each consumer kept up with
+    """
+    bus = FrameBus.create(consumers=consumers)
+    processes = [FrameBusConsumer(bus.name, consumer, partial(_BusyWork, work_ms / 1000.0)) for consumer in range(consumers)]
+    for process in processes:
+        process.start()
+
+    frame = np.zeros(bus.frame_shape, np.uint8)
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        bus.publish(frame)
+        time.sleep(1.0 / fps)
+
+    stats = bus.stats()
+    for process in processes:
+        process.stop()
+    bus.close()
+
+    print("Published %d frames at %.0f FPS, %.1f ms of work per frame per consumer" % (stats["published"], fps, work_ms))
+    print("%8s %8s %10s %6s %11s" % ("consumer", "reads", "fps", "lag", "overwrites"))
+    for consumer, consumer_stats in stats["consumers"].items():
+        print("%8d %8d %10.1f %6d %11d" % (consumer, consumer_stats["reads"], consumer_stats["reads"] / seconds,
+                                           consumer_stats["lag"], consumer_stats["overwrites"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame bus scaling benchmark")
+    parser.add_argument("--consumers", type=int, default=3)
+    parser.add_argument("--work-ms", type=float, default=20.0, help="CPU time each consumer spends per frame")
+    parser.add_argument("--fps", type=float, default=30.0, help="Publishing rate")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    benchmark(args.consumers, args.work_ms, args.fps, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# !/usr/bin/env python
+# title           :frame_preprocessor.py
+# description     :Allocation-free preprocessing of PiCamera frames for the Deep Learning LKAS model
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import hashlib
+import cv2
+import numpy as np
+
+
+class FramePreprocessor(object):
+    """
+    Performs the same transformation as DeepLearningLKAS.preprocess_image() (crop top half, YUV, 3x3 Gaussian blur,
+    resize to 200x66, normalize) without allocating per frame. The crop is a view, every OpenCV stage writes into a
+    buffer allocated on the first frame, and normalization is a single table lookup that writes straight into the
+    model's input tensor.
+
+    The output is float32 pixel / 255, which is the float64 result of preprocess_image() rounded to float32. For
+    quantized models the lookup table maps pixels directly to the model's uint8 or int8 input values instead.
+    """
+
+    def __init__(self, output_size=(200, 66), dtype=np.float32, scale=0.0, zero_point=0):
+        """
+        Constructor
+        :param output_size: (width, height) expected by the model
+        :param dtype: np.float32 for float models, np.uint8 or np.int8 for quantized models
+        :param scale: Input quantization scale of a quantized model (0 for float models)
+        :param zero_point: Input quantization zero point of a quantized model
+        """
+        self.output_size = output_size
+        self.dtype = np.dtype(dtype)
+        self.crop_top = 1 / 2  # Rows above this fraction of the frame height are cropped
+        self.color_conversion = cv2.COLOR_BGR2YUV
+        self.blur_kernel = (3, 3)
+
+        # Maps every 8-bit pixel value to its normalized (or quantized) model input value
+        normalized = np.arange(256, dtype=np.float64) / 255
+        if scale:
+            # Clip to the range of the input type, int8 models take -128..127
+            limits = np.iinfo(self.dtype)
+            normalized = np.clip(np.round(normalized / scale + zero_point), limits.min, limits.max)
+        self.table = normalized.astype(self.dtype).reshape(1, 256)
+
+        width, height = output_size
+        self.resized = np.empty((height, width, 3), np.uint8)
+        self.output = np.empty((height, width, 3), self.dtype)
+        self.yuv = None
+        self.blurred = None
+
+    def process(self, frame, out=None):
+        """
+        Preprocesses a BGR frame
+        :param frame: Video frame retrieved from the PiCamera
+        :param out: Optional (66, 200, 3) array to write the result to, e.g. a view of the model's input tensor
+        :return: Preprocessed frame. Without `out` this is an internal buffer that is overwritten by the next call.
+        """
+        h, _, _ = frame.shape
+        crop = frame[int(h * self.crop_top):, :, :]
+
+        if self.yuv is None or self.yuv.shape != crop.shape:
+            self.yuv = np.empty(crop.shape, np.uint8)
+            self.blurred = np.empty(crop.shape, np.uint8)
+
+        cv2.cvtColor(crop, self.color_conversion, dst=self.yuv)
+        cv2.GaussianBlur(self.yuv, self.blur_kernel, 0, dst=self.blurred)
+        cv2.resize(self.blurred, self.output_size, dst=self.resized)
+
+        if out is None:
+            out = self.output
+
+        result = cv2.LUT(self.resized, self.table, dst=out)
+        # OpenCV allocates a new array when `out` is not a contiguous array of the right type
+        if result is not out:
+            np.copyto(out, result)
+
+        return out
+
+    def parameters(self, probe_size=(240, 320)):
+        """
+        Describes everything that determines the output, e.g. to invalidate caches of preprocessed frames. Besides the
+        settings, "probe" is a digest of the output for a fixed synthetic frame, so changes to the processing code or
+        to OpenCV's colour conversion, blur and resize are caught as well.
+        :param probe_size: (height, width) of the synthetic frame
+        :return: JSON serializable dictionary
+        """
+        h, w = probe_size
+        rows, columns = np.mgrid[0:h, 0:w]
+        probe = np.stack([rows * 7 + columns * 3, rows * 5 + columns * 11, rows * columns], axis=2) % 256
+
+        return {
+            "crop_top": self.crop_top,
+            "color_conversion": int(self.color_conversion),
+            "blur_kernel": list(self.blur_kernel),
+            "output_size": list(self.output_size),
+            "dtype": self.dtype.str,
+            "table": hashlib.sha1(self.table.tobytes()).hexdigest(),
+            "probe": hashlib.sha1(self.process(probe.astype(np.uint8)).tobytes()).hexdigest(),
+        }
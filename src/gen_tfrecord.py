@@ -6,6 +6,9 @@ python generate_tfrecord.py --label=<LABEL> --csv_input=<PATH_TO_ANNOTATIONS_FOL
 
 # Create test data:
 python generate_tfrecord.py --label=<LABEL> --csv_input=<PATH_TO_ANNOTATIONS_FOLDER>/test_labels.csv  --output_path=<PATH_TO_ANNOTATIONS_FOLDER>/test.record  --label_map <PATH_TO_ANNOTATIONS_FOLDER>/label_map.pbtxt
+
+# Create train data as 8 shards (train.record-00000-of-00008 ...) written by 4 processes:
+python generate_tfrecord.py --csv_input=<PATH_TO_ANNOTATIONS_FOLDER>/train_labels.csv  --output_path=<PATH_TO_ANNOTATIONS_FOLDER>/train.record  --label_map <PATH_TO_ANNOTATIONS_FOLDER>/label_map.pbtxt --num_shards 8 --num_workers 4
 """
 
 from __future__ import division
@@ -17,7 +20,7 @@ import io
 import pandas as pd
 import tensorflow as tf
 import sys
-
+import multiprocessing
 
 from PIL import Image
 from object_detection.utils import dataset_util
@@ -36,11 +39,16 @@ flags.DEFINE_string(
 # flags.DEFINE_string('label1', '', 'Name of class[1] label')
 # and so on.
 flags.DEFINE_string("img_path", "", "Path to images")
+flags.DEFINE_integer("num_shards", 1, "Number of output shards, a single TFRecord when 1")
+flags.DEFINE_integer("num_workers", 1, "Number of processes writing shards")
 FLAGS = flags.FLAGS
 
 
+# Module level so groups can be pickled to the shard writers
+data = namedtuple("data", ["filename", "object"])
+
+
 def split(df, group):
-    data = namedtuple("data", ["filename", "object"])
     gb = df.groupby(group)
     return [
         data(filename, gb.get_group(x))
@@ -48,35 +56,35 @@ def split(df, group):
     ]
 
 
+def image_size(group, encoded_jpg):
+    """Returns (width, height) from the CSV columns written by xml_to_csv.py, or the image header when missing."""
+    objects = group.object
+    if "width" in objects and "height" in objects:
+        return int(objects["width"].iloc[0]), int(objects["height"].iloc[0])
+    # Image.open only parses the header, the pixels are never decoded
+    return Image.open(io.BytesIO(encoded_jpg)).size
+
+
 def create_tf_example(group, path, label_map):
     with tf.compat.v1.gfile.GFile(os.path.join(path, "{}".format(group.filename)),
                         "rb") as fid:
         encoded_jpg = fid.read()
-    encoded_jpg_io = io.BytesIO(encoded_jpg)
-    image = Image.open(encoded_jpg_io)
-    width, height = image.size
+    width, height = image_size(group, encoded_jpg)
 
     filename = group.filename.encode("utf8")
     image_format = b"jpg"
     # check if the image format is matching with your images.
-    xmins = []
-    xmaxs = []
-    ymins = []
-    ymaxs = []
-    classes_text = []
-    classes = []
-
-    for index, row in group.object.iterrows():
-        xmins.append(row["xmin"] / width)
-        xmaxs.append(row["xmax"] / width)
-        ymins.append(row["ymin"] / height)
-        ymaxs.append(row["ymax"] / height)
-        classes_text.append(row["class"].encode("utf8"))
-        class_index = label_map.get(row["class"])
-        assert (class_index is not None
-                ), "class label: `{}` not found in label_map: {}".format(
-                    row["class"], label_map)
-        classes.append(class_index)
+    objects = group.object
+    xmins = (objects["xmin"] / width).tolist()
+    xmaxs = (objects["xmax"] / width).tolist()
+    ymins = (objects["ymin"] / height).tolist()
+    ymaxs = (objects["ymax"] / height).tolist()
+    classes_text = [class_name.encode("utf8") for class_name in objects["class"]]
+    class_indices = objects["class"].map(label_map)
+    missing = objects["class"][class_indices.isnull()]
+    assert missing.empty, "class label: `{}` not found in label_map: {}".format(
+        missing.iloc[0] if not missing.empty else None, label_map)
+    classes = class_indices.astype(int).tolist()
 
     tf_example = tf.train.Example(features=tf.train.Features(
         feature={
@@ -108,8 +116,22 @@ def create_tf_example(group, path, label_map):
     return tf_example
 
 
+def shard_path(output_path, shard, num_shards):
+    return "{}-{:05d}-of-{:05d}".format(output_path, shard, num_shards)
+
+
+def write_shard(args):
+    """Writes every num_shards-th group, starting at group `shard`, to its own TFRecord."""
+    output_path, shard, num_shards, groups, path, label_map = args
+    writer = tf.python_io.TFRecordWriter(shard_path(output_path, shard, num_shards))
+    for group in groups:
+        tf_example = create_tf_example(group, path, label_map)
+        writer.write(tf_example.SerializeToString())
+    writer.close()
+    return len(groups)
+
+
 def main(_):
-    writer = tf.python_io.TFRecordWriter(FLAGS.output_path)
     path = os.path.join(os.getcwd(), FLAGS.img_path)
     examples = pd.read_csv(FLAGS.csv_input)
 
@@ -125,13 +147,29 @@ def main(_):
         label_map[v.get("name")] = v.get("id")
 
     grouped = split(examples, "filename")
-    for group in grouped:
-        tf_example = create_tf_example(group, path, label_map)
-        writer.write(tf_example.SerializeToString())
+    if FLAGS.num_shards <= 1:
+        writer = tf.python_io.TFRecordWriter(FLAGS.output_path)
+        for group in grouped:
+            tf_example = create_tf_example(group, path, label_map)
+            writer.write(tf_example.SerializeToString())
+        writer.close()
+        output_path = os.path.join(os.getcwd(), FLAGS.output_path)
+        print("Successfully created the TFRecords: {}".format(output_path))
+        return
+
+    num_shards = FLAGS.num_shards
+    tasks = [(FLAGS.output_path, shard, num_shards, grouped[shard::num_shards], path, label_map)
+             for shard in range(num_shards)]
+    if FLAGS.num_workers > 1:
+        # TensorFlow is not fork-safe, so the workers are spawned
+        with multiprocessing.get_context("spawn").Pool(FLAGS.num_workers) as pool:
+            counts = pool.map(write_shard, tasks, chunksize=1)
+    else:
+        counts = [write_shard(task) for task in tasks]
 
-    writer.close()
     output_path = os.path.join(os.getcwd(), FLAGS.output_path)
-    print("Successfully created the TFRecords: {}".format(output_path))
+    print("Successfully created {} TFRecord shards with {} examples: {}-?????-of-{:05d}".format(
+        num_shards, sum(counts), output_path, num_shards))
 
 
 if __name__ == "__main__":
@@ -1,5 +1,24 @@
+"""
+Usage:
+
+# Label every frame of a video and save it as [filename]_[frame no.]_[label].png:
+python gen_training_data.py <VIDEO>
+
+# Label many videos in parallel and write compact shards instead (re-run the same command to resume):
+python gen_training_data.py <VIDEO> [<VIDEO> ...] --shards <SHARD_DIR> -j 4
+
+# Expand shards into the same .png files the first command produces:
+python gen_training_data.py --shards <SHARD_DIR> --export-png
+"""
+
+import os
+import csv
+import glob
+import hashlib
+import argparse
+from multiprocessing import Pool
 import cv2
-import sys
+import numpy as np
 from lane_navigation import LaneKeepAssistSystem
 
 def extract_frame_and_steering_angle(file):
@@ -7,7 +26,7 @@ def extract_frame_and_steering_angle(file):
     Script creates training data by breaking down a .avi video file into frames and then determining the steering angle of a given frame using the hand-coded LKAS system exclusively written in OpenCV. Saves result as .png file with label (steering angle) as part of the file nname: [filename]_[frame no.]_[label].png
     """
 
-    lane_tracker = LaneKeepAssistSystem()
+    lane_tracker = LaneKeepAssistSystem(headless=True)
     video_stream  = cv2.VideoCapture(file)
 
     try:
@@ -24,7 +43,221 @@ def extract_frame_and_steering_angle(file):
         video_stream.release()
         cv2.destroyAllWindows()
 
-if __name__ == '__main__':
-    extract_frame_and_steering_angle(sys.argv[1])
+
+def shard_paths(shard_dir, file, start):
+    """
+    Paths of the frame array and label file of the shard holding the frames of a video from frame `start`. Shards
+    are named after the video and a hash of its absolute path, so videos with the same name in different directories
+    do not overwrite each other's shards.
+    """
+    digest = hashlib.sha1(os.path.abspath(file).encode("utf-8")).hexdigest()[:8]
+    name = "%s-%s-%07d" % (os.path.basename(file), digest, start)
+    return os.path.join(shard_dir, name + ".frames.npy"), os.path.join(shard_dir, name + ".labels.npz")
+
+
+def label_frames(file, start, end, warmup=0, initial_angle=90):
+    """
+    Runs the OpenCV LKAS over a range of frames of a video. The steering angle of a frame depends on the angles
+    before it (see LaneKeepAssistSystem.stabilize), so the range is preceded by `warmup` frames that are labelled
+    but not kept. Frames before the range are skipped by decoding them: seeking with CAP_PROP_POS_FRAMES is not frame
+    accurate on XVID AVI files and can land on a different frame than a sequential read.
+    :param file: Video file
+    :param start: First frame to keep
+    :param end: Frame to stop at, None to read until the end of the video
+    :param warmup: Number of frames before `start` to run through the LKAS first
+    :param initial_angle: Steering angle the LKAS starts with
+    :return: Labels of the warm-up frames, kept frames and their labels
+    """
+    lane_tracker = LaneKeepAssistSystem(headless=True)
+    lane_tracker.current_steering_angle = initial_angle
+    video_stream = cv2.VideoCapture(file)
+
+    first = max(0, start - warmup)
+
+    warmup_labels = []
+    frames = []
+    labels = []
+    try:
+        i = 0
+        while i < first and video_stream.grab():
+            i += 1
+        while end is None or i < end:
+            grabbed, frame = video_stream.read()
+            if not grabbed:
+                break
+
+            lane_tracker.drive_within_lanes(frame)
+            if i < start:
+                warmup_labels.append(lane_tracker.current_steering_angle)
+            else:
+                frames.append(frame)
+                labels.append(lane_tracker.current_steering_angle)
+            i += 1
+    finally:
+        video_stream.release()
+
+    return warmup_labels, frames, labels
+
+
+def write_shard(shard_dir, file, start, warmup=0, initial_angle=90, end=None):
+    """
+    Labels a range of frames and writes them as one shard: an (N, H, W, 3) uint8 frame array and a label file with
+    the frame numbers, steering angles and warm-up angles. The label file is written last, so a shard whose label
+    file exists is complete.
+    :return: (file, start, labels, warmup labels)
+    """
+    warmup_labels, frames, labels = label_frames(file, start, end, warmup, initial_angle)
+    if start > 0 and not warmup_labels:
+        # The range was labelled from a known angle, store it as the angle before the range
+        warmup_labels = [initial_angle]
+
+    frames_path, labels_path = shard_paths(shard_dir, file, start)
+
+    if frames:
+        with open(frames_path + ".tmp", "wb") as f:
+            np.save(f, np.stack(frames))
+        os.replace(frames_path + ".tmp", frames_path)
+
+    with open(labels_path + ".tmp", "wb") as f:
+        np.savez(f,
+                 video=np.array(file),
+                 frame_numbers=np.arange(start, start + len(labels), dtype=np.int64),
+                 steering_angles=np.array(labels, np.int16),
+                 warmup_angles=np.array(warmup_labels, np.int16))
+    os.replace(labels_path + ".tmp", labels_path)
+
+    return file, start, labels, warmup_labels
+
+
+def _write_shard(args):
+    return write_shard(*args)
 
 
+def read_labels(labels_path):
+    """
+    :return: Steering angles and warm-up angles stored in a shard label file
+    """
+    with np.load(labels_path) as labels:
+        return labels["steering_angles"].tolist(), labels["warmup_angles"].tolist()
+
+
+def extract_shards(files, shard_dir, workers=4, chunk_frames=500, warmup=60):
+    """
+    Labels videos in parallel. Every video is split into ranges of `chunk_frames` frames that are labelled by a pool
+    of processes and written as shards. Shards that already exist are skipped, so an interrupted job resumes where it
+    stopped.
+
+    Each range after the first starts from a guessed steering angle and runs `warmup` frames first. Once the angle at
+    the end of the warm-up equals the angle the previous range ended with, every following label is identical to a
+    sequential run. Ranges where they differ are relabelled sequentially, starting from the previous range's angle, so
+    the labels always match extract_frame_and_steering_angle().
+    :param files: Video files
+    :param shard_dir: Output directory
+    :param workers: Number of processes
+    :param chunk_frames: Frames per shard
+    :param warmup: Frames labelled before each range to recover the steering state, at least 1
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    warmup = max(1, warmup)
+
+    ranges = {}
+    pending = []
+    for file in files:
+        video_stream = cv2.VideoCapture(file)
+        frame_count = int(video_stream.get(cv2.CAP_PROP_FRAME_COUNT))
+        video_stream.release()
+
+        starts = list(range(0, max(frame_count, 1), chunk_frames))
+        ranges[file] = starts
+        for index, start in enumerate(starts):
+            # The last range reads until the end of the video in case the frame count is an estimate
+            end = starts[index + 1] if index + 1 < len(starts) else None
+            if not os.path.exists(shard_paths(shard_dir, file, start)[1]):
+                pending.append((shard_dir, file, start, warmup if start > 0 else 0, 90, end))
+
+    print("Labelling %d of %d shards with %d workers" % (len(pending), sum(map(len, ranges.values())), workers))
+    with Pool(workers) as pool:
+        for file, start, labels, _ in pool.imap_unordered(_write_shard, pending):
+            print("%s: frames %d-%d labelled" % (file, start, start + len(labels)))
+
+    # Verify that every range continues from the steering angle the previous range ended with
+    for file, starts in ranges.items():
+        previous_labels = []
+        for index, start in enumerate(starts):
+            labels, warmup_labels = read_labels(shard_paths(shard_dir, file, start)[1])
+            if previous_labels and warmup_labels[-1:] != previous_labels[-1:]:
+                print("%s: relabelling frames from %d sequentially" % (file, start))
+                end = starts[index + 1] if index + 1 < len(starts) else None
+                _, _, labels, _ = write_shard(shard_dir, file, start, 0, previous_labels[-1], end)
+
+            if labels:
+                previous_labels = labels
+
+    write_index(shard_dir)
+
+
+def iter_shards(shard_dir):
+    """
+    Iterates over the labelled frames stored in a shard directory. Frame arrays are memory-mapped.
+    :return: Generator of (video, frame number, steering angle, frame)
+    """
+    for labels_path in sorted(glob.glob(os.path.join(shard_dir, "*.labels.npz"))):
+        with np.load(labels_path) as labels:
+            video = str(labels["video"])
+            frame_numbers = labels["frame_numbers"]
+            steering_angles = labels["steering_angles"]
+
+        if len(frame_numbers) == 0:
+            continue
+
+        frames = np.load(labels_path[:-len(".labels.npz")] + ".frames.npy", mmap_mode="r")
+        for frame_number, steering_angle, frame in zip(frame_numbers, steering_angles, frames):
+            yield video, int(frame_number), int(steering_angle), frame
+
+
+def write_index(shard_dir):
+    """
+    Writes index.csv listing the video, frame number, steering angle, shard and offset of every labelled frame
+    """
+    with open(os.path.join(shard_dir, "index.csv"), "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["video", "frame", "steering_angle", "shard", "offset"])
+        for labels_path in sorted(glob.glob(os.path.join(shard_dir, "*.labels.npz"))):
+            shard = os.path.basename(labels_path)[:-len(".labels.npz")] + ".frames.npy"
+            with np.load(labels_path) as labels:
+                video = str(labels["video"])
+                for offset, (frame_number, steering_angle) in enumerate(
+                        zip(labels["frame_numbers"], labels["steering_angles"])):
+                    writer.writerow([video, frame_number, steering_angle, shard, offset])
+
+
+def export_png(shard_dir):
+    """
+    Writes every frame stored in the shards as [filename]_[frame no.]_[label].png, like
+    extract_frame_and_steering_angle()
+    """
+    for video, frame_number, steering_angle, frame in iter_shards(shard_dir):
+        cv2.imwrite("%s_%03d_%03d.png" % (video, frame_number, steering_angle), np.asarray(frame))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Label video frames with the OpenCV LKAS steering angle")
+    parser.add_argument("videos", nargs="*", help="Videos recorded by Herbie")
+    parser.add_argument("--shards", type=str, default="", help="Write compact shards to this directory")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="Number of processes")
+    parser.add_argument("--chunk-frames", type=int, default=500, help="Frames per shard")
+    parser.add_argument("--warmup", type=int, default=60, help="Frames used to recover the steering state")
+    parser.add_argument("--export-png", action="store_true", help="Expand the shards into .png files")
+    args = parser.parse_args()
+
+    if args.shards and args.export_png:
+        export_png(args.shards)
+    elif args.shards:
+        extract_shards(args.videos, args.shards, args.workers, args.chunk_frames, args.warmup)
+    else:
+        for video in args.videos:
+            extract_frame_and_steering_angle(video)
+
+
+if __name__ == '__main__':
+    main()
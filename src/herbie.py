@@ -10,14 +10,49 @@
 # conda_version   :4.8.3
 # =================================================================================================================
 
+import os
 import logging
 import picar
 import cv2
 import datetime
+import time
+import argparse
+import signal
+import multiprocessing
+from functools import partial
+from camera_capture import CameraCapture
+from flight_recorder import FlightRecorder
+from event_recorder import EventRecorder, NO_LANES, STEERING_CLAMP, MANUAL, DETECTION
+from video_recorder import VideoRecorder, DROP_OLDEST
+from control_scheduler import ControlLoopScheduler
+from traffic_detection import TrafficObjectDetector, Detections
+from lkas_backends import BACKENDS, BackgroundLoader, peak_rss_mb
 from lane_navigation import *
-from dl_lkas import *
 
 _DISPLAY_IMAGE = True
+_RECORD_VIDEO = True
+_RECORDING_MODE = 'events'  # 'full' records every frame of all streams, 'events' only clips around triggers
+_EVENT_PRE_SECONDS = 5.0  # Raw video kept in memory and written when an event triggers
+_EVENT_POST_SECONDS = 5.0  # Raw video written after the last trigger of a clip
+_EVENT_MIN_FRAMES = {NO_LANES: 3, STEERING_CLAMP: 5}  # Consecutive frames a condition must hold to trigger
+_EVENT_KEY = 'e'  # Display key that triggers a clip, `kill -USR1 <pid>` does the same when headless
+_STATS_INTERVAL = 100  # Frames between capture/processing FPS reports
+_PROFILE_PIPELINE = False  # Collect per-stage lane pipeline latencies, dumped on exit
+_CONTROL_RATE = 20.0  # Target steering updates per second
+_FRAME_DEADLINE = 0.1  # Maximum age (seconds) of a frame when steering from it
+_LANE_PARAMS = '/home/pi/Herbie/data/lane_params.json'  # Lane detection config written by autotune.py, if present
+_PROCESSING_SCALE = 1.0  # Lane detection resolution relative to the camera frame, e.g. 0.5 or 0.25
+_LANE_BUDGET = None  # Lane detection time budget (seconds), lowers the processing scale under CPU pressure when set
+_TRACK_LANES = False  # Search near the previous frame's lanes instead of running full detection every frame
+_LKAS_BACKEND = 'opencv'  # Lane keeping backend from lkas_backends.BACKENDS, e.g. 'dl_tflite'
+_DL_LKAS_MODEL = '/home/pi/Herbie/ml_models/lane_keep_assist_system/trained_models/DL_LKAS_FINAL.h5'
+_DETECTION_MODEL = '/home/pi/Herbie/ml_models/object_detection/road_signs_quantized.tflite'
+_DETECTION_LABEL_MAP = '/home/pi/Herbie/ml_models/object_detection/label_map.pbtxt'
+_DETECTION_RATE = 5.0  # Traffic object detections per second, runs only when the model exists
+_FRAME_BUS = False  # Run raw video recording and traffic detection in their own processes fed by a shared-memory bus
+_FRAME_BUS_SLOTS = 8
+_FLIGHT_RECORDER = True  # Per-frame telemetry (steering, lanes, timestamps) in a binary ring file, see flight_recorder.py
+_FLIGHT_RECORDER_CAPACITY = 72000  # Records kept, one hour at 20 frames per second
 
 
 class Herbie(object):
@@ -28,18 +63,34 @@ class Herbie(object):
     __SCREEN_WIDTH = 320
     __SCREEN_HEIGHT = 240
 
-    def __init__(self):
+    def __init__(self, backend=_LKAS_BACKEND, ml_model_path=_DL_LKAS_MODEL):
         """
         Starts and calibrates PiCar's servos
+        :param backend: Lane keeping backend, see lkas_backends.BACKENDS
+        :param ml_model_path: Keras .h5 model of the Deep Learning backends
         """
         logging.info('Configuring Herbie')
+        self.startup_time = time.perf_counter()
+        self.startup_report = None
+
+        if os.path.exists(_LANE_PARAMS):
+            logging.info('Loading lane detection parameters %s' % _LANE_PARAMS)
+            load_lane_parameters(_LANE_PARAMS)
+
+        # Overlays are rendered on demand in drive_car(), only when displayed or recorded. The backend and its
+        # model load on a background thread while the hardware below is set up and calibrated.
+        if BACKENDS[backend][0] == 'lane_navigation':
+            options = dict(scale=_PROCESSING_SCALE, frame_budget=_LANE_BUDGET)
+            if _TRACK_LANES:
+                options['tracking'] = True
+        else:
+            options = dict(ml_model_path=ml_model_path)
+        self.backend_loader = BackgroundLoader(backend, self, headless=True, **options)
 
         picar.setup()
 
         logging.debug('Configuring Camera')
-        self.camera = cv2.VideoCapture(-1)
-        self.camera.set(3, self.__SCREEN_WIDTH)
-        self.camera.set(4, self.__SCREEN_HEIGHT)
+        self.camera = CameraCapture(-1, self.__SCREEN_WIDTH, self.__SCREEN_HEIGHT)
 
         self.pan_servo = picar.Servo.Servo(1, bus_number=1)
         self.pan_servo.offset = -30  # calibrate servo to center
@@ -58,19 +109,71 @@ class Herbie(object):
         self.front_wheels.turning_offset = -25  # calibrate servo to center
         self.front_wheels.turn(90)  # Steering Range is 45 (left) - 90 (center) - 135 (right)
 
-        self.lane_follower = LaneKeepAssistSystem(self)
-        #self.lane_follower = DeepLearningLKAS(self)
+        if _PROFILE_PIPELINE:
+            PROFILER.enable('../data/tmp/lane_pipeline_latency.json')
 
-        self.fourcc = cv2.VideoWriter_fourcc(*'XVID')
+        detect = os.path.exists(_DETECTION_MODEL)
         datestr = datetime.datetime.now().strftime("%y%m%d_%H%M%S")
-        self.video_orig = self.create_video_recorder('../data/tmp/car_video%s.avi' % datestr)
-        self.video_lane = self.create_video_recorder('../data/tmp/car_video_lane%s.avi' % datestr)
-        self.video_objs = self.create_video_recorder('../data/tmp/car_video_objs%s.avi' % datestr)
+        self.fourcc = cv2.VideoWriter_fourcc(*'XVID')
 
+        self.detector = None
+        if detect and not _FRAME_BUS:
+            try:
+                self.detector = TrafficObjectDetector(_DETECTION_MODEL, _DETECTION_LABEL_MAP, _DETECTION_RATE)
+            except ImportError as e:
+                logging.warning('Traffic object detection disabled, no TF Lite interpreter (%s)' % e)
+
+        self.flight_recorder = None
+        if _FLIGHT_RECORDER:
+            self.flight_recorder = FlightRecorder('../data/tmp/flight%s.bin' % datestr, _FLIGHT_RECORDER_CAPACITY)
+
+        record_full = _RECORD_VIDEO and _RECORDING_MODE == 'full'
+        self.video_orig = self.video_lane = self.video_objs = None
+        if record_full:
+            self.video_lane = self.create_video_recorder('../data/tmp/car_video_lane%s.avi' % datestr)
+            if not _FRAME_BUS:
+                self.video_orig = self.create_video_recorder('../data/tmp/car_video%s.avi' % datestr)
+                self.video_objs = self.create_video_recorder('../data/tmp/car_video_objs%s.avi' % datestr)
+
+        # Event mode keeps recent raw frames in memory and only encodes clips around triggers
+        self.event_recorder = None
+        self.manual_event = False
+        self.last_detection = 0.0
+        if _RECORD_VIDEO and _RECORDING_MODE == 'events':
+            self.event_recorder = EventRecorder('../data/tmp', self.fourcc, _CONTROL_RATE,
+                                                (self.__SCREEN_WIDTH, self.__SCREEN_HEIGHT), _EVENT_PRE_SECONDS,
+                                                _EVENT_POST_SECONDS, min_frames=_EVENT_MIN_FRAMES)
+            if hasattr(signal, 'SIGUSR1'):
+                signal.signal(signal.SIGUSR1, self.request_event)
+
+        # Raw recording and detection as consumer processes of the frame bus, off the steering process's GIL
+        self.frame_bus = None
+        self.bus_consumers = []
+        self.bus_detection = None
+        if _FRAME_BUS:
+            # Needs multiprocessing.shared_memory (Python 3.8+), only imported when the bus is enabled
+            from frame_bus import FrameBus, FrameBusConsumer
+            self.frame_bus = FrameBus.create((self.__SCREEN_HEIGHT, self.__SCREEN_WIDTH, 3), _FRAME_BUS_SLOTS)
+            frame_size = (self.__SCREEN_WIDTH, self.__SCREEN_HEIGHT)
+            if record_full:
+                self.bus_consumers.append(FrameBusConsumer(
+                    self.frame_bus.name, len(self.bus_consumers),
+                    partial(RecordingHandler, '../data/tmp/car_video%s.avi' % datestr, frame_size), every_frame=True,
+                    copy=True))
+            if detect:
+                objects_path = '../data/tmp/car_video_objs%s.avi' % datestr if record_full else None
+                # Timestamp of the consumer's latest detection run that found objects, for the DETECTION event trigger
+                self.bus_detection = multiprocessing.Value('d', 0.0, lock=False)
+                self.bus_consumers.append(FrameBusConsumer(
+                    self.frame_bus.name, len(self.bus_consumers),
+                    partial(DetectionHandler, objects_path, frame_size, detected=self.bus_detection), copy=True))
+
+        self.calibration_seconds = time.perf_counter() - self.startup_time
+        self.lane_follower = self.backend_loader.result()
         logging.info('Herbie Configuration Complete')
 
-    def create_video_recorder(self, path):
-        return cv2.VideoWriter(path, self.fourcc, 20.0, (self.__SCREEN_WIDTH, self.__SCREEN_HEIGHT))
+    def create_video_recorder(self, path, policy=DROP_OLDEST):
+        return VideoRecorder(path, self.fourcc, 20.0, (self.__SCREEN_WIDTH, self.__SCREEN_HEIGHT), policy=policy)
 
     def __enter__(self):
         """ Entering a with statement """
@@ -90,9 +193,27 @@ class Herbie(object):
         self.rear_wheels.speed = 0
         self.front_wheels.turn(90)
         self.camera.release()
-        self.video_orig.release()
-        self.video_lane.release()
-        self.video_objs.release()
+        self.camera.log_stats()
+        if self.detector is not None:
+            self.detector.stop()
+            self.detector.log_stats()
+        if self.frame_bus is not None:
+            self.frame_bus.log_stats()
+            for consumer in self.bus_consumers:
+                consumer.stop()
+            self.frame_bus.close()
+            self.frame_bus = None
+        if self.event_recorder is not None:
+            self.event_recorder.release()
+            self.event_recorder.log_stats()
+            self.event_recorder = None
+        if self.flight_recorder is not None:
+            self.flight_recorder.log_stats()
+            self.flight_recorder.close()
+            self.flight_recorder = None
+        for video in (self.video_orig, self.video_lane, self.video_objs):
+            if video is not None:
+                video.release()
         cv2.destroyAllWindows()
 
     def drive_car(self, speed=__STARTING_SPEED):
@@ -105,25 +226,192 @@ class Herbie(object):
         logging.info('Starting to drive at speed %s...' % speed)
         self.rear_wheels.forward()
         self.rear_wheels.speed = speed
+        self.camera.start()
+        if self.detector is not None:
+            self.detector.start()
+        for consumer in self.bus_consumers:
+            consumer.start()
+        scheduler = ControlLoopScheduler(_CONTROL_RATE, _FRAME_DEADLINE)
         i = 0
-        while self.camera.isOpened():
-            _, image_lane = self.camera.read()
-            image_objs = image_lane.copy()
+        while self.camera.is_opened():
+            scheduler.wait_for_tick()
+            grabbed, image_lane = self.camera.read()
+            if not grabbed:
+                scheduler.skip_tick()
+                continue
+
+            # Skip frames that are too old to steer from
+            if scheduler.is_stale(self.camera.frame_timestamp):
+                scheduler.skip_tick()
+                continue
+
             i += 1
-            self.video_orig.write(image_lane)
+            if i % _STATS_INTERVAL == 0:
+                self.camera.log_stats()
+                scheduler.log_stats()
+                if getattr(self.lane_follower, 'lane_tracker', None) is not None:
+                    self.lane_follower.lane_tracker.log_stats()
+                if getattr(self.lane_follower, 'resolution_controller', None) is not None:
+                    self.lane_follower.resolution_controller.log_stats()
+                if self.detector is not None:
+                    self.detector.log_stats()
+                if self.frame_bus is not None:
+                    self.frame_bus.log_stats()
+
+            scheduler.run('steer', self.lane_follower.drive_within_lanes, image_lane)
+            scheduler.mark_steered(self.camera.frame_timestamp)
+            if self.flight_recorder is not None:
+                self.flight_recorder.append_lane_follower(self.lane_follower, self.camera.frame_timestamp)
+            if self.startup_report is None:
+                self.log_startup()
+            if self.detector is not None:
+                self.detector.submit(image_lane, self.camera.frame_timestamp)
+            if self.frame_bus is not None:
+                scheduler.run('publish', self.frame_bus.publish, image_lane, self.camera.frame_timestamp)
+            if self.event_recorder is not None:
+                scheduler.run('buffer', self.event_recorder.write, image_lane)
+                self.check_events()
+
+            # Non-critical work in priority order, the last tasks are shed first under load
+            if self.video_orig is not None:
+                scheduler.run_optional('record', self.video_orig.write, image_lane)
+                if self.detector is not None:
+                    scheduler.run_optional('record_objects', self.record_objects, image_lane)
+            if self.video_lane is not None or _DISPLAY_IMAGE:
+                image_overlay = scheduler.run_optional('overlay', self.lane_follower.render_overlay, image_lane)
+                if image_overlay is not None:
+                    if self.video_lane is not None:
+                        self.video_lane.write(image_overlay)
+                    scheduler.run_optional('display', self.show_frames, image_lane, image_overlay)
+            scheduler.end_tick()
+
+            if _DISPLAY_IMAGE:
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord(_EVENT_KEY):
+                    self.manual_event = True
+                elif key == ord('q'):
+                    self.cleanup()
+                    break
+
+        scheduler.log_stats()
+
+    def check_events(self):
+        """
+        Triggers the event recorder on lane keeping events of the last frame, new traffic object detections and
+        manual requests
+        """
+        events = getattr(self.lane_follower, 'events', 0)
+        self.event_recorder.check(NO_LANES, events & EVENT_NO_LANES)
+        self.event_recorder.check(STEERING_CLAMP, events & EVENT_STEERING_CLAMPED)
+
+        if self.detector is not None:
+            detections = self.detector.latest()
+            if detections.timestamp != self.last_detection and len(detections.objects) > 0:
+                self.event_recorder.trigger(DETECTION)
+            self.last_detection = detections.timestamp
+        elif self.bus_detection is not None:
+            # Detection runs in a frame bus consumer, which only publishes runs that found objects
+            timestamp = self.bus_detection.value
+            if timestamp != self.last_detection:
+                self.event_recorder.trigger(DETECTION)
+            self.last_detection = timestamp
+
+        if self.manual_event:
+            self.manual_event = False
+            self.event_recorder.trigger(MANUAL)
+
+    def request_event(self, signum=None, frame=None):
+        """
+        Requests a clip on the next frame, also the SIGUSR1 handler
+        """
+        self.manual_event = True
 
-            show_image("TEST:", image_objs)
-            image_lane = self.drive_inside_lanes(image_lane)
-            self.video_lane.write(image_lane)
-            show_image('Lane Lines', image_lane)
+    def log_startup(self):
+        """
+        Logs how long the car took from construction to its first steering decision and the peak memory so far
+        """
+        loader = self.backend_loader
+        self.startup_report = {
+            'backend': loader.name,
+            'load_seconds': loader.load_seconds,
+            'calibration_seconds': self.calibration_seconds,
+            'wait_seconds': loader.wait_seconds,
+            'time_to_first_steer_seconds': time.perf_counter() - self.startup_time,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        logging.info('Startup (%s backend): load %.2f s, calibration %.2f s, waited %.2f s for the backend, '
+                     'first steer after %.2f s, peak RSS %.0f MB' % (
+                         loader.name, loader.load_seconds, self.calibration_seconds, loader.wait_seconds,
+                         self.startup_report['time_to_first_steer_seconds'], self.startup_report['peak_rss_mb']))
+
+    def record_objects(self, image):
+        self.video_objs.write(self.detector.annotate(image))
+
+    def show_frames(self, image, image_overlay):
+        show_image("TEST:", image)
+        show_image('Lane Lines', image_overlay)
+
+
+class RecordingHandler(object):
+    """
+    Frame bus handler that writes every frame to a video file from its own process. Its consumer copies frames out of
+    the bus (copy=True), so frames rewritten by the producer mid-read are dropped instead of recorded torn.
+    """
+
+    def __init__(self, path, frame_size, fps=20.0):
+        self.video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'XVID'), fps, frame_size)
+
+    def __call__(self, frame, frame_timestamp):
+        self.video.write(frame)
 
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                self.cleanup()
-                break
+    def close(self):
+        self.video.release()
 
-    def drive_inside_lanes(self, image):
-        image = self.lane_follower.drive_within_lanes(image)
-        return image
+
+class DetectionHandler(object):
+    """
+    Frame bus handler that runs traffic object detection at _DETECTION_RATE on the newest frame and optionally records
+    the annotated frames
+    """
+
+    def __init__(self, path, frame_size, fps=20.0, detected=None):
+        """
+        Constructor
+        :param path: Video file of the annotated frames, None to not record them
+        :param frame_size: (width, height) of the frames
+        :param fps: Frame rate of the video
+        :param detected: Shared multiprocessing.Value set to the timestamp of every detection run that finds objects
+        """
+        self.detected = detected
+        self.detector = None
+        self.video = None
+        self.next_run = 0.0
+        try:
+            self.detector = TrafficObjectDetector(_DETECTION_MODEL, _DETECTION_LABEL_MAP, _DETECTION_RATE)
+        except ImportError as e:
+            logging.warning('Traffic object detection disabled, no TF Lite interpreter (%s)' % e)
+            return
+        self.video = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'XVID'), fps, frame_size) if path else None
+
+    def __call__(self, frame, frame_timestamp):
+        if self.detector is None:
+            return
+        now = time.perf_counter()
+        if now < self.next_run:
+            return
+        self.next_run = max(self.next_run + self.detector.period, now)
+
+        detections = Detections(time.perf_counter(), frame_timestamp, self.detector.detect(frame))
+        if self.detected is not None and len(detections.objects) > 0:
+            self.detected.value = detections.timestamp
+        if self.video is not None:
+            self.video.write(self.detector.annotate(frame, detections))
+
+    def close(self):
+        if self.detector is not None:
+            self.detector.log_stats()
+        if self.video is not None:
+            self.video.release()
 
 
 ############################
@@ -137,8 +425,15 @@ def show_image(title, frame, show=_DISPLAY_IMAGE):
 
 
 def main():
-    with Herbie() as car:
-        car.drive_car(40)
+    parser = argparse.ArgumentParser(description='Drive Herbie within the lanes')
+    parser.add_argument('--backend', type=str, default=_LKAS_BACKEND, choices=sorted(BACKENDS),
+                        help='Lane keeping backend, Deep Learning backends load TensorFlow')
+    parser.add_argument('--model', type=str, default=_DL_LKAS_MODEL, help='Keras .h5 model of the Deep Learning backends')
+    parser.add_argument('--speed', type=int, default=40, help='Rear wheel speed, 0 (stop) - 100 (fastest)')
+    args = parser.parse_args()
+
+    with Herbie(args.backend, args.model) as car:
+        car.drive_car(args.speed)
 
 
 if __name__ == '__main__':
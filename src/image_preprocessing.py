@@ -14,8 +14,80 @@ import cv2
 import numpy as np
 import sys
 import math
+import json
+from functools import lru_cache
+from latency_profiler import LatencyProfiler
 
 DISPLAY_IMAGE = False
+# Lane endpoints closer than this to a whole pixel are recomputed with np.polyfit (see average_lane())
+_ENDPOINT_TOLERANCE = 1e-6
+
+# HSV range of the blue lane tape
+LANE_COLOR_LOWER = (30, 40, 0)
+LANE_COLOR_UPPER = (150, 255, 255)
+
+# Lanes are only searched for below this fraction of the frame height (default of LANE_PARAMS["roi_top"])
+ROI_TOP = 1 / 2
+# Rows kept above the region of interest so Canny finds the same edges along the ROI's top edge. Two rows cover the
+# Sobel and non-maximum suppression support. The rest bound hysteresis, which can follow weak edges across the top of
+# the crop once canny_high exceeds 510, the smallest Sobel response of an edge in the binary colour mask.
+# Check with: python benchmarks.py roi_crop --video <VIDEO>
+_ROI_MARGIN = 8
+
+# Canny, Hough, lane classification and region of interest settings. autotune.py searches them on recorded drives and
+# writes a config file that load_lane_parameters() applies at runtime.
+DEFAULT_LANE_PARAMS = {
+    "canny_low": 200,
+    "canny_high": 400,
+    "hough_rho": 1,
+    "hough_theta_deg": 1.0,
+    "hough_threshold": 10,
+    "min_line_length": 8,
+    "max_line_gap": 4,
+    "lane_boundary": 1 / 3,
+    "roi_top": ROI_TOP,
+}
+LANE_PARAMS = dict(DEFAULT_LANE_PARAMS)
+
+# Per-stage timers of the lane detection pipeline. Disabled by default, call PROFILER.enable() to collect timings.
+PROFILER = LatencyProfiler("lane_pipeline")
+
+
+def set_lane_parameters(**params):
+    """
+    Overrides lane detection parameters, see DEFAULT_LANE_PARAMS for the names
+    :return: Current lane detection parameters
+    """
+    unknown = set(params) - set(DEFAULT_LANE_PARAMS)
+    if unknown:
+        raise ValueError("Unknown lane parameters: %s" % ", ".join(sorted(unknown)))
+
+    LANE_PARAMS.update(params)
+
+    return LANE_PARAMS
+
+
+def reset_lane_parameters():
+    """
+    Restores the default lane detection parameters
+    """
+    LANE_PARAMS.clear()
+    LANE_PARAMS.update(DEFAULT_LANE_PARAMS)
+
+
+def load_lane_parameters(path):
+    """
+    Loads lane detection parameters from a JSON file, e.g. one written by autotune.py. Parameters missing from the
+    file keep their default.
+    :param path: Path to the JSON config, either a flat object of parameters or one holding them under "params"
+    :return: Current lane detection parameters
+    """
+    with open(path) as f:
+        config = json.load(f)
+
+    reset_lane_parameters()
+
+    return set_lane_parameters(**config.get("params", config))
 
 
 def locate_edges(image):
@@ -27,56 +99,104 @@ def locate_edges(image):
     hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
 
     # Specifying Hue Range for Color Blue
-    lower_bound = np.array([30, 40, 0])
-    upper_bound = np.array([150, 255, 255])
+    lower_bound = np.array(LANE_COLOR_LOWER)
+    upper_bound = np.array(LANE_COLOR_UPPER)
 
     # We'll uses this mask in order to identify the lanes
     mask = cv2.inRange(hsv, lower_bound, upper_bound)
 
     # Find Edges in Image
-    edges = cv2.Canny(mask, 200, 400)
+    edges = cv2.Canny(mask, LANE_PARAMS["canny_low"], LANE_PARAMS["canny_high"])
 
     return edges
 
 
-def isolate_lane_edges(edges):
+def crop_region_of_interest(image):
     """
-    Isolates and returns an image with edges corresponding to lanes detected by camera
-    :param edges: Detected edges return by locate_edges()
-    :return: Edges only corresponding to lanes
+    Crops a frame to the region where driving lanes are located, so colour and edge detection only run on the
+    pixels that are kept by isolate_lane_edges(). The crop is a view, no pixels are copied.
+    :param image: Video frame retrieved from PiCamera
+    :return: Cropped frame and the row offset of the crop within the full frame
     """
-    # Capture Height & Width of Image
-    h, w = edges.shape
-    mask = np.zeros_like(edges)
+    h = image.shape[0]
+    y_offset = max(0, int(h * LANE_PARAMS["roi_top"]) - _ROI_MARGIN)
+
+    return image[y_offset:], y_offset
+
+
+@lru_cache(maxsize=8)
+def lane_region_mask(h, w, roi_top=ROI_TOP):
+    """
+    Builds the mask of the region where driving lanes are located. Masks are cached per resolution.
+    :param h: Frame height
+    :param w: Frame width
+    :param roi_top: Fraction of the frame height where the region of interest starts
+    :return: Shared mask (do not modify), 255 inside the region of interest and 0 elsewhere
+    """
+    mask = np.zeros((h, w), np.uint8)
 
     # Isolate Bottom Half of Screen (Where driving lanes are located)
-    polygon = np.array([[(0, h * 1 / 2), (w, h * 1 / 2), (w, h), (0, h)]], np.int32)
+    polygon = np.array([[(0, h * roi_top), (w, h * roi_top), (w, h), (0, h)]], np.int32)
     # Fill Mask With Polygon
     cv2.fillPoly(mask, polygon, 255)
 
+    return mask
+
+
+def isolate_lane_edges(edges, y_offset=0):
+    """
+    Isolates and returns an image with edges corresponding to lanes detected by camera
+    :param edges: Detected edges return by locate_edges()
+    :param y_offset: Row offset of the edges within the full frame when they were computed on a cropped frame
+    :return: Edges only corresponding to lanes, in a full frame sized image. The Hough transform bins lines by their
+    distance from the image origin, so it gets the same input as on an uncropped frame.
+    """
+    # Capture Height & Width of Image
+    h, w = edges.shape
+    mask = lane_region_mask(h + y_offset, w, LANE_PARAMS["roi_top"])
+
     # Extract isolated lane edges
-    isolated_edges = cv2.bitwise_and(edges, mask)
+    if not y_offset:
+        return cv2.bitwise_and(edges, mask)
+
+    isolated_edges = np.zeros((h + y_offset, w), np.uint8)
+    cv2.bitwise_and(edges, mask[y_offset:], dst=isolated_edges[y_offset:])
 
     return isolated_edges
 
 
-def locate_line_segments(isolated_edges):
+def locate_line_segments(isolated_edges, scale=1.0):
     """
     Extracts line segments from observed lane edges using Hough Line Transformations
     :param isolated_edges: Lane edges returned from isolated_lane_edges()
+    :param scale: Scale of the edges relative to the full frame. Lengths and the vote threshold, which are defined in
+    full frame pixels, are scaled with it.
     :return: Line segments extracted by HoughLinesP()
     """
-    rho = 1
-    theta = np.pi / 180
-    threshold = 10
-    min_line_length = 8
-    max_line_gap = 4
+    rho = LANE_PARAMS["hough_rho"]
+    theta = np.pi / 180 * LANE_PARAMS["hough_theta_deg"]
+    threshold = max(1, int(round(LANE_PARAMS["hough_threshold"] * scale)))
+    min_line_length = LANE_PARAMS["min_line_length"] * scale
+    max_line_gap = max(1, LANE_PARAMS["max_line_gap"] * scale)
 
     segments = cv2.HoughLinesP(isolated_edges, rho, theta, threshold, np.array([]), min_line_length, max_line_gap)
 
     return segments
 
 
+def scale_line_segments(segments, scale):
+    """
+    Maps line segments found on a downscaled frame back to full frame coordinates
+    :param segments: Line segments returned by locate_line_segments()
+    :param scale: Scale the segments were detected at
+    :return: Line segments in full frame coordinates
+    """
+    if segments is None or scale == 1.0:
+        return segments
+
+    return np.round(segments / scale).astype(segments.dtype)
+
+
 def generate_lanes(image, segments):
     """
     Classifies line segments extracted by locate_line_segments() as either the left line or right line of the lane
@@ -90,49 +210,108 @@ def generate_lanes(image, segments):
     if segments is None:
         return lanes
 
-    h, w, _ = image.shape
+    left_lane_avg, right_lane_avg = average_lane_segments(image, segments)
 
-    right_lane_segments = []
-    left_lane_segments = []
+    # Extract and store endpoints of line segments of left lane
+    if left_lane_avg is not None:
+        lanes.append(generate_endpoints(image, left_lane_avg))
+    # Same for Right Lane
+    if right_lane_avg is not None:
+        lanes.append(generate_endpoints(image, right_lane_avg))
+
+    return lanes
 
-    boundary = 1/3
+
+def average_lane_segments(image, segments, boundary=None):
+    """
+    Computes the slope and intercept of every line segment at once and averages them per lane. Segments with a
+    negative slope that lie in the left part of the frame belong to the left lane, the remaining segments that lie
+    in the right part of the frame belong to the right lane. Vertical segments are ignored. The lanes are the same as
+    those of the original loop that fitted every segment with np.polyfit.
+    :param image: Image frame retrieved from PiCamera video
+    :param segments: (N, 1, 4) array of line segments returned by locate_line_segments()
+    :param boundary: Fraction of the frame width on the opposite side that a lane's segments may not enter,
+    LANE_PARAMS["lane_boundary"] by default
+    :return: (slope, intercept) averages of the left and right lane, None for a lane without segments
+    """
+    if segments is None or len(segments) == 0:
+        return None, None
+
+    if boundary is None:
+        boundary = LANE_PARAMS["lane_boundary"]
+
+    _, w, _ = image.shape
 
     left_lane_boundary = w * (1 - boundary)
     right_lane_boundary = w * boundary
 
-    # Classify Slopes By Their Direction. Positive Slopes -> Left Lane Lines, Negative Slopes -> Right Lane Lines
-    for i in segments:
+    x0, y0, x1, y1 = segments.reshape(-1, 4).astype(np.float64).T
 
-        for x0, y0, x1, y1 in i:
+    # Point pairs with x0 == x1 trace a vertical line
+    not_vertical = x0 != x1
+    x0, y0, x1, y1 = x0[not_vertical], y0[not_vertical], x1[not_vertical], y1[not_vertical]
 
-            # This means the point pairs observed trace a vertical line
-            if x0 == x1:
-                continue
+    slopes = (y1 - y0) / (x1 - x0)
+    intercepts = y0 - slopes * x0
 
-            poly_fit = np.polyfit((x0, x1), (y0, y1), 1)
-            mx = poly_fit[0]
-            b = poly_fit[1]
+    # np.polyfit gives horizontal segments a slope of +-1e-16 rather than 0, and its sign decides their lane. They are
+    # rare, so they are fitted the same way.
+    horizontal = y0 == y1
+    if horizontal.any():
+        slopes[horizontal], intercepts[horizontal] = polyfit_segments(x0[horizontal], y0[horizontal],
+                                                                      x1[horizontal], y1[horizontal])
 
-            # Left Lane
-            if mx < 0:
-                if x0 < left_lane_boundary and x1 < left_lane_boundary:
-                    left_lane_segments.append((mx, b))
-            # Right Lane
-            else:
-                if x0 > right_lane_boundary and x1 > right_lane_boundary:
-                    right_lane_segments.append((mx, b))
+    # Classify Slopes By Their Direction. Negative Slopes -> Left Lane Lines, Positive Slopes -> Right Lane Lines
+    left = (slopes < 0) & (x0 < left_lane_boundary) & (x1 < left_lane_boundary)
+    right = (slopes >= 0) & (x0 > right_lane_boundary) & (x1 > right_lane_boundary)
 
-    # Determine Average Slope of Left Lane Lines Segments
-    left_lane_avg = np.average(left_lane_segments, axis=0)
-    # Extract and store endpoints of line segments of left lane
-    if len(left_lane_segments) > 0:
-        lanes.append(generate_endpoints(image, left_lane_avg))
-    # Same for Right Lane
-    right_lane_avg = np.average(right_lane_segments, axis=0)
-    if len(right_lane_segments) > 0:
-        lanes.append(generate_endpoints(image, right_lane_avg))
+    h = image.shape[0]
+    left_lane_avg = None
+    if left.any():
+        left_lane_avg = average_lane(h, slopes[left], intercepts[left], x0[left], y0[left], x1[left], y1[left])
+
+    right_lane_avg = None
+    if right.any():
+        right_lane_avg = average_lane(h, slopes[right], intercepts[right], x0[right], y0[right], x1[right], y1[right])
+
+    return left_lane_avg, right_lane_avg
+
+
+def polyfit_segments(x0, y0, x1, y1):
+    """
+    Fits every segment with np.polyfit, like the original per-segment loop
+    :return: Arrays of the slopes and intercepts
+    """
+    fits = np.array([np.polyfit((xa, xb), (ya, yb), 1) for xa, ya, xb, yb in zip(x0, y0, x1, y1)])
+
+    return fits[:, 0], fits[:, 1]
 
-    return lanes
+
+def average_lane(h, slopes, intercepts, x0, y0, x1, y1):
+    """
+    Averages the slopes and intercepts of a lane's segments. They differ from np.polyfit's in the last bits, which
+    only matters when an endpoint lies on a whole pixel and generate_endpoints() could truncate it to the pixel on
+    the other side. Those lanes are refitted with np.polyfit and averaged like the original loop.
+    :param h: Frame height
+    :return: (slope, intercept) average
+    """
+    line = (slopes.mean(), intercepts.mean())
+    for y in (h, int(h * 1 / 2)):
+        x = line_x(y, *line)
+        if math.isfinite(x) and abs(x - round(x)) < _ENDPOINT_TOLERANCE:
+            return tuple(np.average(np.column_stack(polyfit_segments(x0, y0, x1, y1)), axis=0))
+
+    return line
+
+
+def line_x(y, mx, b):
+    """
+    :return: x of the line y = mx * x + b at row y, +-inf for a line with a slope of exactly 0
+    """
+    if mx == 0:
+        return math.copysign(math.inf, y - b)
+
+    return (y - b) / mx
 
 
 def generate_endpoints(image, line):
@@ -147,32 +326,66 @@ def generate_endpoints(image, line):
 
     y0 = h
     y1 = int(y0 * 1 / 2)
-    x0 = max(-w, min(2 * w, int((y0 - b) / mx)))
-    x1 = max(-w, min(2 * w, int((y1 - b) / mx)))
+    x0 = int(max(-w, min(2 * w, line_x(y0, mx, b))))
+    x1 = int(max(-w, min(2 * w, line_x(y1, mx, b))))
 
     return [[x0, y0, x1, y1]]
 
 
-def locate_lanes(image):
+def locate_lane_segments(image, scale=1.0):
     """
-    Method encompassing entire lane detection process
-    :return: Detected road lanes
+    Detects the line segments of the lanes in the region of interest of a frame
     :param image: Video frame retrieved from PiCamera
-    :return: Image with rendered detected road lanes
+    :param scale: Processing scale, e.g. 0.5 runs detection on a frame of half the width and height
+    :return: Line segments in full frame coordinates
     """
-    edges = locate_edges(image)
+    lap = PROFILER.start()
+    if scale != 1.0:
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        lap = PROFILER.lap("downscale", lap)
+
+    roi, y_offset = crop_region_of_interest(image)
+    edges = locate_edges(roi)
+    lap = PROFILER.lap("locate_edges", lap)
     display_image("Image Edges", image)
 
-    isolated_edges = isolate_lane_edges(edges)
+    isolated_edges = isolate_lane_edges(edges, y_offset)
+    lap = PROFILER.lap("isolate_lane_edges", lap)
     display_image("Isolated Edges", isolated_edges)
 
-    lane_line_segments = locate_line_segments(isolated_edges)
-    lane_line_segment_img = show_lane_lines(image, lane_line_segments)
-    display_image("Lane Line Segments", lane_line_segment_img)
+    lane_line_segments = locate_line_segments(isolated_edges, scale)
+    lane_line_segments = scale_line_segments(lane_line_segments, scale)
+    PROFILER.lap("locate_line_segments", lap)
+
+    return lane_line_segments
+
+
+def locate_lanes(image, render=True, scale=1.0):
+    """
+    Method encompassing entire lane detection process
+    :return: Detected road lanes
+    :param image: Video frame retrieved from PiCamera
+    :param render: Boolean value, render the detected lanes. Disable when nothing consumes the rendered image.
+    :param scale: Processing scale of lane detection. Lanes are always returned in full frame coordinates.
+    :return: Image with rendered detected road lanes, None when render is False
+    """
+    lane_line_segments = locate_lane_segments(image, scale)
+    lap = PROFILER.start()
+
+    # The raw segment overlay is a debugging aid, only render it when it will be displayed
+    if DISPLAY_IMAGE:
+        lane_line_segment_img = show_lane_lines(image, lane_line_segments)
+        lap = PROFILER.lap("show_line_segments", lap)
+        display_image("Lane Line Segments", lane_line_segment_img)
 
     driving_lanes = generate_lanes(image, lane_line_segments)
-    driving_lanes_img = show_lane_lines(image, driving_lanes)
-    display_image("Lane Lines", driving_lanes_img)
+    lap = PROFILER.lap("generate_lanes", lap)
+
+    driving_lanes_img = None
+    if render:
+        driving_lanes_img = show_lane_lines(image, driving_lanes)
+        PROFILER.lap("show_lane_lines", lap)
+        display_image("Lane Lines", driving_lanes_img)
 
     return driving_lanes, driving_lanes_img
 
@@ -0,0 +1,267 @@
+"""
+Usage:
+
+# Convert the trained Keras LKAS model to TF Lite:
+python inference_backends.py --convert <PATH_TO_MODEL>.h5 <PATH_TO_MODEL>.tflite
+
+# Compare per-inference latency of both backends on the CPU:
+python inference_backends.py --keras <PATH_TO_MODEL>.h5 --tflite <PATH_TO_MODEL>.tflite --threads 4 --iterations 500
+"""
+
+import os
+import argparse
+import logging
+import numpy as np
+from latency_profiler import LatencyProfiler
+
+EDGETPU_SHARED_LIB = "libedgetpu.so.1"
+
+
+def load_tflite_interpreter(model_path, num_threads=None, use_edgetpu=False):
+    """
+    Loads a TF Lite model with the light-weight tflite_runtime package when it is installed, falling back to the
+    interpreter bundled with TensorFlow.
+    :param model_path: Path to the .tflite model
+    :param num_threads: Number of CPU threads used by the interpreter
+    :param use_edgetpu: Boolean value, run the model on the Edge TPU (the model must be compiled for it)
+    :return: Interpreter with allocated tensors
+    """
+    try:
+        from tflite_runtime.interpreter import Interpreter, load_delegate
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+        load_delegate = tf.lite.experimental.load_delegate
+
+    delegates = [load_delegate(EDGETPU_SHARED_LIB)] if use_edgetpu else None
+    interpreter = Interpreter(model_path=model_path, num_threads=num_threads, experimental_delegates=delegates)
+    interpreter.allocate_tensors()
+
+    return interpreter
+
+
+class KerasBackend(object):
+    """
+    Runs the Keras .h5 model. Loading it imports all of TensorFlow.
+    """
+
+    def __init__(self, model_path):
+        """
+        Constructor
+        :param model_path: Path to the .h5 model
+        """
+        from tensorflow.keras.models import load_model
+
+        logging.info("Loading Keras model %s" % model_path)
+        self.model = load_model(model_path)
+        self.input_shape = tuple(self.model.input_shape[1:])
+        self.input_dtype = np.float32
+        self.input_scale, self.input_zero_point = 0.0, 0
+        self.input = np.zeros((1,) + self.input_shape, np.float32)
+        self.profiler = LatencyProfiler("keras_inference")
+        self.profiler.enable()
+
+    def input_buffer(self):
+        """
+        :return: Preallocated (1, 66, 200, 3) input batch that invoke() runs the model on
+        """
+        return self.input
+
+    def invoke(self):
+        """
+        Runs the model on the input buffer
+        :return: Prediction
+        """
+        return float(self.predict(self.input)[0])
+
+    def predict(self, batch):
+        """
+        Predicts a batch of preprocessed frames
+        :param batch: (N, 66, 200, 3) float32 array
+        :return: (N,) array of predictions
+        """
+        lap = self.profiler.start()
+        predictions = np.asarray(self.model.predict_on_batch(batch)).reshape(len(batch), -1)[:, 0]
+        self.profiler.lap("inference", lap)
+
+        return predictions
+
+    def warm_up(self, iterations=1):
+        """
+        Runs the model on blank input so the first real frame does not pay for graph building
+        """
+        batch = np.zeros((1,) + self.input_shape, np.float32)
+        for _ in range(iterations):
+            self.predict(batch)
+        self.profiler.reset()
+
+
+class TFLiteBackend(object):
+    """
+    Runs a converted .tflite model through the TF Lite interpreter. The input and output tensors are allocated once
+    and every call invokes the interpreter on a fixed (1, 66, 200, 3) input, which avoids the per-call overhead of
+    Keras. Quantized (uint8 and int8) models are supported.
+    """
+
+    def __init__(self, model_path, num_threads=4, use_edgetpu=False):
+        """
+        Constructor
+        :param model_path: Path to the .tflite model
+        :param num_threads: Number of CPU threads used by the interpreter
+        :param use_edgetpu: Boolean value, run the model on the Edge TPU
+        """
+        logging.info("Loading TF Lite model %s (%s threads, Edge TPU: %s)" % (model_path, num_threads, use_edgetpu))
+        self.interpreter = load_tflite_interpreter(model_path, num_threads, use_edgetpu)
+
+        input_details = self.interpreter.get_input_details()[0]
+        output_details = self.interpreter.get_output_details()[0]
+
+        self.input_shape = tuple(input_details["shape"][1:])
+        self.input_dtype = input_details["dtype"]
+        self.input_scale, self.input_zero_point = input_details["quantization"]
+        self.output_index = output_details["index"]
+        self.output_scale, self.output_zero_point = output_details["quantization"]
+
+        # Calling this returns a view of the interpreter's input buffer, so frames are written in place
+        self.input_tensor = self.interpreter.tensor(input_details["index"])
+        self.profiler = LatencyProfiler("tflite_inference")
+        self.profiler.enable()
+
+    def input_buffer(self):
+        """
+        :return: View of the interpreter's (1, 66, 200, 3) input tensor, valid until the next invoke()
+        """
+        return self.input_tensor()
+
+    def set_input(self, frame):
+        """
+        Writes a preprocessed frame into the interpreter's input tensor, quantizing it if the model expects integers
+        :param frame: (66, 200, 3) array with values in [0, 1]
+        """
+        if self.input_scale:
+            # Clip to the range of the input type, int8 models take -128..127
+            limits = np.iinfo(self.input_dtype)
+            frame = np.clip(np.round(frame / self.input_scale + self.input_zero_point), limits.min, limits.max)
+        self.input_tensor()[0] = frame
+
+    def invoke(self):
+        """
+        Runs the model on the current input tensor
+        :return: Prediction
+        """
+        lap = self.profiler.start()
+        self.interpreter.invoke()
+        self.profiler.lap("inference", lap)
+
+        prediction = float(self.interpreter.get_tensor(self.output_index).reshape(-1)[0])
+        if self.output_scale:
+            prediction = (prediction - self.output_zero_point) * self.output_scale
+
+        return prediction
+
+    def predict(self, batch):
+        """
+        Predicts a batch of preprocessed frames one fixed-shape invocation at a time
+        :param batch: (N, 66, 200, 3) float32 array
+        :return: (N,) array of predictions
+        """
+        predictions = np.empty(len(batch), np.float32)
+        for i, frame in enumerate(batch):
+            self.set_input(frame)
+            predictions[i] = self.invoke()
+
+        return predictions
+
+    def warm_up(self, iterations=3):
+        """
+        Runs the interpreter on blank input so kernels and caches are initialized before driving
+        """
+        self.input_tensor()[0] = 0
+        for _ in range(iterations):
+            self.invoke()
+        self.profiler.reset()
+
+
+def create_backend(backend, model_path, tflite_model_path=None, num_threads=4, use_edgetpu=False):
+    """
+    Creates and warms up an inference backend. The Keras model is used when the TF Lite model or interpreter is
+    unavailable.
+    :param backend: "tflite" or "keras"
+    :param model_path: Path to the Keras .h5 model
+    :param tflite_model_path: Path to the .tflite model, defaults to the .h5 path with a .tflite extension
+    :param num_threads: Number of CPU threads used by the TF Lite interpreter
+    :param use_edgetpu: Boolean value, run the TF Lite model on the Edge TPU
+    :return: Inference backend
+    """
+    if backend == "tflite":
+        if tflite_model_path is None:
+            tflite_model_path = os.path.splitext(model_path)[0] + ".tflite"
+
+        try:
+            inference_backend = TFLiteBackend(tflite_model_path, num_threads, use_edgetpu)
+            inference_backend.warm_up()
+            return inference_backend
+        except (ImportError, ValueError, RuntimeError) as e:
+            logging.warning("TF Lite backend unavailable (%s), falling back to Keras" % e)
+    elif backend != "keras":
+        raise ValueError("Unknown inference backend: %s" % backend)
+
+    inference_backend = KerasBackend(model_path)
+    inference_backend.warm_up()
+
+    return inference_backend
+
+
+def convert_to_tflite(model_path, tflite_model_path):
+    """
+    Converts a Keras .h5 model into a float TF Lite model
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    with open(tflite_model_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def benchmark(inference_backend, iterations):
+    """
+    Times single-frame inferences on random input
+    :return: Latency summary of the backend
+    """
+    frame = np.random.rand(1, *inference_backend.input_shape).astype(np.float32)
+    for _ in range(iterations):
+        inference_backend.predict(frame)
+
+    return inference_backend.profiler.summary()["inference"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="DL LKAS inference backends")
+    parser.add_argument("--convert", nargs=2, metavar=("H5", "TFLITE"), help="Convert a Keras model to TF Lite")
+    parser.add_argument("--keras", type=str, default="", help="Keras .h5 model to benchmark")
+    parser.add_argument("--tflite", type=str, default="", help="TF Lite model to benchmark")
+    parser.add_argument("--threads", type=int, default=4, help="TF Lite interpreter threads")
+    parser.add_argument("--edgetpu", action="store_true", help="Run the TF Lite model on the Edge TPU")
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.convert:
+        convert_to_tflite(*args.convert)
+        print("Successfully converted %s to %s" % tuple(args.convert))
+
+    backends = []
+    if args.keras:
+        backends.append(("keras", KerasBackend(args.keras)))
+    if args.tflite:
+        backends.append(("tflite", TFLiteBackend(args.tflite, args.threads, args.edgetpu)))
+
+    for name, inference_backend in backends:
+        inference_backend.warm_up()
+        stats = benchmark(inference_backend, args.iterations)
+        print("%-8s mean %.2f ms, p50 %.2f ms, p95 %.2f ms, p99 %.2f ms" % (
+            name, stats["mean_ms"], stats["p50_ms"], stats["p95_ms"], stats["p99_ms"]))
+
+
+if __name__ == "__main__":
+    main()
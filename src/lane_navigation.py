@@ -11,7 +11,14 @@
 # =================================================================================================================
 
 from image_preprocessing import *
+from lane_tracking import LaneTracker
+from resolution_controller import ResolutionController
 import logging
+import time
+
+# Flags of LaneKeepAssistSystem.events, set by the last drive_within_lanes() call
+EVENT_NO_LANES = 1
+EVENT_STEERING_CLAMPED = 2
 
 
 class LaneKeepAssistSystem(object):
@@ -19,28 +26,72 @@ class LaneKeepAssistSystem(object):
     This following Python class allows herbie to navigate autonomously by using the side lanes on a road
     """
 
-    def __init__(self, car=None):
+    def __init__(self, car=None, headless=False, tracking=False, scale=1.0, frame_budget=None):
         """
         Constructor
         :param car: PiCar object
+        :param headless: Boolean value, skip overlay rendering. Overlays can still be requested with render_overlay()
+        :param tracking: Boolean value, track lanes between frames instead of detecting them from scratch every frame
+        :param scale: Processing scale of lane detection, lanes and steering are always in full frame coordinates
+        :param frame_budget: Lane detection time budget in seconds. When set, a ResolutionController starts at `scale`,
+        lowers the scale while frames exceed it and raises it again when there is room.
         """
         logging.info("Configuring Lane Keep Assist System")
         self.current_steering_angle = 90
+        self.raw_steering_angle = 90  # Steering angle of the last frame with lanes, before stabilize()
+        self.detection_time = 0.0  # Seconds spent detecting lanes in the last frame
+        self.events = 0  # EVENT_* flags of the last frame
         self.car = car
+        self.headless = headless
+        self.lanes = []
+        self.lane_tracker = LaneTracker() if tracking else None
+        self.scale = scale
+        self.resolution_controller = None
+        if frame_budget:
+            scales = tuple(sorted({1.0, 0.5, 0.25, scale}, reverse=True))
+            self.resolution_controller = ResolutionController(frame_budget, scales, initial_scale=scale)
 
     def drive_within_lanes(self, image):
         """
         Detect lanes and move the vehicle accordingly
         :param image: Video frame retrieved from the PiCamera
-        :return:
+        :return: Heading image, or (steering angle, lanes) in headless mode
         """
         display_image("Driving View", image)
 
-        lanes, image = locate_lanes(image)
-        driving_frame = self.steer_vehicle(image, lanes)
+        start = time.perf_counter()
+        if self.lane_tracker is not None:
+            lanes, lanes_image = self.lane_tracker.locate_lanes(image, render=not self.headless, scale=self.scale)
+        else:
+            lanes, lanes_image = locate_lanes(image, render=not self.headless, scale=self.scale)
+        self.lanes = lanes
+        self.detection_time = time.perf_counter() - start
+
+        if self.resolution_controller is not None:
+            self.scale = self.resolution_controller.update(self.detection_time)
+
+        lap = PROFILER.start()
+        driving_frame = self.steer_vehicle(image if self.headless else lanes_image, lanes)
+        PROFILER.lap("steer_vehicle", lap)
+
+        if self.headless:
+            return self.current_steering_angle, lanes
 
         return driving_frame
 
+    def render_overlay(self, image):
+        """
+        Renders the lanes and heading found by the last drive_within_lanes() call. Used by display and recording
+        sinks when running headless.
+        :param image: Video frame passed to drive_within_lanes()
+        :return: Heading image
+        """
+        lanes_image = show_lane_lines(image, self.lanes)
+        if len(self.lanes) == 0:
+            return lanes_image
+
+        return generate_heading(lanes_image, self.current_steering_angle)
+
     def steer_vehicle(self, image, lanes):
         """
         Steers vehicle using Servos
@@ -49,14 +100,19 @@ class LaneKeepAssistSystem(object):
         :return: Heading image
         """
         if len(lanes) == 0:
+            self.events = EVENT_NO_LANES
             return image
 
-        new_steer_angle = self.calculate_steering_angle(image, lanes)
-        self.current_steering_angle = self.stabilize(self.current_steering_angle, new_steer_angle, len(lanes))
+        self.raw_steering_angle = self.calculate_steering_angle(image, lanes)
+        self.current_steering_angle = self.stabilize(self.current_steering_angle, self.raw_steering_angle, len(lanes))
+        self.events = EVENT_STEERING_CLAMPED if self.current_steering_angle != self.raw_steering_angle else 0
 
         if self.car is not None:
             self.car.front_wheels.turn(self.current_steering_angle)
 
+        if self.headless:
+            return image
+
         heading_image = generate_heading(image, self.current_steering_angle)
         display_image("Vehicle Heading", heading_image)
 
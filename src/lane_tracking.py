@@ -0,0 +1,219 @@
+# !/usr/bin/env python
+# title           :lane_tracking.py
+# description     :Incremental lane tracking that only searches near the lanes found in the previous frame
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import logging
+import cv2
+import numpy as np
+from image_preprocessing import PROFILER, LANE_PARAMS, average_lane_segments, generate_endpoints, locate_edges, \
+    locate_lane_segments, locate_line_segments, show_lane_lines, display_image
+
+LEFT = 0
+RIGHT = 1
+
+
+class LaneState(object):
+    """
+    Alpha-beta filter over a lane's x coordinates at the bottom of the frame and half way up, the rows of
+    generate_endpoints()
+    """
+
+    def __init__(self, x, alpha, beta):
+        self.x = np.asarray(x, np.float64)
+        self.v = np.zeros(2, np.float64)
+        self.alpha = alpha
+        self.beta = beta
+        self.misses = 0
+
+    def predict(self):
+        """
+        :return: Predicted (x bottom, x top) for the current frame
+        """
+        return self.x + self.v
+
+    def update(self, measurement, max_jump):
+        """
+        Advances the filter by one frame
+        :param measurement: Measured (x bottom, x top), None when the lane was not found
+        :param max_jump: Largest distance (pixels) from the prediction that is accepted as a measurement
+        :return: True when the measurement was accepted
+        """
+        prediction = self.predict()
+
+        if measurement is not None:
+            residual = np.asarray(measurement, np.float64) - prediction
+            if np.abs(residual).max() <= max_jump:
+                self.x = prediction + self.alpha * residual
+                self.v = self.v + self.beta * residual
+                self.misses = 0
+                return True
+
+        self.x = prediction
+        self.misses += 1
+        return False
+
+
+class LaneTracker(object):
+    """
+    Tracks the left and right lane between frames. Instead of running edge detection and HoughLinesP over the whole
+    region of interest, each frame only searches a narrow band around where the filter predicts each lane to be. Full
+    detection runs when no lane is tracked, when a lane is lost, and periodically while only one lane is tracked.
+    """
+
+    def __init__(self, band_width=20, alpha=0.6, beta=0.2, max_misses=3, max_jump=40, redetect_interval=15):
+        """
+        Constructor
+        :param band_width: Half width (pixels) of the band searched around a predicted lane
+        :param alpha: Filter gain applied to the position residual
+        :param beta: Filter gain applied to the velocity
+        :param max_misses: Consecutive frames a lane may go unseen before it is dropped
+        :param max_jump: Largest accepted distance (pixels) between a measurement and the prediction
+        :param redetect_interval: Frames between full detections while fewer than two lanes are tracked
+        """
+        self.band_width = band_width
+        self.alpha = alpha
+        self.beta = beta
+        self.max_misses = max_misses
+        self.max_jump = max_jump
+        self.redetect_interval = redetect_interval
+
+        self.lanes = [None, None]
+        self.frames = 0
+        self.fallbacks = 0
+        self._frames_since_detection = 0
+        self._lane_lost = False
+
+    def needs_full_detection(self):
+        """
+        :return: True when the next frame has to go through full lane detection
+        """
+        tracked = sum(lane is not None for lane in self.lanes)
+        if tracked == 0 or self._lane_lost:
+            return True
+
+        return tracked < 2 and self._frames_since_detection >= self.redetect_interval
+
+    def locate_lanes(self, image, render=True, scale=1.0):
+        """
+        Tracking counterpart of image_preprocessing.locate_lanes()
+        :param image: Video frame retrieved from PiCamera
+        :param render: Boolean value, render the tracked lanes
+        :param scale: Processing scale of full detection, band searches always run at full resolution
+        :return: Tracked road lanes and the image with rendered lanes (None when render is False)
+        """
+        h, w, _ = image.shape
+        self.frames += 1
+
+        if self.needs_full_detection():
+            self.fallbacks += 1
+            self._frames_since_detection = 0
+            measurements = [self._measure(image, average) for average in
+                            average_lane_segments(image, locate_lane_segments(image, scale))]
+        else:
+            self._frames_since_detection += 1
+            lap = PROFILER.start()
+            measurements = [self._search_band(image, side) if self.lanes[side] is not None else None
+                            for side in (LEFT, RIGHT)]
+            PROFILER.lap("track_lanes", lap)
+
+        self._lane_lost = False
+        for side in (LEFT, RIGHT):
+            if self.lanes[side] is None:
+                if measurements[side] is not None:
+                    self.lanes[side] = LaneState(measurements[side], self.alpha, self.beta)
+                continue
+
+            self.lanes[side].update(measurements[side], self.max_jump)
+            if self.lanes[side].misses > self.max_misses:
+                self.lanes[side] = None
+                self._lane_lost = True
+
+        y0 = h
+        y1 = int(y0 * 1 / 2)
+        lanes = []
+        for lane in self.lanes:
+            if lane is not None:
+                x0, x1 = (max(-w, min(2 * w, int(x))) for x in lane.x)
+                lanes.append([[x0, y0, x1, y1]])
+
+        lanes_image = None
+        if render:
+            lanes_image = show_lane_lines(image, lanes)
+            display_image("Lane Lines", lanes_image)
+
+        return lanes, lanes_image
+
+    def _measure(self, image, line):
+        """
+        :return: (x bottom, x top) of an averaged (slope, intercept) line, None when there is no line
+        """
+        if line is None:
+            return None
+
+        [[x0, _, x1, _]] = generate_endpoints(image, line)
+        return x0, x1
+
+    def _search_band(self, image, side):
+        """
+        Runs edge detection and HoughLinesP in a band around the predicted position of a lane
+        :param image: Video frame retrieved from PiCamera
+        :param side: LEFT or RIGHT
+        :return: Measured (x bottom, x top), None when the lane was not found in the band
+        """
+        h, w, _ = image.shape
+        y_top = int(h * LANE_PARAMS["roi_top"])
+        y_mid = int(h * 1 / 2)
+        x_bottom, x_mid = self.lanes[side].predict()
+        # Extend the predicted lane from the rows it is tracked at to the top of the region of interest
+        x_top = x_bottom + (x_mid - x_bottom) * (h - y_top) / (h - y_mid)
+
+        # Bounding box of the band, starting two rows above the ROI so Canny sees the same gradients
+        left = int(max(0, min(x_bottom, x_top) - self.band_width))
+        right = int(min(w, max(x_bottom, x_top) + self.band_width))
+        top = max(0, y_top - 2)
+        if right - left < 2:
+            return None
+
+        edges = locate_edges(image[top:, left:right])
+
+        mask = np.zeros_like(edges)
+        polygon = np.array([[(x_bottom - self.band_width - left, h - top), (x_bottom + self.band_width - left, h - top),
+                             (x_top + self.band_width - left, y_top - top), (x_top - self.band_width - left, y_top - top)]],
+                           np.int32)
+        cv2.fillPoly(mask, polygon, 255)
+        edges = cv2.bitwise_and(edges, mask)
+
+        segments = locate_line_segments(edges)
+        if segments is None:
+            return None
+
+        segments[:, :, 0::2] += left
+        segments[:, :, 1::2] += top
+
+        return self._measure(image, average_lane_segments(image, segments)[side])
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of tracked frames, full detection fallbacks and the fallback rate
+        """
+        return {
+            "frames": self.frames,
+            "fallbacks": self.fallbacks,
+            "fallback_rate": self.fallbacks / self.frames if self.frames else 0.0,
+        }
+
+    def log_stats(self):
+        """
+        Logs how often full detection was needed
+        """
+        stats = self.stats()
+        logging.info("Lane Tracking: %d frames, %d full detections (%.1f%%)" % (
+            stats["frames"], stats["fallbacks"], stats["fallback_rate"] * 100))
@@ -0,0 +1,158 @@
+# !/usr/bin/env python
+# title           :latency_profiler.py
+# description     :Low-overhead per-stage latency timers with rolling percentiles
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import atexit
+import json
+import logging
+import time
+import numpy as np
+
+
+class LatencyProfiler(object):
+    """
+    Collects per-stage latencies into fixed-size rolling windows. Timing is done with lap timestamps so that
+    instrumenting a pipeline only costs one perf_counter() call and one array write per stage:
+
+        lap = profiler.start()
+        edges = locate_edges(image)
+        lap = profiler.lap('locate_edges', lap)
+
+    When the profiler is disabled start() and lap() return immediately without reading the clock.
+    """
+
+    def __init__(self, name, enabled=False, window=1000):
+        """
+        Constructor
+        :param name: Name used when reporting
+        :param enabled: Boolean value, enables or disables timing
+        :param window: Number of most recent samples kept per stage
+        """
+        self.name = name
+        self.enabled = enabled
+        self.window = window
+        self.samples = {}
+        self.counts = {}
+        self.dump_path = None
+        self._dump_registered = False
+
+    def enable(self, dump_path=None):
+        """
+        Enables timing and dumps the collected statistics when the interpreter exits. The profiler may be enabled
+        several times, the summary is dumped once, to the last path given.
+        :param dump_path: Optional JSON file to write the summary to on exit
+        """
+        self.enabled = True
+        if dump_path is not None:
+            self.dump_path = dump_path
+        if not self._dump_registered:
+            atexit.register(self._dump_at_exit)
+            self._dump_registered = True
+
+    def disable(self):
+        """
+        Disables timing. Already collected samples are kept.
+        """
+        self.enabled = False
+
+    def start(self):
+        """
+        :return: Timestamp to pass to the first lap() call
+        """
+        if not self.enabled:
+            return 0.0
+
+        return time.perf_counter()
+
+    def lap(self, stage, since):
+        """
+        Records the time elapsed since the previous lap as one sample of the given stage
+        :param stage: Stage name
+        :param since: Timestamp returned by start() or the previous lap()
+        :return: Timestamp to pass to the next lap() call
+        """
+        if not self.enabled:
+            return 0.0
+
+        now = time.perf_counter()
+        self.record(stage, now - since)
+
+        return now
+
+    def record(self, stage, seconds):
+        """
+        Adds a latency sample to a stage
+        :param stage: Stage name
+        :param seconds: Measured latency in seconds
+        """
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = np.zeros(self.window, np.float64)
+            self.counts[stage] = 0
+
+        samples[self.counts[stage] % self.window] = seconds
+        self.counts[stage] += 1
+
+    def reset(self):
+        """
+        Discards every collected sample
+        """
+        self.samples = {}
+        self.counts = {}
+
+    def summary(self):
+        """
+        Latency percentiles of every stage over its rolling window
+        :return: Dictionary mapping stage name to count, mean, p50, p95, p99 and max in milliseconds
+        """
+        summary = {}
+        for stage, samples in self.samples.items():
+            count = self.counts[stage]
+            window = samples[:min(count, self.window)] * 1000.0
+            p50, p95, p99 = np.percentile(window, [50, 95, 99])
+            summary[stage] = {
+                'count': count,
+                'mean_ms': float(window.mean()),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'max_ms': float(window.max()),
+            }
+
+        return summary
+
+    def report(self):
+        """
+        :return: Human readable table of the stage latencies
+        """
+        lines = ['%s latency (ms)' % self.name,
+                 '%-24s %8s %8s %8s %8s %8s' % ('stage', 'count', 'p50', 'p95', 'p99', 'max')]
+        for stage, stats in self.summary().items():
+            lines.append('%-24s %8d %8.2f %8.2f %8.2f %8.2f' % (
+                stage, stats['count'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['max_ms']))
+
+        return '\n'.join(lines)
+
+    def _dump_at_exit(self):
+        self.dump(self.dump_path)
+
+    def dump(self, path=None):
+        """
+        Logs the latency table and optionally writes the summary as JSON
+        :param path: Optional JSON output path
+        """
+        if not self.samples:
+            return
+
+        logging.info(self.report())
+        if path is not None:
+            with open(path, 'w') as f:
+                json.dump({self.name: self.summary()}, f, indent=2)
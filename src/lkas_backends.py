@@ -0,0 +1,151 @@
+# !/usr/bin/env python
+# title           :lkas_backends.py
+# description     :Registry of lane keeping backends, imported only when selected
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :python lkas_backends.py --measure dl_tflite (startup time and memory of one backend)
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import sys
+import json
+import time
+import logging
+import argparse
+import importlib
+import threading
+import resource
+
+# Backend name -> (module, class, constructor options). Modules are imported when a backend is created, so
+# TensorFlow is only loaded when a Deep Learning backend is selected.
+BACKENDS = {
+    "opencv": ("lane_navigation", "LaneKeepAssistSystem", {}),
+    "opencv_tracking": ("lane_navigation", "LaneKeepAssistSystem", {"tracking": True}),
+    "dl_tflite": ("dl_lkas", "DeepLearningLKAS", {"backend": "tflite"}),
+    "dl_keras": ("dl_lkas", "DeepLearningLKAS", {"backend": "keras"}),
+}
+
+
+def peak_rss_mb():
+    """
+    :return: Peak resident set size of this process in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+
+def create_lane_follower(name, car=None, **options):
+    """
+    Imports and creates a lane keeping backend
+    :param name: Backend name, see BACKENDS
+    :param car: PiCar object
+    :param options: Constructor options overriding the backend's defaults
+    :return: Lane follower
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown lane keeping backend %s, choose one of: %s" % (name, ", ".join(sorted(BACKENDS))))
+
+    module_name, class_name, defaults = BACKENDS[name]
+    lane_follower_class = getattr(importlib.import_module(module_name), class_name)
+
+    kwargs = dict(defaults)
+    kwargs.update(options)
+
+    return lane_follower_class(car, **kwargs)
+
+
+class BackgroundLoader(object):
+    """
+    Imports and creates a lane keeping backend on a separate thread, so model loading and warm-up overlap with
+    hardware calibration
+    """
+
+    def __init__(self, name, car=None, **options):
+        """
+        Starts loading a backend
+        :param name: Backend name, see BACKENDS
+        :param car: PiCar object, only used once the car drives
+        :param options: Constructor options overriding the backend's defaults
+        """
+        self.name = name
+        self.load_seconds = None
+        self.wait_seconds = None
+
+        self._lane_follower = None
+        self._error = None
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._load, args=(name, car, options), name="BackendLoader",
+                                        daemon=True)
+        self._thread.start()
+
+    def _load(self, name, car, options):
+        try:
+            self._lane_follower = create_lane_follower(name, car, **options)
+        except Exception as e:
+            self._error = e
+        self.load_seconds = time.perf_counter() - self._start
+
+    def result(self):
+        """
+        Waits for the backend to finish loading
+        :return: Lane follower
+        """
+        start = time.perf_counter()
+        self._thread.join()
+        self.wait_seconds = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+
+        return self._lane_follower
+
+
+def measure_startup(name, width=320, height=240, **options):
+    """
+    Measures the cold start of a backend in the current process: import, model load and warm-up, and the first
+    steering decision on a blank frame. Only meaningful in a fresh process.
+    :param name: Backend name, see BACKENDS
+    :param options: Constructor options overriding the backend's defaults
+    :return: Dictionary with load and first-steer times in seconds and the peak RSS in MB
+    """
+    import numpy as np
+
+    baseline_rss = peak_rss_mb()
+    start = time.perf_counter()
+    lane_follower = create_lane_follower(name, headless=True, **options)
+    loaded = time.perf_counter()
+    lane_follower.drive_within_lanes(np.zeros((height, width, 3), np.uint8))
+    steered = time.perf_counter()
+
+    return {
+        "backend": name,
+        "load_seconds": loaded - start,
+        "first_steer_seconds": steered - loaded,
+        "time_to_first_steer_seconds": steered - start,
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lane keeping backends")
+    parser.add_argument("--list", action="store_true", help="List the backends")
+    parser.add_argument("--measure", type=str, default="", help="Print the cold start of a backend as JSON")
+    parser.add_argument("--model", type=str, default="", help="Keras .h5 model of the Deep Learning backends")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, (module_name, class_name, defaults) in sorted(BACKENDS.items()):
+            print("%-16s %s.%s %s" % (name, module_name, class_name, defaults or ""))
+    if args.measure:
+        logging.disable(logging.CRITICAL)
+        options = {"ml_model_path": args.model} if args.model and BACKENDS[args.measure][0] == "dl_lkas" else {}
+        print(json.dumps(measure_startup(args.measure, **options)))
+
+
+if __name__ == "__main__":
+    main()
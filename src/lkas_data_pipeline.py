@@ -0,0 +1,190 @@
+# !/usr/bin/env python
+# title           :lkas_data_pipeline.py
+# description     :Parallel, prefetching training input pipeline for the Deep Learning LKAS
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Replaces ImageTransformer and generate_images() of DeepLearningLKAS.ipynb
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import os
+import fnmatch
+from collections import deque
+from multiprocessing import Pool
+import cv2
+import numpy as np
+from frame_preprocessor import FramePreprocessor
+
+_INPUT_SHAPE = (66, 200, 3)
+
+# Set in every worker process by _init_worker()
+_paths = None
+_angles = None
+_preprocessor = None
+
+
+def list_training_images(directory):
+    """
+    Lists the .png frames written by gen_training_data.py, whose file names end with the 3-digit steering angle
+    :param directory: Directory holding the frames
+    :return: List of image paths and list of steering angles
+    """
+    paths = []
+    angles = []
+    for image in sorted(os.listdir(directory)):
+        if fnmatch.fnmatch(image, "*.png"):
+            paths.append(os.path.join(directory, image))
+            # Index -7 to -4 (non inclusive) correspond to label, with -1 to -4 corresponding to ".png"
+            angles.append(int(image[-7:-4]))
+
+    return paths, angles
+
+
+class Augmenter(object):
+    """
+    OpenCV version of the notebook's ImageTransformer.randomly_augment_img(): pan (+-10% in x and y), zoom (1-1.3),
+    box blur (kernel 1-5) and brightness (x0.7-1.3) are each applied with probability 0.5, then the image is flipped
+    with probability 0.5, which mirrors the steering angle to 180 - angle. Pan and zoom are applied as a single affine
+    warp. All randomness comes from the RandomState passed in, so augmentation is reproducible.
+    """
+
+    def __init__(self, random_state):
+        self.random_state = random_state
+
+    def augment(self, img, steering_angle):
+        """
+        :param img: uint8 image
+        :param steering_angle: Steering angle label of the image
+        :return: Augmented image and its steering angle
+        """
+        rng = self.random_state
+        h, w, _ = img.shape
+
+        # Pan then zoom about the image center, like the imgaug Affine augmenters (linear, black borders)
+        transform = np.eye(3)
+        if rng.rand() < 0.5:
+            tx, ty = rng.uniform(-0.1, 0.1, 2)
+            transform = np.array([[1, 0, tx * w], [0, 1, ty * h], [0, 0, 1]]).dot(transform)
+        if rng.rand() < 0.5:
+            scale = rng.uniform(1, 1.3)
+            cx, cy = (w - 1) / 2.0, (h - 1) / 2.0
+            transform = np.array([[scale, 0, cx - scale * cx], [0, scale, cy - scale * cy], [0, 0, 1]]).dot(transform)
+        if not np.array_equal(transform, np.eye(3)):
+            img = cv2.warpAffine(img, transform[:2], (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+        if rng.rand() < 0.5:
+            kernel = rng.randint(1, 6)
+            img = cv2.blur(img, (kernel, kernel))
+        if rng.rand() < 0.5:
+            img = cv2.convertScaleAbs(img, alpha=rng.uniform(0.7, 1.3))
+
+        if rng.randint(0, 2) == 1:
+            img = cv2.flip(img, 1)
+            # Difference is opposite angle
+            steering_angle = 180 - steering_angle
+
+        return img, steering_angle
+
+
+def _init_worker(paths, angles):
+    global _paths, _angles, _preprocessor
+    _paths = paths
+    _angles = angles
+    _preprocessor = FramePreprocessor()
+
+
+def build_batch(batch_index, batch_size, augment, seed):
+    """
+    Reads, augments and preprocesses one batch. Batch contents only depend on (seed, batch_index), not on which
+    process builds it.
+    :param batch_index: Position of the batch in the stream
+    :param batch_size: Number of images
+    :param augment: Boolean value, apply random augmentation
+    :param seed: Seed of the stream
+    :return: float32 images (batch_size, 66, 200, 3) and float32 steering angles (batch_size,)
+    """
+    rng = np.random.RandomState([seed, batch_index])
+    augmenter = Augmenter(rng)
+
+    images = np.empty((batch_size,) + _INPUT_SHAPE, np.float32)
+    labels = np.empty(batch_size, np.float32)
+    # Sampled with replacement, like generate_images()
+    for i, index in enumerate(rng.randint(0, len(_paths), batch_size)):
+        img = cv2.imread(_paths[index])
+        steering_angle = _angles[index]
+        if augment:
+            img, steering_angle = augmenter.augment(img, steering_angle)
+
+        _preprocessor.process(img, out=images[i])
+        labels[i] = steering_angle
+
+    return images, labels
+
+
+class BatchPipeline(object):
+    """
+    Endless stream of (images, steering angles) batches for model.fit(), a drop-in replacement for the notebook's
+    generate_images(). Batches are built by a process pool and up to `prefetch` batches are in flight while the
+    model trains on the current one. Images go through the same preprocessing as the car (FramePreprocessor), so
+    frames are read as BGR and converted with BGR2YUV, which equals the notebook's RGB read followed by RGB2YUV.
+    """
+
+    def __init__(self, paths, angles, batch_size=100, augment=True, seed=0, workers=4, prefetch=8):
+        """
+        Constructor
+        :param paths: Image paths
+        :param angles: Steering angle of each image
+        :param batch_size: Images per batch
+        :param augment: Boolean value, apply random augmentation
+        :param seed: Seed of the stream, equal seeds produce equal batches
+        :param workers: Number of worker processes, batches are built in this process when 0
+        :param prefetch: Number of batches built ahead of the consumer
+        """
+        self.batch_size = batch_size
+        self.augment = augment
+        self.seed = seed
+        self.prefetch = max(1, prefetch)
+
+        self._next_batch = 0
+        self._pending = deque()
+        self._pool = None
+        if workers > 0:
+            self._pool = Pool(workers, initializer=_init_worker, initargs=(list(paths), list(angles)))
+        else:
+            _init_worker(list(paths), list(angles))
+
+    def _batch_args(self):
+        args = (self._next_batch, self.batch_size, self.augment, self.seed)
+        self._next_batch += 1
+        return args
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._pool is None:
+            return build_batch(*self._batch_args())
+
+        while len(self._pending) < self.prefetch:
+            self._pending.append(self._pool.apply_async(build_batch, self._batch_args()))
+
+        return self._pending.popleft().get()
+
+    def close(self):
+        """
+        Stops the worker processes
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, _type, value, traceback):
+        self.close()
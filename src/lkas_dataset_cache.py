@@ -0,0 +1,262 @@
+"""
+Usage:
+
+# Preprocess the labelled .png frames of gen_training_data.py once into a memory-mapped cache:
+python lkas_dataset_cache.py ../data/lkas_cache --images ../data/training_images
+
+# Add the frames of gen_training_data.py shards (only sources that are not cached yet are processed):
+python lkas_dataset_cache.py ../data/lkas_cache --images ../data/training_images --shards ../data/shards
+
+# Load the cache in training or evaluation code:
+from lkas_dataset_cache import LKASDatasetCache
+cache = LKASDatasetCache("../data/lkas_cache")
+images, labels = cache.batch(np.arange(100))
+"""
+
+import os
+import json
+import argparse
+import cv2
+import numpy as np
+from frame_preprocessor import FramePreprocessor
+from lkas_data_pipeline import list_training_images
+
+CACHE_VERSION = 2
+FRAME_SHAPE = (66, 200, 3)
+FRAME_BYTES = int(np.prod(FRAME_SHAPE))
+
+
+def create_preprocessor():
+    """
+    :return: FramePreprocessor producing the cached frames. Pixels are kept as uint8, the /255 normalization is done
+    when a batch is loaded.
+    """
+    return FramePreprocessor((FRAME_SHAPE[1], FRAME_SHAPE[0]), np.uint8, scale=1 / 255)
+
+
+def preprocessing_key(preprocessor=None):
+    """
+    Everything that changes the cached pixels, taken from the preprocessor itself. A cache built with another key is
+    rebuilt from scratch.
+    """
+    if preprocessor is None:
+        preprocessor = create_preprocessor()
+
+    return {"version": CACHE_VERSION, "preprocessor": preprocessor.parameters(), "normalize": "divide_by_255_on_load"}
+
+
+def cache_paths(cache_dir):
+    """
+    :return: Paths of the frame array, label array and manifest of a cache
+    """
+    return (os.path.join(cache_dir, "frames.u8"), os.path.join(cache_dir, "labels.npy"),
+            os.path.join(cache_dir, "manifest.json"))
+
+
+def read_manifest(cache_dir):
+    """
+    :return: Manifest of a cache, None when the cache does not exist
+    """
+    _, _, manifest_path = cache_paths(cache_dir)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def source_key(path):
+    """
+    :return: (mtime, size) of a source file, a changed key means the source has to be processed again
+    """
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def list_sources(image_dirs=(), shard_dirs=()):
+    """
+    Lists the sources of a cache. A .png frame is one source, so is every gen_training_data.py shard.
+    :return: Dictionary mapping source path to its (mtime, size) key
+    """
+    sources = {}
+    for image_dir in image_dirs:
+        for path in list_training_images(image_dir)[0]:
+            sources[path] = source_key(path)
+    for shard_dir in shard_dirs:
+        for labels_path in sorted(os.listdir(shard_dir)):
+            if labels_path.endswith(".labels.npz"):
+                path = os.path.join(shard_dir, labels_path)
+                sources[path] = source_key(path)
+
+    return sources
+
+
+def read_source(path):
+    """
+    :return: Frames and steering angles of a source
+    """
+    if path.endswith(".labels.npz"):
+        with np.load(path) as labels:
+            angles = labels["steering_angles"].tolist()
+        if not angles:
+            return [], []
+        frames = np.load(path[:-len(".labels.npz")] + ".frames.npy", mmap_mode="r")
+        return frames[:len(angles)], angles
+
+    # Index -7 to -4 (non inclusive) correspond to label, with -1 to -4 corresponding to ".png"
+    return [cv2.imread(path)], [int(path[-7:-4])]
+
+
+def build_cache(cache_dir, image_dirs=(), shard_dirs=(), rebuild=False):
+    """
+    Preprocesses the frames of new sources and appends them to the cache. The cache is rebuilt from scratch when the
+    preprocessing parameters changed, or when a cached source was modified or removed.
+    :param cache_dir: Cache directory
+    :param image_dirs: Directories holding labelled .png frames
+    :param shard_dirs: Directories holding gen_training_data.py shards
+    :param rebuild: Boolean value, rebuild the whole cache
+    :return: Number of frames added
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    frames_path, labels_path, manifest_path = cache_paths(cache_dir)
+    sources = list_sources(image_dirs, shard_dirs)
+    preprocessor = create_preprocessor()
+    preprocessing = preprocessing_key(preprocessor)
+
+    manifest = read_manifest(cache_dir)
+    if manifest is not None and not rebuild:
+        if manifest["preprocessing"] != preprocessing:
+            print("Preprocessing parameters changed, rebuilding %s" % cache_dir)
+            rebuild = True
+        elif any(sources.get(path) != entry["key"] for path, entry in manifest["sources"].items()):
+            print("Cached sources were modified or removed, rebuilding %s" % cache_dir)
+            rebuild = True
+
+    rebuild = rebuild or manifest is None
+    if rebuild:
+        manifest = {"preprocessing": preprocessing, "count": 0, "sources": {}}
+        labels = np.zeros(0, np.int16)
+    else:
+        labels = np.load(labels_path)[:manifest["count"]]
+
+    count = manifest["count"]
+    new_sources = [path for path in sorted(sources) if path not in manifest["sources"]]
+    if not new_sources and not rebuild:
+        return 0
+
+    # A rebuild writes a new frame file next to the current cache, which stays usable until the files are swapped.
+    # New frames are otherwise appended, frames past the manifest's count were appended by an interrupted build.
+    write_path = frames_path + ".tmp" if rebuild else frames_path
+    with open(write_path, "wb" if rebuild else "ab") as f:
+        f.truncate(count * FRAME_BYTES)
+
+    new_labels = []
+    with open(write_path, "ab") as f:
+        for path in new_sources:
+            frames, angles = read_source(path)
+            for frame in frames:
+                f.write(preprocessor.process(frame).tobytes())
+            new_labels.extend(angles)
+            manifest["sources"][path] = {"key": sources[path], "start": count, "count": len(frames)}
+            count += len(frames)
+
+    labels = np.concatenate([labels, np.asarray(new_labels, np.int16)])
+    manifest["count"] = count
+
+    with open(labels_path + ".tmp", "wb") as f:
+        np.save(f, labels)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1)
+
+    # Files are replaced frames, labels, manifest. An interrupted build leaves the previous cache intact, except
+    # during a rebuild's swap, where the old manifest is removed first so a half-swapped cache reads as missing.
+    if rebuild:
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        os.replace(write_path, frames_path)
+    os.replace(labels_path + ".tmp", labels_path)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    return len(new_labels)
+
+
+class LKASDatasetCache(object):
+    """
+    Read-only view of a preprocessed dataset cache. Frames are memory-mapped, so slicing them does not copy or load
+    the whole dataset into RAM.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Constructor
+        :param cache_dir: Directory written by build_cache()
+        """
+        self.manifest = read_manifest(cache_dir)
+        if self.manifest is None:
+            raise IOError("No dataset cache in %s" % cache_dir)
+        if self.manifest["preprocessing"] != preprocessing_key():
+            raise ValueError("%s was built with other preprocessing parameters, rebuild it" % cache_dir)
+
+        frames_path, labels_path, _ = cache_paths(cache_dir)
+        count = self.manifest["count"]
+        self.frames = np.memmap(frames_path, np.uint8, "r", shape=(count,) + FRAME_SHAPE) if count else \
+            np.zeros((0,) + FRAME_SHAPE, np.uint8)
+        self.labels = np.load(labels_path, mmap_mode="r")[:count]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def batch(self, indices, out=None):
+        """
+        Loads frames as model input
+        :param indices: Frame indices, a slice keeps the read sequential
+        :param out: Optional float32 array of shape (len(indices), 66, 200, 3) to write the batch to
+        :return: float32 images normalized to [0, 1] and float32 steering angles
+        """
+        frames = self.frames[indices]
+        if out is None:
+            out = np.empty(frames.shape, np.float32)
+
+        np.divide(frames, np.float32(255), out=out)
+        return out, np.asarray(self.labels[indices], np.float32)
+
+    def iter_batches(self, batch_size=100, seed=None):
+        """
+        Endless stream of batches for model.fit(), shuffled every epoch when a seed is given. Frames that do not fill a
+        whole batch at the end of an epoch are left out of it.
+        """
+        if len(self) < batch_size:
+            raise ValueError("The cache holds %d frames, fewer than a batch of %d" % (len(self), batch_size))
+
+        return self._iter_batches(batch_size, seed)
+
+    def _iter_batches(self, batch_size, seed):
+        rng = np.random.RandomState(seed) if seed is not None else None
+        while True:
+            if rng is None:
+                for start in range(0, len(self) - batch_size + 1, batch_size):
+                    yield self.batch(slice(start, start + batch_size))
+                continue
+
+            order = rng.permutation(len(self))
+            for start in range(0, len(order) - batch_size + 1, batch_size):
+                # Sorted indices read the memory map front to back
+                yield self.batch(np.sort(order[start:start + batch_size]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the preprocessed DL LKAS dataset cache")
+    parser.add_argument("cache_dir", help="Directory of the cache")
+    parser.add_argument("--images", nargs="*", default=[], help="Directories holding labelled .png frames")
+    parser.add_argument("--shards", nargs="*", default=[], help="Directories holding gen_training_data.py shards")
+    parser.add_argument("--rebuild", action="store_true", help="Rebuild the whole cache")
+    args = parser.parse_args()
+
+    added = build_cache(args.cache_dir, args.images, args.shards, args.rebuild)
+    manifest = read_manifest(args.cache_dir)
+    print("Added %d frames, %d frames from %d sources cached in %s" % (
+        added, manifest["count"], len(manifest["sources"]), args.cache_dir))
+
+
+if __name__ == "__main__":
+    main()
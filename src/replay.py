@@ -0,0 +1,213 @@
+"""
+Usage:
+
+# Replay recorded drives through the lane pipeline and report throughput, latency percentiles and steering traces:
+python replay.py ../data/tmp/car_video*.avi
+
+# Store the steering traces as golden references:
+python replay.py ../data/tmp/car_video*.avi --golden ../data/golden --update-golden
+
+# Compare against the golden references (exits with status 1 on a regression):
+python replay.py ../data/tmp/car_video*.avi --golden ../data/golden --tolerance 0
+
+# Check how much steering changes when lanes are detected at half resolution:
+python replay.py ../data/tmp/car_video*.avi --golden ../data/golden --tolerance 2 --scale 0.5
+"""
+
+import os
+import sys
+import time
+import argparse
+from collections import namedtuple
+import cv2
+import numpy as np
+from image_preprocessing import PROFILER, load_lane_parameters
+from lane_navigation import LaneKeepAssistSystem
+
+ReplayResult = namedtuple("ReplayResult", ["path", "steering_angles", "lanes_detected", "latencies"])
+
+# Frames load_frames() keeps in memory by default, one minute at 20 FPS. A 320x240 frame takes 230 KB.
+MAX_LOADED_FRAMES = 1200
+
+
+def iter_frames(path, max_frames=None):
+    """
+    Decodes a recording one frame at a time. replay_frames() only times the lane pipeline, so decoding is not part of
+    the measured latencies.
+    :param path: Video recorded by Herbie
+    :param max_frames: Optional limit on the number of decoded frames
+    :return: Generator of frames
+    """
+    video_stream = cv2.VideoCapture(path)
+    try:
+        decoded = 0
+        while video_stream.isOpened() and (max_frames is None or decoded < max_frames):
+            grabbed, frame = video_stream.read()
+            if not grabbed:
+                break
+            decoded += 1
+            yield frame
+    finally:
+        video_stream.release()
+
+
+def load_frames(path, max_frames=MAX_LOADED_FRAMES):
+    """
+    Decodes a recording into memory, for callers that replay the same frames many times (autotune.py)
+    :param path: Video recorded by Herbie
+    :param max_frames: Limit on the number of decoded frames, None loads the whole recording
+    :return: List of frames
+    """
+    return list(iter_frames(path, max_frames))
+
+
+def replay_frames(frames, lane_follower=None, path=""):
+    """
+    Runs the lane pipeline over frames as fast as possible
+    :param frames: Iterable of video frames
+    :param lane_follower: Lane follower to replay through, a headless LaneKeepAssistSystem by default
+    :param path: Recording the frames belong to
+    :return: ReplayResult with one steering angle, lane count and latency per frame
+    """
+    if lane_follower is None:
+        lane_follower = LaneKeepAssistSystem(headless=True)
+
+    steering_angles = []
+    lanes_detected = []
+    latencies = []
+
+    for frame in frames:
+        start = time.perf_counter()
+        lane_follower.drive_within_lanes(frame)
+        latencies.append(time.perf_counter() - start)
+
+        steering_angles.append(lane_follower.current_steering_angle)
+        lanes_detected.append(len(lane_follower.lanes))
+
+    return ReplayResult(path,
+                        np.array(steering_angles, np.int16),
+                        np.array(lanes_detected, np.uint8),
+                        np.array(latencies, np.float64))
+
+
+def golden_trace_path(golden_dir, path):
+    """
+    :return: Path of the golden steering trace belonging to a recording
+    """
+    return os.path.join(golden_dir, os.path.splitext(os.path.basename(path))[0] + ".steering.npy")
+
+
+def compare_trace(steering_angles, golden, tolerance=0):
+    """
+    Compares a steering trace against a golden trace
+    :param steering_angles: Steering angles produced by the replay
+    :param golden: Golden steering angles
+    :param tolerance: Largest steering difference (degrees) that is not counted as a mismatch
+    :return: Dictionary with the number of compared frames, mismatching frames and the largest difference
+    """
+    frames = min(len(steering_angles), len(golden))
+    errors = np.abs(steering_angles[:frames].astype(np.int32) - golden[:frames].astype(np.int32))
+
+    return {
+        "frames": frames,
+        "length_mismatch": len(steering_angles) != len(golden),
+        "mismatches": int(np.count_nonzero(errors > tolerance)),
+        "max_error": int(errors.max(initial=0)),
+    }
+
+
+def latency_percentiles(latencies):
+    """
+    :return: p50, p95 and p99 of the latencies in milliseconds
+    """
+    if len(latencies) == 0:
+        return 0.0, 0.0, 0.0
+
+    return tuple(np.percentile(latencies * 1000.0, [50, 95, 99]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded drives through the Lane Keep Assist System")
+    parser.add_argument("videos", nargs="+", help="Recordings written by Herbie")
+    parser.add_argument("--max-frames", type=int, default=None, help="Only replay the first N frames of each video")
+    parser.add_argument("--golden", type=str, default="", help="Directory holding golden steering traces")
+    parser.add_argument("--update-golden", action="store_true", help="Overwrite the golden traces with this run")
+    parser.add_argument("--tolerance", type=int, default=0, help="Allowed steering difference in degrees")
+    parser.add_argument("--trace-dir", type=str, default="", help="Directory to write per-frame CSV traces to")
+    parser.add_argument("--profile", action="store_true", help="Report per-stage lane pipeline latencies")
+    parser.add_argument("--tracking", action="store_true", help="Track lanes between frames")
+    parser.add_argument("--scale", type=float, default=1.0, help="Processing scale of lane detection")
+    parser.add_argument("--lane-params", type=str, default="", help="Lane detection config written by autotune.py")
+    args = parser.parse_args()
+
+    if args.lane_params:
+        load_lane_parameters(args.lane_params)
+
+    if args.profile:
+        PROFILER.enable()
+
+    regressions = 0
+    all_latencies = []
+    total_frames = 0
+    total_seconds = 0.0
+
+    print("%-40s %7s %9s %8s %8s %8s %10s" % ("video", "frames", "fps", "p50 ms", "p95 ms", "p99 ms", "golden"))
+    for path in args.videos:
+        lane_follower = LaneKeepAssistSystem(headless=True, tracking=args.tracking, scale=args.scale)
+        result = replay_frames(iter_frames(path, args.max_frames), lane_follower, path)
+        frames = len(result.steering_angles)
+        if args.tracking:
+            stats = lane_follower.lane_tracker.stats()
+            print("%s: %d full detections in %d frames (%.1f%%)" % (
+                os.path.basename(path), stats["fallbacks"], stats["frames"], stats["fallback_rate"] * 100))
+
+        seconds = result.latencies.sum()
+        total_frames += frames
+        total_seconds += seconds
+        all_latencies.append(result.latencies)
+
+        golden_status = "-"
+        if args.golden:
+            golden_path = golden_trace_path(args.golden, path)
+            if args.update_golden:
+                os.makedirs(args.golden, exist_ok=True)
+                np.save(golden_path, result.steering_angles)
+                golden_status = "updated"
+            elif os.path.exists(golden_path):
+                comparison = compare_trace(result.steering_angles, np.load(golden_path), args.tolerance)
+                if comparison["mismatches"] or comparison["length_mismatch"]:
+                    regressions += 1
+                    golden_status = "FAIL %d/%d" % (comparison["mismatches"], comparison["frames"])
+                else:
+                    golden_status = "ok"
+            else:
+                golden_status = "missing"
+
+        if args.trace_dir:
+            os.makedirs(args.trace_dir, exist_ok=True)
+            trace_path = os.path.join(args.trace_dir, os.path.splitext(os.path.basename(path))[0] + ".csv")
+            trace = np.stack([np.arange(frames), result.steering_angles, result.lanes_detected,
+                              result.latencies * 1000.0], axis=1)
+            np.savetxt(trace_path, trace, delimiter=",", fmt=["%d", "%d", "%d", "%.3f"],
+                       header="frame,steering_angle,lanes_detected,latency_ms", comments="")
+
+        p50, p95, p99 = latency_percentiles(result.latencies)
+        fps = frames / seconds if seconds > 0 else 0.0
+        print("%-40s %7d %9.1f %8.2f %8.2f %8.2f %10s" % (
+            os.path.basename(path)[-40:], frames, fps, p50, p95, p99, golden_status))
+
+    if all_latencies:
+        p50, p95, p99 = latency_percentiles(np.concatenate(all_latencies))
+        fps = total_frames / total_seconds if total_seconds > 0 else 0.0
+        print("%-40s %7d %9.1f %8.2f %8.2f %8.2f" % ("total", total_frames, fps, p50, p95, p99))
+
+    if args.profile:
+        print(PROFILER.report())
+
+    if regressions:
+        print("Steering regressions in %d recording(s)" % regressions)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# !/usr/bin/env python
+# title           :resolution_controller.py
+# description     :Switches the lane pipeline's processing scale to keep frame time within budget
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import logging
+
+
+class ResolutionController(object):
+    """
+    Picks the processing scale of lane detection from the measured frame time. When the moving average exceeds the
+    budget for several consecutive frames (e.g. the CPU is thermally throttled), detection moves to the next smaller
+    scale. It moves back up only when the cost at the larger scale, estimated as the current cost times the ratio of
+    pixel counts, fits well within the budget for a longer run of frames. The two thresholds and run lengths keep the
+    controller from oscillating between scales.
+    """
+
+    def __init__(self, budget, scales=(1.0, 0.5, 0.25), smoothing=0.2, downscale_after=5, upscale_after=50,
+                 headroom=0.7, initial_scale=None):
+        """
+        Constructor
+        :param budget: Frame time budget of lane detection in seconds
+        :param scales: Processing scales from largest to smallest
+        :param smoothing: Weight of the newest frame time in the moving average
+        :param downscale_after: Consecutive frames over budget before switching to a smaller scale
+        :param upscale_after: Consecutive frames with room to spare before switching to a larger scale
+        :param headroom: Fraction of the budget the estimated cost at the larger scale has to fit in
+        :param initial_scale: Scale of the first frame, one of `scales`. The largest scale by default.
+        """
+        self.budget = budget
+        self.scales = tuple(scales)
+        self.smoothing = smoothing
+        self.downscale_after = downscale_after
+        self.upscale_after = upscale_after
+        self.headroom = headroom
+
+        if initial_scale is not None and initial_scale not in self.scales:
+            raise ValueError("Initial scale %s is not one of the scales %s" % (initial_scale, self.scales))
+        self.level = self.scales.index(initial_scale) if initial_scale is not None else 0
+        self.frame_time = None
+        self.switches = 0
+        self.frames_per_scale = {scale: 0 for scale in self.scales}
+        self._over_budget = 0
+        self._under_budget = 0
+
+    @property
+    def scale(self):
+        """
+        :return: Processing scale for the next frame
+        """
+        return self.scales[self.level]
+
+    def update(self, frame_time):
+        """
+        Records the time lane detection took on the last frame
+        :param frame_time: Seconds spent on the frame
+        :return: Processing scale for the next frame
+        """
+        self.frames_per_scale[self.scale] += 1
+        if self.frame_time is None:
+            self.frame_time = frame_time
+        else:
+            self.frame_time = self.frame_time * (1 - self.smoothing) + frame_time * self.smoothing
+
+        self._over_budget = self._over_budget + 1 if self.frame_time > self.budget else 0
+
+        if self.level > 0:
+            larger = self.scales[self.level - 1]
+            estimate = self.frame_time * (larger / self.scale) ** 2
+            self._under_budget = self._under_budget + 1 if estimate < self.budget * self.headroom else 0
+        else:
+            self._under_budget = 0
+
+        if self._over_budget >= self.downscale_after and self.level < len(self.scales) - 1:
+            self._switch(self.level + 1)
+        elif self._under_budget >= self.upscale_after:
+            self._switch(self.level - 1)
+
+        return self.scale
+
+    def _switch(self, level):
+        previous = self.scale
+        logging.info("Lane detection scale %.2f -> %.2f (frame time %.1f ms, budget %.1f ms)" % (
+            previous, self.scales[level], self.frame_time * 1000, self.budget * 1000))
+
+        self.level = level
+        self.switches += 1
+        self._over_budget = 0
+        self._under_budget = 0
+        # The average was measured at the previous scale, rescale it to the cost expected at the new one
+        self.frame_time *= (self.scale / previous) ** 2
+
+    def stats(self):
+        """
+        :return: Dictionary with the current scale, number of switches and frames processed at every scale
+        """
+        return {
+            "scale": self.scale,
+            "switches": self.switches,
+            "frames_per_scale": dict(self.frames_per_scale),
+        }
+
+    def log_stats(self):
+        """
+        Logs the current scale and how many frames were processed at every scale
+        """
+        stats = self.stats()
+        logging.info("Lane Detection Scale: %.2f, Switches: %d, Frames per Scale: %s" % (
+            stats["scale"], stats["switches"], stats["frames_per_scale"]))
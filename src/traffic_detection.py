@@ -0,0 +1,222 @@
+# !/usr/bin/env python
+# title           :traffic_detection.py
+# description     :Traffic object detection running alongside the LKAS at its own cadence
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Runs the quantized SSD MobileNet exported by DeepLearningTrafficObjectDetection.ipynb
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import re
+import logging
+import threading
+import time
+from collections import namedtuple
+import cv2
+import numpy as np
+from inference_backends import load_tflite_interpreter
+from latency_profiler import LatencyProfiler
+
+# box is (x0, y0, x1, y1) in pixels of the frame the detection ran on
+Detection = namedtuple("Detection", ["label", "score", "box"])
+# timestamp is when detection finished, frame_timestamp when the frame was captured (time.perf_counter())
+Detections = namedtuple("Detections", ["timestamp", "frame_timestamp", "objects"])
+
+
+def load_label_map(path):
+    """
+    Reads the class names from a label_map.pbtxt generated by xml_to_csv.py
+    :param path: Path to label_map.pbtxt
+    :return: Dictionary mapping class id to class name
+    """
+    with open(path) as f:
+        content = f.read()
+
+    items = re.findall(r"id:\s*(\d+)\s*name:\s*['\"]([^'\"]+)['\"]", content)
+    return {int(class_id): name for class_id, name in items}
+
+
+class TrafficObjectDetector(object):
+    """
+    Runs the SSD MobileNet TF Lite model on its own thread at a lower rate than lane keeping, so detection never
+    blocks steering. The drive loop offers every frame with submit(), but a frame is only copied when the detector is
+    ready for its next run. The most recent result is published with timestamps and can be read with latest().
+    """
+
+    def __init__(self, model_path, label_map_path=None, rate_hz=5.0, min_score=0.5, num_threads=2, use_edgetpu=False):
+        """
+        Constructor
+        :param model_path: Path to the detection .tflite model (exported with the TFLite_Detection_PostProcess op)
+        :param label_map_path: Path to label_map.pbtxt, class ids are reported when omitted
+        :param rate_hz: Detections per second
+        :param min_score: Minimum score of a reported detection
+        :param num_threads: Number of CPU threads used by the interpreter
+        :param use_edgetpu: Boolean value, run the model on the Edge TPU
+        """
+        logging.info("Configuring Traffic Object Detector")
+        self.interpreter = load_tflite_interpreter(model_path, num_threads, use_edgetpu)
+        self.labels = load_label_map(label_map_path) if label_map_path else {}
+        self.period = 1.0 / rate_hz
+        self.min_score = min_score
+
+        input_details = self.interpreter.get_input_details()[0]
+        _, height, width, _ = input_details["shape"]
+        self.input_size = (int(width), int(height))
+        self.input_is_float = input_details["dtype"] == np.float32
+        self.input_tensor = self.interpreter.tensor(input_details["index"])
+        self.resized = np.empty((height, width, 3), np.uint8)
+        # Boxes, classes, scores and number of detections of the post-processing op
+        self.output_indices = [details["index"] for details in self.interpreter.get_output_details()]
+
+        self.frame = None
+        self.frame_timestamp = 0.0
+        self.detections_run = 0
+        self.profiler = LatencyProfiler("traffic_detection")
+        self.profiler.enable()
+
+        self._latest = Detections(0.0, 0.0, [])
+        self._wants_frame = False
+        self._new_frame = threading.Event()
+        self._running = False
+        self._thread = None
+        self._start_time = None
+
+    def start(self):
+        """
+        Starts the detection thread
+        """
+        self._running = True
+        self._start_time = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="TrafficObjectDetector", daemon=True)
+        self._thread.start()
+
+        return self
+
+    def submit(self, frame, frame_timestamp):
+        """
+        Offers a frame to the detector. Cheap when the detector is busy or waiting for its next run.
+        :param frame: Video frame retrieved from the PiCamera
+        :param frame_timestamp: time.perf_counter() timestamp of the frame capture
+        """
+        if not self._wants_frame:
+            return
+
+        if self.frame is None or self.frame.shape != frame.shape:
+            self.frame = np.empty_like(frame)
+        np.copyto(self.frame, frame)
+        self.frame_timestamp = frame_timestamp
+
+        self._wants_frame = False
+        self._new_frame.set()
+
+    def latest(self):
+        """
+        :return: Detections of the most recent detection run
+        """
+        return self._latest
+
+    def _run(self):
+        """
+        Detection thread: request a frame every period and run the model on it
+        """
+        next_run = time.perf_counter()
+        while self._running:
+            delay = next_run - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_run = max(next_run + self.period, time.perf_counter())
+
+            self._new_frame.clear()
+            self._wants_frame = True
+            if not self._new_frame.wait(timeout=1.0) or not self._running:
+                continue
+
+            objects = self.detect(self.frame)
+            self._latest = Detections(time.perf_counter(), self.frame_timestamp, objects)
+
+    def detect(self, frame):
+        """
+        Runs the model on a frame
+        :param frame: BGR video frame
+        :return: List of Detection with a score of at least min_score
+        """
+        lap = self.profiler.start()
+        h, w, _ = frame.shape
+
+        cv2.resize(frame, self.input_size, dst=self.resized)
+        if self.input_is_float:
+            # The float model was exported with mean 128 and standard deviation 128
+            self.input_tensor()[0] = (cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB) - 128.0) / 128.0
+        else:
+            cv2.cvtColor(self.resized, cv2.COLOR_BGR2RGB, dst=self.input_tensor()[0])
+
+        self.interpreter.invoke()
+
+        boxes, classes, scores, count = (self.interpreter.get_tensor(index) for index in self.output_indices)
+        objects = []
+        for i in range(int(count[0])):
+            if scores[0][i] < self.min_score:
+                continue
+
+            y0, x0, y1, x1 = boxes[0][i]
+            # Class 0 of the model is the first entry (id 1) of the label map
+            class_id = int(classes[0][i]) + 1
+            objects.append(Detection(self.labels.get(class_id, str(class_id)), float(scores[0][i]),
+                                     (int(x0 * w), int(y0 * h), int(x1 * w), int(y1 * h))))
+
+        self.profiler.lap("detect", lap)
+        self.detections_run += 1
+
+        return objects
+
+    def annotate(self, frame, detections=None, color=(255, 0, 0)):
+        """
+        Renders detections on a copy of a frame
+        :param frame: Video frame
+        :param detections: Detections to render, the latest ones by default
+        :param color: Color of the boxes
+        :return: Annotated frame
+        """
+        if detections is None:
+            detections = self._latest
+
+        annotated = frame.copy()
+        for detection in detections.objects:
+            x0, y0, x1, y1 = detection.box
+            cv2.rectangle(annotated, (x0, y0), (x1, y1), color, 2)
+            cv2.putText(annotated, "%s %.2f" % (detection.label, detection.score), (x0, max(y0 - 4, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
+
+        return annotated
+
+    def stats(self):
+        """
+        :return: Dictionary with the number of detection runs, detection FPS and the detection latency summary
+        """
+        elapsed = time.perf_counter() - self._start_time if self._start_time is not None else 0.0
+
+        return {
+            "detections_run": self.detections_run,
+            "detection_fps": self.detections_run / elapsed if elapsed > 0 else 0.0,
+            "latency": self.profiler.summary().get("detect", {}),
+        }
+
+    def log_stats(self):
+        """
+        Logs detection FPS and latency
+        """
+        stats = self.stats()
+        logging.info("Traffic Detection FPS: %.1f, Latency p50/p95: %.1f/%.1f ms" % (
+            stats["detection_fps"], stats["latency"].get("p50_ms", 0.0), stats["latency"].get("p95_ms", 0.0)))
+
+    def stop(self):
+        """
+        Stops the detection thread
+        """
+        self._running = False
+        self._new_frame.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
@@ -0,0 +1,128 @@
+# !/usr/bin/env python
+# title           :video_recorder.py
+# description     :Asynchronous, back-pressured video recorder that encodes frames on a worker thread
+# author          :Sebastian Maldonado
+# date            :10/18/2026
+# version         :0.0
+# usage           :SEE README.md
+# notes           :Enter Notes Here
+# python_version  :3.6.8
+# conda_version   :4.8.3
+# =================================================================================================================
+
+import logging
+import queue
+import threading
+import cv2
+
+# Drop policies applied when the encoder falls behind
+DROP_OLDEST = 'drop_oldest'  # Discard the oldest queued frame to make room for the newest one
+KEEP_NTH = 'keep_nth'        # Only keep every Nth frame while the queue is backed up
+BLOCK = 'block'              # Wait for room in the queue (offline use only, stalls the caller)
+
+_STOP = None
+
+
+class VideoRecorder(object):
+    """
+    Records video without stalling the control loop. Frames are copied into a bounded queue and encoded by a
+    worker thread (OpenCV releases the GIL while encoding). When the encoder falls behind, the configured drop
+    policy decides which frames are discarded.
+    """
+
+    def __init__(self, path, fourcc, fps, frame_size, queue_size=32, policy=DROP_OLDEST, keep_every=2):
+        """
+        Constructor
+        :param path: Output video path
+        :param fourcc: FourCC codec code, e.g. cv2.VideoWriter_fourcc(*'XVID')
+        :param fps: Frame rate of the output video
+        :param frame_size: (width, height) of the recorded frames
+        :param queue_size: Maximum number of frames waiting to be encoded
+        :param policy: One of DROP_OLDEST, KEEP_NTH or BLOCK
+        :param keep_every: N used by the KEEP_NTH policy
+        """
+        if policy not in (DROP_OLDEST, KEEP_NTH, BLOCK):
+            raise ValueError('Unknown drop policy: %s' % policy)
+
+        self.path = path
+        self.policy = policy
+        self.keep_every = max(1, keep_every)
+        self.writer = cv2.VideoWriter(path, fourcc, fps, frame_size)
+
+        self.frames_enqueued = 0
+        self.frames_encoded = 0
+        self.frames_dropped = 0
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._submitted = 0
+        self._thread = threading.Thread(target=self._encode, name='VideoRecorder', daemon=True)
+        self._thread.start()
+
+    def write(self, frame):
+        """
+        Queues a frame for encoding. Never blocks unless the BLOCK policy is selected.
+        :param frame: Video frame, copied before it is queued so the caller may reuse its buffer
+        """
+        self._submitted += 1
+
+        if self.policy == BLOCK:
+            self._queue.put(frame.copy())
+            self.frames_enqueued += 1
+            return
+
+        # Thin out the stream while the encoder is backed up
+        if self.policy == KEEP_NTH and self._queue.qsize() >= self._queue.maxsize // 2:
+            if self._submitted % self.keep_every != 0:
+                self.frames_dropped += 1
+                return
+
+        frame = frame.copy()
+        while True:
+            try:
+                self._queue.put_nowait(frame)
+                self.frames_enqueued += 1
+                return
+            except queue.Full:
+                if self.policy == KEEP_NTH:
+                    self.frames_dropped += 1
+                    return
+
+            # DROP_OLDEST: make room by discarding the oldest queued frame
+            try:
+                self._queue.get_nowait()
+                self.frames_dropped += 1
+            except queue.Empty:
+                pass
+
+    def _encode(self):
+        """
+        Worker thread: encode queued frames until release() is called
+        """
+        while True:
+            frame = self._queue.get()
+            if frame is _STOP:
+                break
+
+            self.writer.write(frame)
+            self.frames_encoded += 1
+
+    def stats(self):
+        """
+        :return: Dictionary with the enqueued, encoded and dropped frame counters
+        """
+        return {
+            'frames_enqueued': self.frames_enqueued,
+            'frames_encoded': self.frames_encoded,
+            'frames_dropped': self.frames_dropped,
+        }
+
+    def release(self):
+        """
+        Flushes the remaining queued frames, stops the worker thread and closes the video file
+        """
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.writer.release()
+
+        logging.info('Recorder %s: %d frames enqueued, %d encoded, %d dropped' % (
+            self.path, self.frames_enqueued, self.frames_encoded, self.frames_dropped))
@@ -6,44 +6,115 @@ python xml_to_csv.py -i [PATH_TO_IMAGES_FOLDER]/train -o [PATH_TO_ANNOTATIONS_FO
 # Create test data:
 python xml_to_csv.py -i [PATH_TO_IMAGES_FOLDER]/test -o [PATH_TO_ANNOTATIONS_FOLDER]/test_labels.csv
 
+# Parse on 4 processes and only re-parse new or changed files on the next run:
+python xml_to_csv.py -i [PATH_TO_IMAGES_FOLDER]/train -o [PATH_TO_ANNOTATIONS_FOLDER]/train_labels.csv -j 4 --cache [PATH_TO_ANNOTATIONS_FOLDER]/train_labels.cache
+
 """
 
 import os
 import glob
+import pickle
 import pandas as pd
 import argparse
 import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+# Bump when the rows produced by parse_annotation change, so stale caches are discarded
+CACHE_VERSION = 1
+
+
+def parse_annotation(xml_file):
+    """Parses a single .xml file generated by labelImg.
+    Parameters:
+    ----------
+    xml_file : {str}
+        Path of the .xml file
+    Returns
+    -------
+    list
+        One (filename, width, height, class, xmin, ymin, xmax, ymax) tuple per object
+    """
+    root = ET.parse(xml_file).getroot()
+    filename = root.find("filename").text
+    size = root.find("size")
+    width = int(size[0].text)
+    height = int(size[1].text)
 
+    rows = []
+    for member in root.findall("object"):
+        bndbox = member[4]
+        rows.append((
+            filename,
+            width,
+            height,
+            member[0].text,
+            int(bndbox[0].text),
+            int(bndbox[1].text),
+            int(bndbox[2].text),
+            int(bndbox[3].text),
+        ))
+    return rows
 
-def xml_to_csv(path):
+
+def load_cache(cache_path):
+    """Loads the parsed annotations cached by a previous run, an empty cache when missing or outdated."""
+    if not cache_path or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "rb") as f:
+            version, entries = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+        return {}
+    return entries if version == CACHE_VERSION else {}
+
+
+def save_cache(cache_path, entries):
+    """Atomically writes the parsed annotations, keyed by path, along with each file's mtime and size."""
+    tmp_path = cache_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((CACHE_VERSION, entries), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, cache_path)
+
+
+def xml_to_csv(path, workers=1, cache_path=None):
     """Iterates through all .xml files (generated by labelImg) in a given directory and combines them in a single Pandas datagrame.
     Parameters:
     ----------
     path : {str}
         The path containing the .xml files
+    workers : {int}
+        Number of processes parsing the .xml files
+    cache_path : {str}
+        Optional cache of parsed files, only files whose path, mtime or size changed are parsed again
     Returns
     -------
     Pandas DataFrame
         The produced dataframe
     """
-    classes_names = []
-    xml_list = []
-    for xml_file in glob.glob(path + "/*.xml"):
-        tree = ET.parse(xml_file)
-        root = tree.getroot()
-        for member in root.findall("object"):
-            classes_names.append(member[0].text)
-            value = (
-                root.find("filename").text,
-                int(root.find("size")[0].text),
-                int(root.find("size")[1].text),
-                member[0].text,
-                int(member[4][0].text),
-                int(member[4][1].text),
-                int(member[4][2].text),
-                int(member[4][3].text),
-            )
-            xml_list.append(value)
+    xml_files = glob.glob(path + "/*.xml")
+    cache = load_cache(cache_path)
+
+    keys = {}
+    for xml_file in xml_files:
+        stat = os.stat(xml_file)
+        keys[xml_file] = (stat.st_mtime_ns, stat.st_size)
+    stale = [xml_file for xml_file in xml_files
+             if xml_file not in cache or cache[xml_file][0] != keys[xml_file]]
+
+    if workers > 1 and len(stale) > 1:
+        with Pool(workers) as pool:
+            parsed = pool.map(parse_annotation, stale, chunksize=max(1, len(stale) // (workers * 4)))
+    else:
+        parsed = [parse_annotation(xml_file) for xml_file in stale]
+
+    entries = {xml_file: cache[xml_file] for xml_file in xml_files if xml_file in cache}
+    entries.update((xml_file, (keys[xml_file], rows)) for xml_file, rows in zip(stale, parsed))
+    if cache_path and (stale or len(entries) != len(cache)):
+        save_cache(cache_path, entries)
+
+    # Same row order as parsing the files one by one in glob order
+    xml_list = [row for xml_file in xml_files for row in entries[xml_file][1]]
+    classes_names = [row[3] for row in xml_list]
     column_name = [
         "filename",
         "width",
@@ -75,6 +146,15 @@ def main():
                         help="Name of output .csv file (including path)",
                         type=str)
 
+    parser.add_argument("-j",
+                        "--workers",
+                        help="Number of processes parsing the .xml files",
+                        type=int,
+                        default=1)
+    parser.add_argument("--cache",
+                        help="Cache of parsed .xml files, only new or changed files are parsed again",
+                        type=str,
+                        default="")
     parser.add_argument(
         "-l",
         "--labelMapDir",
@@ -92,7 +172,7 @@ def main():
 
     assert os.path.isdir(args.inputDir)
     os.makedirs(os.path.dirname(args.outputFile), exist_ok=True)
-    xml_df, classes_names = xml_to_csv(args.inputDir)
+    xml_df, classes_names = xml_to_csv(args.inputDir, args.workers, args.cache or None)
     xml_df.to_csv(args.outputFile, index=None)
     print("Successfully converted xml to csv.")
     if args.labelMapDir: